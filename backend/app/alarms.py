@@ -3,9 +3,15 @@ from datetime import datetime
 
 from apscheduler.schedulers.background import BackgroundScheduler
 
+from . import invoice_pdf, invoicing, models
 from .database import SessionLocal
-from .crud import list_pending_maintenances
-from .notifications import notify_upcoming_maintenance
+from .crud import (
+    list_pending_maintenances,
+    list_pending_rule_occurrences,
+    mark_overdue_invoices,
+    purge_expired_refresh_tokens,
+)
+from .notifications import notify_invoices_overdue, notify_upcoming_maintenance
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,8 +41,94 @@ def check_maintenances():
                     logger.info(f"Notified maintenance {m.id} (in {days_remaining} days)")
                 except Exception as e:
                     logger.error(f"Error sending maintenance notification: {e}")
+
+        # Ocorrências de regras recorrentes: expandidas para a semana, não estão gravadas
+        occurrences = list_pending_rule_occurrences(db)
+        logger.info(f"Found {len(occurrences)} pending recurring maintenance occurrences")
+        for o in occurrences:
+            try:
+                notify_upcoming_maintenance(
+                    db,
+                    machine_name=o["machine_name"],
+                    maintenance_type=o["type"],
+                    scheduled_date=o["scheduled_date"].strftime("%d/%m/%Y"),
+                    days_remaining=o["days_delta"],
+                    company_id=o["company_id"],
+                    company_name=o["company_name"]
+                )
+                logger.info(f"Notified rule {o['rule_id']} occurrence on {o['scheduled_date']}")
+            except Exception as e:
+                logger.error(f"Error sending maintenance notification: {e}")
+    finally:
+        db.close()
+
+def purge_refresh_tokens():
+    """
+    Deletes expired refresh tokens (every rotation adds a row).
+    """
+    db = SessionLocal()
+    try:
+        deleted = purge_expired_refresh_tokens(db)
+        logger.info(f"Purged {deleted} expired refresh tokens")
+    except Exception as e:
+        logger.error(f"Error purging refresh tokens: {e}")
+    finally:
+        db.close()
+
+def sweep_overdue_invoices():
+    """
+    Marks sent invoices past their due date as overdue (one UPDATE) and
+    sends one notification per company.
+    """
+    db = SessionLocal()
+    try:
+        overdue = mark_overdue_invoices(db)
+        logger.info(f"Marked {sum(count for count, _ in overdue.values())} invoices as overdue")
+        try:
+            notify_invoices_overdue(db, overdue)
+        except Exception as e:
+            logger.error(f"Error sending overdue invoice notification: {e}")
+    except Exception as e:
+        logger.error(f"Error sweeping overdue invoices: {e}")
+    finally:
+        db.close()
+
+def generate_monthly_invoices():
+    """
+    Generates (or resumes) the current month's recurring invoices in batches.
+    """
+    db = SessionLocal()
+    try:
+        run = invoicing.get_or_create_run(db, datetime.now().date())
+        if run.status != models.BillingRunStatus.completed:
+            invoicing.execute_run(db, run.id)
+    except Exception as e:
+        logger.error(f"Error generating monthly invoices: {e}")
+    finally:
+        db.close()
+
+def resume_billing_runs():
+    """
+    Resumes billing runs left running by a crashed process.
+    """
+    db = SessionLocal()
+    try:
+        run_ids = invoicing.stale_run_ids(db)
     finally:
         db.close()
+    for run_id in run_ids:
+        logger.info(f"Resuming stale billing run {run_id}")
+        invoicing.execute_run_in_background(run_id)
+
+def purge_invoice_pdf_cache():
+    """
+    Deletes cached invoice PDFs that were not downloaded for a while.
+    """
+    try:
+        removed = invoice_pdf.purge_cache()
+        logger.info(f"Purged {removed} cached invoice PDFs")
+    except Exception as e:
+        logger.error(f"Error purging invoice PDF cache: {e}")
 
 def start_scheduler():
     """
@@ -57,5 +149,42 @@ def start_scheduler():
         hours=1,
         id="hourly_maintenance_check"
     )
+    scheduler.add_job(
+        purge_refresh_tokens,
+        "cron",
+        hour=3,
+        minute=0,
+        id="daily_refresh_token_purge"
+    )
+    scheduler.add_job(
+        sweep_overdue_invoices,
+        "cron",
+        hour=0,
+        minute=5,
+        id="daily_overdue_invoice_sweep",
+        # Também no arranque, para apanhar os dias em que o servidor esteve parado
+        next_run_time=datetime.now()
+    )
+    scheduler.add_job(
+        generate_monthly_invoices,
+        "cron",
+        day=1,
+        hour=2,
+        minute=0,
+        id="monthly_invoice_generation"
+    )
+    scheduler.add_job(
+        resume_billing_runs,
+        "interval",
+        minutes=10,
+        id="billing_run_resume"
+    )
+    scheduler.add_job(
+        purge_invoice_pdf_cache,
+        "cron",
+        hour=3,
+        minute=30,
+        id="daily_invoice_pdf_cache_purge"
+    )
     scheduler.start()
     logger.info("Maintenance scheduler started!")
@@ -0,0 +1,98 @@
+"""Authenticated principal and its short-lived in-process cache.
+
+`dependencies.get_current_user` used to load the full `User` row on every
+request. It now returns a `Principal`, an immutable snapshot of the user's
+columns (without the password hash), and keeps it per user id for
+`PRINCIPAL_CACHE_TTL` seconds, so most requests authenticate with no
+database query at all.
+
+`crud.update_user` and `crud.delete_user` invalidate the entry of the user
+they change. Other workers pick up the change when their entry expires,
+which is why the TTL is kept short.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from . import models
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by routes and access checks."""
+
+    id: int
+    username: str
+    email: Optional[str]
+    full_name: Optional[str]
+    role: models.UserRoleEnum
+    company_id: Optional[int]
+    is_active: bool
+    phone_number: Optional[str]
+    notifications_enabled: Optional[bool]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            company_id=user.company_id,
+            is_active=bool(user.is_active),
+            phone_number=user.phone_number,
+            notifications_enabled=user.notifications_enabled,
+        )
+
+
+class PrincipalCache:
+    """TTL cache of principals keyed by user id."""
+
+    def __init__(self, ttl: int = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[float, Principal]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, principal: Principal) -> None:
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Limpeza simples: descartar primeiro as entradas expiradas
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,301 @@
+"""Tenant-aware response cache for read-mostly routes.
+
+Entries are keyed by (route path + query, tenant, role, data version) and tagged with
+(resource, company): crud writes call :func:`invalidate` with the resource
+and company they touched, which drops that company's entries and the
+unscoped (admin, ``GLOBAL_VERSION_SCOPE``) ones. Entries hold the rendered
+JSON bytes, so a hit skips both the query and the serialization.
+
+Backends:
+
+* :class:`LocalCacheBackend` (default): per-process LRU bounded by
+  ``CACHE_MAX_ENTRIES``, with a TTL per entry.
+* :class:`SharedCacheBackend`: for several workers. It only needs a
+  key-value store with ``get``, ``set(key, value, ex=ttl)`` and ``incr``
+  (a ``redis.Redis`` client fits). Tags are invalidated by bumping a
+  generation counter that is part of every key, so no key scans are needed.
+  :class:`InMemoryKeyValueStore` is the local stand-in used when no store is
+  configured.
+
+Select with ``CACHE_BACKEND=local|shared``; ``CACHE_TTL`` (seconds) and
+``CACHE_MAX_ENTRIES`` tune both.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from . import models, singleflight
+from .serialization import ORJSONResponse
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+
+Tag = Tuple[str, int]
+
+
+class CacheStats:
+    """Thread-safe hit/miss/eviction counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def incr(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# ──────────────────────────────
+# In-process backend
+# ──────────────────────────────
+class LocalCacheBackend:
+    """LRU + TTL cache with a tag index, for a single worker process."""
+
+    name = "local"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: int = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # key -> (expires_at, body, tags)
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Tuple[Tag, ...]]]" = OrderedDict()
+        self._by_tag: Dict[Tag, Set[str]] = {}
+        # Bumped on invalidation; detects writes that race with a miss
+        self._generations: Dict[Tag, int] = {}
+
+    def _token(self, tags: Iterable[Tag]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _drop(self, key: str) -> None:
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def get(self, key: str, tags: Iterable[Tag]) -> Tuple[Optional[bytes], Any]:
+        """Return ``(body, token)``; pass the token back to :meth:`set` on a miss."""
+        tags = tuple(tags)
+        with self._lock:
+            token = self._token(tags)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.stats.incr("misses")
+                return None, token
+            self._entries.move_to_end(key)
+        self.stats.incr("hits")
+        return entry[1], token
+
+    def set(self, key: str, tags: Iterable[Tag], body: bytes, token: Any) -> None:
+        tags = tuple(tags)
+        with self._lock:
+            if self._token(tags) != token:
+                # Invalidado enquanto a resposta era calculada: não guardar dados antigos
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, body, tags)
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats.incr("evictions")
+
+    def invalidate(self, tags: Iterable[Tag]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._by_tag.get(tag, ())):
+                    self._drop(key)
+                    self.stats.incr("invalidations")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ──────────────────────────────
+# Shared backend (multi-worker)
+# ──────────────────────────────
+class InMemoryKeyValueStore:
+    """
+    Local stand-in for a shared key-value store (same subset of the
+    redis-py API). Only useful for development and single-process runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Optional[float], Any]] = {}
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value: Any, ex: Optional[int] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            _, value = self._data.get(key, (None, 0))
+            value = int(value) + 1
+            self._data[key] = (None, value)
+            return value
+
+
+class SharedCacheBackend:
+    """
+    Cache stored in a shared key-value store. Each tag has a generation
+    counter; the generations of an entry's tags are hashed into its storage
+    key, so bumping a generation makes all entries with that tag unreachable
+    (they then expire through the store's TTL). LRU eviction is left to the store.
+    """
+
+    name = "shared"
+    prefix = "fleet:cache:"
+
+    def __init__(self, store: Any = None, ttl: int = CACHE_TTL):
+        self.store = store if store is not None else InMemoryKeyValueStore()
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def _generation_key(self, tag: Tag) -> str:
+        return f"{self.prefix}gen:{tag[0]}:{tag[1]}"
+
+    def _storage_key(self, key: str, tags: Iterable[Tag]) -> str:
+        generations = ",".join(
+            f"{tag[0]}:{tag[1]}={int(self.store.get(self._generation_key(tag)) or 0)}"
+            for tag in sorted(tags)
+        )
+        digest = hashlib.sha1(f"{key}|{generations}".encode("utf-8")).hexdigest()
+        return f"{self.prefix}entry:{digest}"
+
+    def get(self, key: str, tags: Iterable[Tag]) -> Tuple[Optional[bytes], Any]:
+        """Return ``(body, token)``; the token is the storage key for :meth:`set`."""
+        storage_key = self._storage_key(key, tags)
+        body = self.store.get(storage_key)
+        self.stats.incr("hits" if body is not None else "misses")
+        return body, storage_key
+
+    def set(self, key: str, tags: Iterable[Tag], body: bytes, token: Any) -> None:
+        # Uma invalidação concorrente já mudou a geração: esta chave fica inacessível
+        self.store.set(token, body, ex=self.ttl)
+
+    def invalidate(self, tags: Iterable[Tag]) -> None:
+        for tag in tags:
+            self.store.incr(self._generation_key(tag))
+            self.stats.incr("invalidations")
+
+    def clear(self) -> None:
+        # Os contadores de geração não têm TTL: basta mudar o prefixo
+        self.prefix = f"fleet:cache:{time.time_ns()}:"
+
+
+def _build_backend():
+    if os.getenv("CACHE_BACKEND", "local").lower() == "shared":
+        return SharedCacheBackend()
+    return LocalCacheBackend()
+
+
+backend = _build_backend()
+
+
+def configure_backend(new_backend) -> None:
+    """Swap the cache backend, e.g. ``SharedCacheBackend(redis.Redis(...))``."""
+    global backend
+    backend = new_backend
+
+
+def invalidate(resource: str, *company_ids: Optional[int]) -> None:
+    """
+    Drop cached responses of *resource* for each company in *company_ids*
+    and the unscoped (admin) ones. Called by crud after writes.
+    """
+    scopes = {models.GLOBAL_VERSION_SCOPE, *(cid for cid in company_ids if cid is not None)}
+    backend.invalidate([(resource, scope) for scope in scopes])
+
+
+def stats() -> Dict[str, Any]:
+    """Counters and hit ratio of the active backend."""
+    data = backend.stats.snapshot()
+    data["backend"] = backend.name
+    if isinstance(backend, LocalCacheBackend):
+        data["entries"] = len(backend)
+        data["max_entries"] = backend.max_entries
+    return data
+
+
+# ──────────────────────────────
+# Route helper
+# ──────────────────────────────
+@dataclass
+class CachedRoute:
+    """Cache key and tags for one request (see `dependencies.response_cache`)."""
+
+    key: str
+    tags: Tuple[Tag, ...]
+
+    def respond(self, adapter: TypeAdapter, produce: Callable[[], Any]) -> Response:
+        """
+        Return the cached body, or call *produce* and cache its result.
+
+        *produce* may return ORM objects (serialized with *adapter*, i.e. the
+        route's response model) or an already rendered Response. Concurrent
+        misses on the same key share a single *produce* call, but only with
+        requests that saw the same tag generations: a request arriving after
+        an invalidation never joins a query that started before it.
+        """
+        body, token = backend.get(self.key, self.tags)
+        if body is None:
+            body = singleflight.group.do(f"{self.key}|{token}", lambda: self._fill(adapter, produce, token))
+        return Response(content=body, media_type=ORJSONResponse.media_type)
+
+    def _fill(self, adapter: TypeAdapter, produce: Callable[[], Any], token: Any) -> bytes:
+        # Só o líder guarda, com o token lido antes da sua consulta
+        body = singleflight.render(adapter, produce())
+        backend.set(self.key, self.tags, body, token)
+        return body
@@ -2,15 +2,30 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
-from typing import List, Optional
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Union
 import logging
+import uuid
 
-from sqlalchemy import func, and_
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from sqlalchemy import Integer, cast, delete, func, and_, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, Session, joinedload
+from sqlalchemy.sql import Select
 
-from . import models, schemas
-from .security import generate_hash
+from . import cache as response_cache, models, recurrence, schemas
+from .auth import principal_cache
+from .dialects import add_days, week_start
+from .querying import ListQuery
+from .search import local_index as search_index
+from .security import REFRESH_TOKEN_EXPIRE_DAYS, generate_hash, hash_refresh_token, new_refresh_token
+
+logger = logging.getLogger(__name__)
+
+# A rotated refresh token presented again within this window is treated as a
+# client retry (e.g. a lost response) rather than as theft
+REFRESH_REUSE_GRACE_SECONDS = 10
 
 
 # ──────────────────────────────
@@ -26,6 +41,98 @@ def _commit_refresh(db: Session, instance) -> None:
         raise
 
 
+def _instance(db: Session, model, instance_or_id):
+    """
+    Return *instance_or_id* if it is an already loaded *model* instance
+    (e.g. handed over by an access dependency), otherwise load it by id.
+    """
+    if isinstance(instance_or_id, model):
+        return instance_or_id
+    return db.query(model).filter(model.id == instance_or_id).first()
+
+
+# ──────────────────────────────
+# TENANT DATA VERSIONS (ETags)
+# ──────────────────────────────
+def get_tenant_version(db: Session, company_id: int) -> int:
+    """Current data version of *company_id* (GLOBAL_VERSION_SCOPE = data shared by all tenants)."""
+    version = (
+        db.query(models.TenantVersion.version)
+        .filter(models.TenantVersion.company_id == company_id)
+        .scalar()
+    )
+    return version or 0
+
+
+def get_combined_version(db: Session) -> int:
+    """
+    Version of all tenants' data together (unscoped admin reads): the sum of
+    every row, which grows whenever any of them is bumped.
+    """
+    return db.query(func.coalesce(func.sum(models.TenantVersion.version), 0)).scalar()
+
+
+def bump_tenant_version(db: Session, *company_ids: Optional[int]) -> None:
+    """
+    Increment the data version of each company, or of the global scope (data
+    shared by all tenants, e.g. services) when no company is given.
+
+    Runs inside the caller's transaction, so the new version becomes visible
+    together with the write that caused it. Writes to different companies
+    lock different rows; admins' ETags add them up (`get_combined_version`).
+    """
+    table = models.TenantVersion.__table__
+    # Ordem fixa para evitar deadlocks entre escritas concorrentes
+    scopes = sorted({cid for cid in company_ids if cid is not None}) or [models.GLOBAL_VERSION_SCOPE]
+
+    if db.get_bind().dialect.name == "postgresql":
+        statement = pg_insert(table).values(
+            [{"company_id": scope, "version": 1, "updated_at": func.now()} for scope in scopes]
+        )
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.company_id],
+            set_={"version": table.c.version + 1, "updated_at": func.now()},
+        ))
+        return
+
+    for scope in scopes:
+        result = db.execute(
+            update(table)
+            .where(table.c.company_id == scope)
+            .values(version=table.c.version + 1, updated_at=func.now())
+        )
+        if not result.rowcount:
+            db.execute(insert(table).values(company_id=scope, version=1, updated_at=func.now()))
+
+
+def record_bulk_write(db: Session, resource: str, company_ids) -> None:
+    """
+    Side effects of a bulk write to *resource* (imports, bulk updates), done
+    once for all touched companies instead of once per row.
+    """
+    company_ids = set(company_ids)
+    if not company_ids:
+        return
+    bump_tenant_version(db, *company_ids)
+    db.commit()
+    invalidate_bulk_write(resource, company_ids)
+
+
+def invalidate_bulk_write(resource: str, company_ids) -> None:
+    """
+    In-process side effects of a committed bulk write: response cache and,
+    for machines, the search index. For callers that commit in several
+    transactions (imports), each bumping the versions it touched.
+    """
+    response_cache.invalidate(resource, *company_ids)
+    if resource == "machines":
+        search_index.invalidate()
+
+
+def _machine_company_id(db: Session, machine_id: int) -> Optional[int]:
+    return db.query(models.Machine.company_id).filter(models.Machine.id == machine_id).scalar()
+
+
 # ──────────────────────────────
 # USER CRUD
 # ──────────────────────────────
@@ -37,8 +144,13 @@ def get_user_by_id(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 
-def get_users(db: Session, *, skip: int = 0, limit: int = 100) -> List[models.User]:
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(
+    db: Session, *, skip: int = 0, limit: int = 100, list_query: Optional[ListQuery] = None
+) -> List[models.User]:
+    query = db.query(models.User)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.offset(skip).limit(limit).all()
 
 
 def get_users_by_company(db: Session, company_id: int) -> List[models.User]:
@@ -80,19 +192,153 @@ def update_user(
     for key, val in update_data.items():
         setattr(db_user, key, val)
 
+    if "hashed_password" in update_data or update_data.get("is_active") is False:
+        # Nova password ou conta desativada: terminar as sessões existentes
+        revoke_user_refresh_tokens(db, user_id)
+
     _commit_refresh(db, db_user)
+    # Papel, empresa ou estado podem ter mudado
+    principal_cache.invalidate(user_id)
     return db_user
 
 
+def update_password_hash(db: Session, user_id: int, hashed_password: str) -> None:
+    """Store a rehashed password (same password, new bcrypt cost); sessions stay valid."""
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {"hashed_password": hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+
 def delete_user(db: Session, user_id: int) -> bool:
     db_user = get_user_by_id(db, user_id)
     if not db_user:
         return False
+    db.query(models.RefreshToken).filter(models.RefreshToken.user_id == user_id).delete(
+        synchronize_session=False
+    )
     db.delete(db_user)
-    _commit_refresh(db, db_user)
+    # Sem refresh: a instância já não existe depois do commit
+    db.commit()
+    principal_cache.invalidate(user_id)
     return True
 
 
+# ──────────────────────────────
+# REFRESH TOKENS
+# ──────────────────────────────
+def _add_refresh_token(db: Session, user_id: int, family_id: str, expires_at: datetime) -> str:
+    token = new_refresh_token()
+    db.add(models.RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        expires_at=expires_at,
+    ))
+    return token
+
+
+def create_refresh_token(db: Session, user_id: int) -> str:
+    """Start a new token family for *user_id* (one per login) and return its first token."""
+    expires_at = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    token = _add_refresh_token(db, user_id, uuid.uuid4().hex, expires_at)
+    db.commit()
+    return token
+
+
+def _revoke_refresh_family(db: Session, family_id: str) -> None:
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id,
+        models.RefreshToken.revoked_at.is_(None),
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+
+def rotate_refresh_token(db: Session, token: str) -> Optional[Tuple[models.User, str]]:
+    """
+    Exchange a refresh token for its successor in the same family.
+
+    Returns ``(user, new_token)``, or None if the token is unknown, expired,
+    revoked or belongs to an inactive user. Reusing an already rotated token
+    revokes the whole family, since either the client or an attacker holds a
+    stolen copy; within ``REFRESH_REUSE_GRACE_SECONDS`` of its rotation (two
+    tabs or a retried request racing) it gets another successor instead, as
+    long as the family is still active (not logged out or revoked).
+    """
+    now = datetime.utcnow()
+    stored = (
+        db.query(models.RefreshToken)
+        .filter(models.RefreshToken.token_hash == hash_refresh_token(token))
+        .with_for_update()
+        .first()
+    )
+    if stored is None:
+        return None
+
+    if stored.revoked_at is not None:
+        if now - stored.revoked_at > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            logger.warning(
+                f"Refresh token reuse for user {stored.user_id}; revoking family {stored.family_id}"
+            )
+            _revoke_refresh_family(db, stored.family_id)
+            db.commit()
+            return None
+        # Só as rotações deixam um sucessor ativo; logout e revogação não
+        family_active = db.query(
+            db.query(models.RefreshToken)
+            .filter(
+                models.RefreshToken.family_id == stored.family_id,
+                models.RefreshToken.revoked_at.is_(None),
+            )
+            .exists()
+        ).scalar()
+        if not family_active:
+            db.rollback()
+            return None
+
+    user = get_user_by_id(db, stored.user_id)
+    if stored.expires_at <= now or not user or not user.is_active:
+        db.rollback()
+        return None
+
+    if stored.revoked_at is None:
+        stored.revoked_at = now
+    # A família mantém a validade do login: uma password por dispositivo e período
+    new_token = _add_refresh_token(db, user.id, stored.family_id, stored.expires_at)
+    db.commit()
+    return user, new_token
+
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Revoke the family of *token* (logout from one device)."""
+    family_id = (
+        db.query(models.RefreshToken.family_id)
+        .filter(models.RefreshToken.token_hash == hash_refresh_token(token))
+        .scalar()
+    )
+    if family_id is None:
+        return False
+    _revoke_refresh_family(db, family_id)
+    db.commit()
+    return True
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int) -> None:
+    """Revoke every refresh token of *user_id*; runs in the caller's transaction."""
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user_id,
+        models.RefreshToken.revoked_at.is_(None),
+    ).update({"revoked_at": datetime.utcnow()}, synchronize_session=False)
+
+
+def purge_expired_refresh_tokens(db: Session) -> int:
+    """Delete refresh tokens past their expiry; returns the number of rows removed."""
+    deleted = db.query(models.RefreshToken).filter(
+        models.RefreshToken.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
 # ──────────────────────────────
 # COMPANY CRUD
 # ──────────────────────────────
@@ -124,10 +370,14 @@ def create_company(db: Session, company: schemas.CompanyCreate) -> models.Compan
     db.add(db_company)
     
     try:
+        db.flush()
+        bump_tenant_version(db, db_company.id)
         # Confirmar as alterações
         db.commit()
         # Atualizar o objeto com os dados do banco de dados
         db.refresh(db_company)
+        search_index.invalidate()
+        response_cache.invalidate("companies", db_company.id)
         return db_company
     except Exception as e:
         # Em caso de erro, reverter as alterações
@@ -147,7 +397,12 @@ def update_company(
     for key, val in company_data.model_dump(exclude_unset=True).items():
         setattr(db_company, key, val)
 
+    bump_tenant_version(db, company_id)
     _commit_refresh(db, db_company)
+    search_index.invalidate()
+    # As listas de máquinas embebem o nome da empresa
+    response_cache.invalidate("companies", company_id)
+    response_cache.invalidate("machines", company_id)
     return db_company
 
 
@@ -156,130 +411,557 @@ def delete_company(db: Session, company_id: int) -> bool:
     if not db_company:
         return False
     db.delete(db_company)
+    bump_tenant_version(db, company_id)
     db.commit()
+    search_index.invalidate()
+    response_cache.invalidate("companies", company_id)
+    response_cache.invalidate("machines", company_id)
     return True
 
 
 # ──────────────────────────────
 # MACHINE CRUD
 # ──────────────────────────────
-def get_machines(db: Session, *, skip: int = 0, limit: int = 100) -> List[models.Machine]:
-    return db.query(models.Machine).offset(skip).limit(limit).all()
+def get_machines(
+    db: Session, *, skip: int = 0, limit: int = 100, list_query: Optional[ListQuery] = None
+) -> List[models.Machine]:
+    query = db.query(models.Machine)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.offset(skip).limit(limit).all()
 
 
 def get_machine_by_id(db: Session, machine_id: int) -> Optional[models.Machine]:
     return db.query(models.Machine).filter(models.Machine.id == machine_id).first()
 
 
-def get_machines_by_company(db: Session, company_id: int) -> List[models.Machine]:
-    return db.query(models.Machine).filter(models.Machine.company_id == company_id).all()
+def get_machines_by_company(
+    db: Session, company_id: int, *, list_query: Optional[ListQuery] = None
+) -> List[models.Machine]:
+    query = db.query(models.Machine).filter(models.Machine.company_id == company_id)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.all()
 
 
 def create_machine(db: Session, machine: schemas.MachineCreate) -> models.Machine:
     """Cria uma nova máquina com todos os campos expandidos."""
     db_machine = models.Machine(**machine.model_dump())
     db.add(db_machine)
+    bump_tenant_version(db, db_machine.company_id)
     _commit_refresh(db, db_machine)
+    search_index.invalidate()
+    response_cache.invalidate("machines", db_machine.company_id)
     return db_machine
 
 
 def update_machine(
     db: Session,
-    machine_id: int,
+    machine: Union[int, models.Machine],
     machine_data: schemas.MachineUpdate,
 ) -> Optional[models.Machine]:
     """Atualiza uma máquina existente, suportando todos os novos campos."""
-    db_machine = get_machine_by_id(db, machine_id)
+    db_machine = _instance(db, models.Machine, machine)
     if not db_machine:
         return None
 
     update_data = machine_data.model_dump(exclude_unset=True)
+    previous_company_id = db_machine.company_id
     
     for key, val in update_data.items():
         setattr(db_machine, key, val)
 
+    # A máquina pode ter mudado de empresa: ambas as versões mudam
+    bump_tenant_version(db, previous_company_id, db_machine.company_id)
     _commit_refresh(db, db_machine)
+    search_index.invalidate()
+    response_cache.invalidate("machines", previous_company_id, db_machine.company_id)
     return db_machine
 
 
-def delete_machine(db: Session, machine_id: int) -> bool:
-    db_machine = get_machine_by_id(db, machine_id)
+def delete_machine(db: Session, machine: Union[int, models.Machine]) -> bool:
+    db_machine = _instance(db, models.Machine, machine)
     if not db_machine:
         return False
     db.delete(db_machine)
-    _commit_refresh(db, db_machine)
+    bump_tenant_version(db, db_machine.company_id)
+    # Sem refresh: a instância já não existe depois do commit
+    db.commit()
+    search_index.invalidate()
+    response_cache.invalidate("machines", db_machine.company_id)
     return True
 
 
 # ──────────────────────────────
 # MAINTENANCE CRUD
 # ──────────────────────────────
+def filter_maintenances(
+    query: Union[Query, Select],
+    *,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+) -> Union[Query, Select]:
+    """Restrict *query* by computed status and scheduled date window.
+
+    The predicates are written against the raw ``completed`` and
+    ``scheduled_date`` columns (not the computed ``status`` expression) so
+    that ``ix_maintenances_completed_scheduled_date`` can be used.
+    """
+    today = func.current_date()
+    horizon = add_days(today, models.UPCOMING_WINDOW_DAYS)
+    pending = models.Maintenance.completed.is_(False)
+    scheduled_date = models.Maintenance.scheduled_date
+
+    if status == "completed":
+        query = query.filter(models.Maintenance.completed.is_(True))
+    elif status == "pending":
+        query = query.filter(pending)
+    elif status == "overdue":
+        query = query.filter(pending, scheduled_date < today)
+    elif status == "upcoming":
+        query = query.filter(pending, scheduled_date >= today, scheduled_date <= horizon)
+    elif status == "scheduled":
+        query = query.filter(pending, scheduled_date > horizon)
+
+    if date_from is not None:
+        query = query.filter(scheduled_date >= date_from)
+    if date_to is not None:
+        query = query.filter(scheduled_date <= date_to)
+    return query
+
+
 def get_maintenances(
-    db: Session, *, skip: int = 0, limit: int = 100
+    db: Session,
+    *,
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    list_query: Optional[ListQuery] = None,
 ) -> List[models.Maintenance]:
-    return db.query(models.Maintenance).offset(skip).limit(limit).all()
+    query = filter_maintenances(
+        db.query(models.Maintenance), status=status, date_from=date_from, date_to=date_to
+    )
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.offset(skip).limit(limit).all()
 
 
 def get_maintenance_by_id(db: Session, maintenance_id: int) -> Optional[models.Maintenance]:
     return db.query(models.Maintenance).filter(models.Maintenance.id == maintenance_id).first()
 
 
-def get_machine_maintenances(db: Session, machine_id: int) -> List[models.Maintenance]:
-    return db.query(models.Maintenance).filter(models.Maintenance.machine_id == machine_id).all()
+def get_maintenance_with_machine(db: Session, maintenance_id: int) -> Optional[models.Maintenance]:
+    """Maintenance and its machine (hence company_id) in a single query."""
+    return (
+        db.query(models.Maintenance)
+        .options(joinedload(models.Maintenance.machine, innerjoin=True))
+        .filter(models.Maintenance.id == maintenance_id)
+        .first()
+    )
 
 
-def get_company_maintenances(db: Session, company_id: int) -> List[models.Maintenance]:
+def get_machine_maintenances(
+    db: Session,
+    machine_id: int,
+    *,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    list_query: Optional[ListQuery] = None,
+) -> List[models.Maintenance]:
+    query = db.query(models.Maintenance).filter(models.Maintenance.machine_id == machine_id)
+    query = filter_maintenances(query, status=status, date_from=date_from, date_to=date_to)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.all()
+
+
+def get_company_maintenances(
+    db: Session,
+    company_id: int,
+    *,
+    status: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    list_query: Optional[ListQuery] = None,
+) -> List[models.Maintenance]:
     """All maintenances for machines belonging to *company_id*."""
-    return (
+    query = (
         db.query(models.Maintenance)
         .join(models.Machine)
         .filter(models.Machine.company_id == company_id)
+    )
+    query = filter_maintenances(query, status=status, date_from=date_from, date_to=date_to)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.all()
+
+
+def get_maintenance_calendar(
+    db: Session,
+    *,
+    date_from: date,
+    date_to: date,
+    granularity: str = "day",
+    company_id: Optional[int] = None,
+    status: Optional[str] = None,
+    top_k: int = 0,
+) -> List[dict]:
+    """
+    Per-bucket maintenance counts for a calendar/heatmap view.
+
+    Buckets (the day, or the Monday of its week, see ``dialects.week_start``)
+    are computed with ``GROUP BY``; when *top_k* is positive the first *top_k*
+    events of each bucket (by date) are attached, selected with a
+    ``row_number()`` window so the cost does not depend on how many
+    maintenances fall in a bucket.
+    """
+    scheduled_date = models.Maintenance.scheduled_date
+    bucket = (scheduled_date if granularity == "day" else week_start(scheduled_date)).label("bucket")
+
+    def scoped(query: Query) -> Query:
+        query = query.join(models.Machine, models.Machine.id == models.Maintenance.machine_id)
+        if company_id is not None:
+            query = query.filter(models.Machine.company_id == company_id)
+        return filter_maintenances(query, status=status, date_from=date_from, date_to=date_to)
+
+    counts = (
+        scoped(db.query(bucket, func.count(models.Maintenance.id).label("count")))
+        .group_by(bucket)
+        .order_by(bucket)
         .all()
     )
+    buckets = {row.bucket: {"bucket": row.bucket, "count": row.count, "events": []} for row in counts}
+
+    # Ocorrências de regras recorrentes ainda não gravadas, contadas no mesmo balde
+    occurrences = recurrence.expand_rules(db, date_from, date_to, company_id=company_id, status=status)
+    for occurrence in occurrences:
+        day = occurrence["scheduled_date"]
+        key = day if granularity == "day" else day - timedelta(days=day.weekday())
+        entry = buckets.setdefault(key, {"bucket": key, "count": 0, "events": []})
+        entry["count"] += 1
+        if len(entry["events"]) < top_k:
+            entry["events"].append({
+                field: occurrence[field]
+                for field in (
+                    "id", "rule_id", "type", "scheduled_date", "status",
+                    "machine_id", "machine_name", "company_id", "company_name",
+                )
+            })
+
+    if top_k > 0 and counts:
+        rank = func.row_number().over(
+            partition_by=bucket,
+            order_by=(models.Maintenance.scheduled_date, models.Maintenance.id),
+        ).label("rank")
+        ranked = scoped(
+            db.query(
+                bucket,
+                rank,
+                models.Maintenance.id,
+                models.Maintenance.type,
+                models.Maintenance.scheduled_date,
+                models.Maintenance.machine_id,
+                models.Maintenance.status.label("status"),
+                models.Machine.name.label("machine_name"),
+                models.Machine.company_id,
+            )
+        ).subquery()
+        events = (
+            db.query(ranked, models.Company.name.label("company_name"))
+            .outerjoin(models.Company, models.Company.id == ranked.c.company_id)
+            .filter(ranked.c.rank <= top_k)
+            .order_by(ranked.c.bucket, ranked.c.rank)
+        )
+        for row in events:
+            buckets[row.bucket]["events"].append({
+                "id": row.id,
+                "type": row.type,
+                "scheduled_date": row.scheduled_date,
+                "status": row.status,
+                "machine_id": row.machine_id,
+                "machine_name": row.machine_name,
+                "company_id": row.company_id,
+                "company_name": row.company_name,
+            })
+
+    if occurrences:
+        for entry in buckets.values():
+            entry["events"].sort(key=lambda event: event["scheduled_date"])
+            del entry["events"][top_k:]
+        return sorted(buckets.values(), key=lambda entry: entry["bucket"])
+    return list(buckets.values())
+
+
+def get_maintenance_occurrences(
+    db: Session,
+    *,
+    date_from: date,
+    date_to: date,
+    company_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[dict]:
+    """
+    Maintenances scheduled between *date_from* and *date_to*: the stored ones
+    plus the pending occurrences of recurring rules, merged by date.
+    """
+    statement = maintenance_rows_statement(company_id)
+    if machine_id is not None:
+        statement = statement.where(models.Maintenance.machine_id == machine_id)
+    statement = filter_maintenances(statement, status=status, date_from=date_from, date_to=date_to)
+    stored = [dict(row) for row in db.execute(statement).mappings()]
+    occurrences = recurrence.expand_rules(
+        db, date_from, date_to, company_id=company_id, machine_id=machine_id, status=status
+    )
+    rows = stored + occurrences
+    rows.sort(key=lambda row: (row["scheduled_date"], row["id"] is None, row["id"] or row["rule_id"]))
+    return rows
 
 
 def create_maintenance(db: Session, maintenance: schemas.MaintenanceCreate) -> models.Maintenance:
     db_maintenance = models.Maintenance(**maintenance.model_dump())
     db.add(db_maintenance)
+    bump_tenant_version(db, _machine_company_id(db, db_maintenance.machine_id))
     _commit_refresh(db, db_maintenance)
     return db_maintenance
 
 
 def update_maintenance(
     db: Session,
-    maintenance_id: int,
+    maintenance: Union[int, models.Maintenance],
     maintenance_data: schemas.MaintenanceUpdate,
 ) -> Optional[models.Maintenance]:
-    db_maintenance = get_maintenance_by_id(db, maintenance_id)
+    db_maintenance = _instance(db, models.Maintenance, maintenance)
     if not db_maintenance:
         return None
 
+    # Sem consulta se a máquina já veio carregada (get_maintenance_with_machine)
+    previous_company_id = db_maintenance.machine.company_id
+    previous_machine_id = db_maintenance.machine_id
     for key, val in maintenance_data.model_dump(exclude_unset=True).items():
         setattr(db_maintenance, key, val)
 
+    company_id = previous_company_id
+    if db_maintenance.machine_id != previous_machine_id:
+        company_id = _machine_company_id(db, db_maintenance.machine_id)
+    bump_tenant_version(db, previous_company_id, company_id)
     _commit_refresh(db, db_maintenance)
     return db_maintenance
 
 
-def update_maintenance_status(db: Session, maintenance_id: int, completed: bool) -> Optional[models.Maintenance]:
-    maintenance = get_maintenance_by_id(db, maintenance_id)
+def update_maintenance_status(
+    db: Session, maintenance: Union[int, models.Maintenance], completed: bool
+) -> Optional[models.Maintenance]:
+    maintenance = _instance(db, models.Maintenance, maintenance)
     if not maintenance:
         return None
 
     maintenance.completed = completed
+    bump_tenant_version(db, maintenance.machine.company_id)
     _commit_refresh(db, maintenance)
     return maintenance
 
 
-def delete_maintenance(db: Session, maintenance_id: int) -> bool:
-    db_maintenance = get_maintenance_by_id(db, maintenance_id)
+def delete_maintenance(db: Session, maintenance: Union[int, models.Maintenance]) -> bool:
+    db_maintenance = _instance(db, models.Maintenance, maintenance)
     if not db_maintenance:
         return False
+    company_id = db_maintenance.machine.company_id
     db.delete(db_maintenance)
-    _commit_refresh(db, db_maintenance)
+    bump_tenant_version(db, company_id)
+    # Sem refresh: a instância já não existe depois do commit
+    db.commit()
     return True
 
 
+def bulk_maintenance_action(
+    db: Session,
+    action: str,
+    ids: List[int],
+    *,
+    company_id: Optional[int] = None,
+    scheduled_date: Optional[date] = None,
+) -> Tuple[dict, set]:
+    """
+    Complete, reschedule or delete many maintenances with one set-based
+    statement and one commit.
+
+    Only ids of *company_id*'s machines are touched (all companies if None).
+    Returns ``({company_id: changed rows}, found ids)``; versions and caches
+    are bumped once for the batch.
+    """
+    Maintenance = models.Maintenance
+    targets = select(Maintenance.id, Maintenance.completed, models.Machine.company_id).join(
+        models.Machine, Maintenance.machine_id == models.Machine.id
+    ).where(Maintenance.id.in_(set(ids)))
+    if company_id is not None:
+        targets = targets.where(models.Machine.company_id == company_id)
+    rows = db.execute(targets).all()
+    found = {row.id for row in rows}
+    if action == "complete":
+        # Já concluídas contam como encontradas, mas não mudam
+        rows = [row for row in rows if not row.completed]
+
+    if rows:
+        if action == "delete":
+            statement = delete(Maintenance)
+        elif action == "reschedule":
+            statement = update(Maintenance).values(scheduled_date=scheduled_date)
+        else:
+            statement = update(Maintenance).values(completed=True)
+        db.execute(
+            statement.where(Maintenance.id.in_([row.id for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+
+    changed = {}
+    for row in rows:
+        changed[row.company_id] = changed.get(row.company_id, 0) + 1
+    # record_bulk_write faz o commit: versões e alterações na mesma transação
+    record_bulk_write(db, "maintenances", changed)
+    return changed, found
+
+
+# ──────────────────────────────
+# MAINTENANCE RULE CRUD
+# ──────────────────────────────
+def get_maintenance_rule_with_machine(db: Session, rule_id: int) -> Optional[models.MaintenanceRule]:
+    """Rule and its machine (hence company_id) in a single query."""
+    return (
+        db.query(models.MaintenanceRule)
+        .options(joinedload(models.MaintenanceRule.machine, innerjoin=True))
+        .filter(models.MaintenanceRule.id == rule_id)
+        .first()
+    )
+
+
+def get_maintenance_rules(
+    db: Session,
+    *,
+    company_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+) -> List[models.MaintenanceRule]:
+    query = db.query(models.MaintenanceRule)
+    if company_id is not None:
+        query = query.join(models.Machine).filter(models.Machine.company_id == company_id)
+    if machine_id is not None:
+        query = query.filter(models.MaintenanceRule.machine_id == machine_id)
+    return query.order_by(models.MaintenanceRule.id).all()
+
+
+def create_maintenance_rule(db: Session, rule: schemas.MaintenanceRuleCreate) -> models.MaintenanceRule:
+    db_rule = models.MaintenanceRule(**rule.model_dump())
+    db.add(db_rule)
+    bump_tenant_version(db, _machine_company_id(db, db_rule.machine_id))
+    _commit_refresh(db, db_rule)
+    return db_rule
+
+
+def update_maintenance_rule(
+    db: Session,
+    rule: Union[int, models.MaintenanceRule],
+    rule_data: schemas.MaintenanceRuleUpdate,
+) -> Optional[models.MaintenanceRule]:
+    """
+    Apply *rule_data* to the rule; raises ``ValueError`` if the result is not
+    a valid rule. Occurrences already stored are kept as they are.
+    """
+    db_rule = _instance(db, models.MaintenanceRule, rule)
+    if not db_rule:
+        return None
+
+    values = {
+        key: getattr(db_rule, key)
+        for key in schemas.MaintenanceRuleCreate.model_fields
+    }
+    values.update(rule_data.model_dump(exclude_unset=True))
+    # Valida a combinação final (um só intervalo, fim depois da âncora)
+    try:
+        validated = schemas.MaintenanceRuleCreate.model_validate(values)
+    except ValidationError as e:
+        raise ValueError("; ".join(error["msg"] for error in e.errors()))
+    for key, val in validated.model_dump().items():
+        setattr(db_rule, key, val)
+
+    bump_tenant_version(db, db_rule.machine.company_id)
+    _commit_refresh(db, db_rule)
+    return db_rule
+
+
+def delete_maintenance_rule(db: Session, rule: Union[int, models.MaintenanceRule]) -> bool:
+    """Delete the rule; its stored occurrences stay as standalone maintenances."""
+    db_rule = _instance(db, models.MaintenanceRule, rule)
+    if not db_rule:
+        return False
+    company_id = db_rule.machine.company_id
+    db.execute(
+        update(models.Maintenance)
+        .where(models.Maintenance.rule_id == db_rule.id)
+        .values(rule_id=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.delete(db_rule)
+    bump_tenant_version(db, company_id)
+    db.commit()
+    return True
+
+
+def store_rule_occurrence(
+    db: Session,
+    rule: Union[int, models.MaintenanceRule],
+    occurrence_date: date,
+    maintenance_data: schemas.MaintenanceUpdate,
+) -> Optional[models.Maintenance]:
+    """
+    Store the occurrence of *rule* on *occurrence_date* as a maintenance with
+    *maintenance_data* applied (completion or edit). An occurrence stored
+    earlier is updated instead. Returns None if the rule does not exist or
+    has no occurrence on that date.
+    """
+    db_rule = _instance(db, models.MaintenanceRule, rule)
+    if not db_rule or not recurrence.is_occurrence(db_rule, occurrence_date):
+        return None
+
+    def stored() -> Optional[models.Maintenance]:
+        return (
+            db.query(models.Maintenance)
+            .filter(
+                models.Maintenance.rule_id == db_rule.id,
+                models.Maintenance.occurrence_date == occurrence_date,
+            )
+            .first()
+        )
+
+    existing = stored()
+    if existing:
+        return update_maintenance(db, existing, maintenance_data)
+
+    company_id = db_rule.machine.company_id
+    db_maintenance = models.Maintenance(
+        machine_id=db_rule.machine_id,
+        type=db_rule.type,
+        scheduled_date=occurrence_date,
+        completed=False,
+        notes=db_rule.notes,
+        rule_id=db_rule.id,
+        occurrence_date=occurrence_date,
+    )
+    for key, val in maintenance_data.model_dump(exclude_unset=True).items():
+        setattr(db_maintenance, key, val)
+    db.add(db_maintenance)
+    bump_tenant_version(db, company_id)
+    try:
+        _commit_refresh(db, db_maintenance)
+    except IntegrityError:
+        # Gravada entretanto por um pedido concorrente (índice único rule_id + data)
+        return update_maintenance(db, stored(), maintenance_data)
+    return db_maintenance
+
+
 # ──────────────────────────────
 # Helpers for alarms / dashboards
 # ──────────────────────────────
@@ -299,6 +981,12 @@ def list_pending_maintenances(db: Session) -> List[models.Maintenance]:
     )
 
 
+def list_pending_rule_occurrences(db: Session) -> List[dict]:
+    """Occurrences of recurring rules due within the next 7 days (not stored yet)."""
+    today = datetime.now().date()
+    return recurrence.expand_rules(db, today, today + timedelta(days=7))
+
+
 def list_company_pending_maintenances(db: Session, company_id: int) -> List[models.Maintenance]:
     """Pending maintenances in next 7 days for *company_id*."""
     today = datetime.now().date()
@@ -317,6 +1005,39 @@ def list_company_pending_maintenances(db: Session, company_id: int) -> List[mode
     )
 
 
+# ──────────────────────────────
+# Row-level selects (exports / fast paths)
+# ──────────────────────────────
+def machine_rows_statement(company_id: Optional[int] = None) -> Select:
+    """Column-only SELECT of machines, optionally scoped to *company_id*."""
+    statement = select(*models.Machine.__table__.columns)
+    if company_id is not None:
+        statement = statement.where(models.Machine.company_id == company_id)
+    return statement
+
+
+def maintenance_rows_statement(company_id: Optional[int] = None) -> Select:
+    """Column-only SELECT of maintenances with computed status and machine name."""
+    statement = select(
+        *models.Maintenance.__table__.columns,
+        models.Maintenance.status.label("status"),
+        models.Maintenance.days_delta.label("days_delta"),
+        models.Machine.name.label("machine_name"),
+        models.Machine.company_id.label("company_id"),
+    ).join(models.Machine, models.Machine.id == models.Maintenance.machine_id)
+    if company_id is not None:
+        statement = statement.where(models.Machine.company_id == company_id)
+    return statement
+
+
+def invoice_rows_statement(company_id: Optional[int] = None) -> Select:
+    """Column-only SELECT of invoices (without items), optionally scoped."""
+    statement = select(*models.Invoice.__table__.columns)
+    if company_id is not None:
+        statement = statement.where(models.Invoice.company_id == company_id)
+    return statement
+
+
 # ──────────────────────────────
 # SERVICE CRUD
 # ──────────────────────────────
@@ -332,7 +1053,9 @@ def get_service_by_id(db: Session, service_id: int) -> Optional[models.Service]:
 def create_service(db: Session, service: schemas.ServiceCreate) -> models.Service:
     db_service = models.Service(**service.model_dump())
     db.add(db_service)
+    bump_tenant_version(db)
     _commit_refresh(db, db_service)
+    response_cache.invalidate("services")
     return db_service
 
 def update_service(db: Session, service_id: int, service_data: schemas.ServiceUpdate) -> Optional[models.Service]:
@@ -343,7 +1066,9 @@ def update_service(db: Session, service_id: int, service_data: schemas.ServiceUp
     for key, val in service_data.model_dump(exclude_unset=True).items():
         setattr(db_service, key, val)
 
+    bump_tenant_version(db)
     _commit_refresh(db, db_service)
+    response_cache.invalidate("services")
     return db_service
 
 def delete_service(db: Session, service_id: int) -> bool:
@@ -353,38 +1078,53 @@ def delete_service(db: Session, service_id: int) -> bool:
     
     # Em vez de excluir, apenas marcar como inativo
     db_service.is_active = False
+    bump_tenant_version(db)
     _commit_refresh(db, db_service)
+    response_cache.invalidate("services")
     return True
 
 # ──────────────────────────────
 # INVOICE CRUD
 # ──────────────────────────────
+# Chave do advisory lock que serializa a numeração de faturas (Postgres)
+INVOICE_NUMBER_LOCK_KEY = 7401
+
+
+def allocate_invoice_numbers(db: Session, count: int, day: Optional[date] = None) -> List[str]:
+    """
+    Reserva *count* números de fatura sequenciais no formato FP-YYYYMM-XXXX
+    (mês de *day*, por omissão o atual) com uma única consulta ao máximo.
+    Em Postgres a numeração fica bloqueada até ao fim da transação.
+    """
+    day = day or datetime.now().date()
+    prefix = f"FP-{day.year}{day.month:02d}-"
+
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(INVOICE_NUMBER_LOCK_KEY)))
+
+    # Máximo numérico: como texto, "FP-202401-10000" < "FP-202401-9999"
+    suffix = func.substr(models.Invoice.invoice_number, len(prefix) + 1)
+    last_num = db.query(func.max(cast(suffix, Integer))).filter(
+        models.Invoice.invoice_number.like(f"{prefix}%")
+    ).scalar() or 0
+
+    return [f"{prefix}{number:04d}" for number in range(last_num + 1, last_num + 1 + count)]
+
 def _generate_invoice_number(db: Session) -> str:
     """Gera um número de fatura sequencial no formato FP-YYYYMM-XXXX"""
-    today = datetime.now()
-    prefix = f"FP-{today.year}{today.month:02d}-"
-    
-    # Encontrar o maior número já usado no mês atual
-    result = db.query(func.max(models.Invoice.invoice_number)).filter(
-        models.Invoice.invoice_number.like(f"{prefix}%")
-    ).scalar()
-    
-    if result:
-        try:
-            last_num = int(result.split('-')[-1])
-            new_num = last_num + 1
-        except (ValueError, IndexError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    return f"{prefix}{new_num:04d}"
+    return allocate_invoice_numbers(db, 1)[0]
 
-def get_invoices(db: Session, *, skip: int = 0, limit: int = 100) -> List[models.Invoice]:
-    return db.query(models.Invoice).order_by(models.Invoice.issue_date.desc()).offset(skip).limit(limit).all()
+def get_invoices(db: Session, *, skip: int = 0, limit: int = 100, list_query: Optional[ListQuery] = None) -> List[models.Invoice]:
+    query = db.query(models.Invoice)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.order_by(models.Invoice.issue_date.desc()).offset(skip).limit(limit).all()
 
-def get_company_invoices(db: Session, company_id: int) -> List[models.Invoice]:
-    return db.query(models.Invoice).filter(models.Invoice.company_id == company_id).order_by(models.Invoice.issue_date.desc()).all()
+def get_company_invoices(db: Session, company_id: int, *, list_query: Optional[ListQuery] = None) -> List[models.Invoice]:
+    query = db.query(models.Invoice).filter(models.Invoice.company_id == company_id)
+    if list_query is not None:
+        return list_query.apply(query).all()
+    return query.order_by(models.Invoice.issue_date.desc()).all()
 
 def get_invoice_by_id(db: Session, invoice_id: int) -> Optional[models.Invoice]:
     return db.query(models.Invoice).filter(models.Invoice.id == invoice_id).first()
@@ -450,12 +1190,13 @@ def create_invoice(db: Session, invoice: schemas.InvoiceCreate) -> models.Invoic
     db_invoice.tax_total = tax_total
     db_invoice.total = subtotal + tax_total
     
+    bump_tenant_version(db, db_invoice.company_id)
     _commit_refresh(db, db_invoice)
     return db_invoice
 
-def update_invoice_status(db: Session, invoice_id: int, status: models.InvoiceStatus, payment_date: Optional[date] = None) -> Optional[models.Invoice]:
+def update_invoice_status(db: Session, invoice: Union[int, models.Invoice], status: models.InvoiceStatus, payment_date: Optional[date] = None) -> Optional[models.Invoice]:
     """Atualiza o status de uma fatura (e data de pagamento se aplicável)"""
-    invoice = get_invoice_by_id(db, invoice_id)
+    invoice = _instance(db, models.Invoice, invoice)
     if not invoice:
         return None
     
@@ -465,12 +1206,13 @@ def update_invoice_status(db: Session, invoice_id: int, status: models.InvoiceSt
     if status == models.InvoiceStatus.PAID and payment_date:
         invoice.payment_date = payment_date
     
+    bump_tenant_version(db, invoice.company_id)
     _commit_refresh(db, invoice)
     return invoice
 
-def delete_invoice(db: Session, invoice_id: int) -> bool:
+def delete_invoice(db: Session, invoice: Union[int, models.Invoice]) -> bool:
     """Exclui uma fatura (apenas se estiver em rascunho)"""
-    invoice = get_invoice_by_id(db, invoice_id)
+    invoice = _instance(db, models.Invoice, invoice)
     if not invoice:
         return False
     
@@ -479,5 +1221,76 @@ def delete_invoice(db: Session, invoice_id: int) -> bool:
         return False
     
     db.delete(invoice)  # Cascade deleta os itens
-    _commit_refresh(db, invoice)
-    return True
\ No newline at end of file
+    bump_tenant_version(db, invoice.company_id)
+    # Sem refresh: a instância já não existe depois do commit
+    db.commit()
+    return True
+def mark_overdue_invoices(db: Session, today: Optional[date] = None) -> Dict[int, Tuple[int, float]]:
+    """
+    Marca como vencidas, num único UPDATE, as faturas enviadas cujo prazo já
+    passou. Devolve ``{company_id: (faturas, total)}`` das faturas alteradas.
+    """
+    today = today or datetime.now().date()
+    Invoice = models.Invoice
+    rows = db.execute(
+        update(Invoice)
+        .where(Invoice.status == models.InvoiceStatus.SENT, Invoice.due_date < today)
+        .values(status=models.InvoiceStatus.OVERDUE)
+        .returning(Invoice.company_id, Invoice.total)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    overdue: Dict[int, Tuple[int, float]] = {}
+    for company_id, total in rows:
+        count, amount = overdue.get(company_id, (0, 0.0))
+        overdue[company_id] = (count + 1, amount + (total or 0.0))
+    # record_bulk_write faz o commit: versões e estados na mesma transação
+    record_bulk_write(db, "invoices", overdue)
+    return overdue
+
+# ──────────────────────────────
+# BILLING PLAN CRUD
+# ──────────────────────────────
+def get_billing_plans(db: Session, company_id: Optional[int] = None) -> List[models.BillingPlan]:
+    query = db.query(models.BillingPlan)
+    if company_id is not None:
+        query = query.filter(models.BillingPlan.company_id == company_id)
+    return query.order_by(models.BillingPlan.company_id, models.BillingPlan.id).all()
+
+def get_billing_plan_by_id(db: Session, plan_id: int) -> Optional[models.BillingPlan]:
+    return db.query(models.BillingPlan).filter(models.BillingPlan.id == plan_id).first()
+
+def create_billing_plan(db: Session, plan: schemas.BillingPlanCreate) -> models.BillingPlan:
+    """Cria um plano de faturação (o serviço e a máquina da empresa têm de existir)"""
+    if not get_service_by_id(db, plan.service_id):
+        raise ValueError(f"Service with ID {plan.service_id} not found")
+    if plan.machine_id is not None and _machine_company_id(db, plan.machine_id) != plan.company_id:
+        raise ValueError(f"Machine with ID {plan.machine_id} not found in company {plan.company_id}")
+
+    db_plan = models.BillingPlan(**plan.model_dump())
+    db.add(db_plan)
+    bump_tenant_version(db, plan.company_id)
+    _commit_refresh(db, db_plan)
+    return db_plan
+
+def update_billing_plan(db: Session, plan_id: int, plan_data: schemas.BillingPlanUpdate) -> Optional[models.BillingPlan]:
+    """Atualiza um plano; as faturas já geradas não mudam"""
+    db_plan = get_billing_plan_by_id(db, plan_id)
+    if not db_plan:
+        return None
+
+    for key, val in plan_data.model_dump(exclude_unset=True).items():
+        setattr(db_plan, key, val)
+
+    bump_tenant_version(db, db_plan.company_id)
+    _commit_refresh(db, db_plan)
+    return db_plan
+
+def delete_billing_plan(db: Session, plan_id: int) -> bool:
+    db_plan = get_billing_plan_by_id(db, plan_id)
+    if not db_plan:
+        return False
+    db.delete(db_plan)
+    bump_tenant_version(db, db_plan.company_id)
+    db.commit()
+    return True
@@ -1,19 +1,24 @@
-from fastapi import Depends, HTTPException, status
+from datetime import date
+from typing import Callable, Optional
+
+from fastapi import Depends, HTTPException, Query, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
 
-from . import crud, database, models, schemas
-from .security import SECRET_KEY, ALGORITHM
+from . import cache, crud, database, models, schemas, singleflight
+from .auth import Principal, principal_cache
+from .security import SECRET_KEY, ALGORITHM, verify_download_token
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(database.get_db)
-) -> models.User:
+) -> Principal:
     """
-    Validates the JWT token and returns the current user.
+    Validates the JWT token and returns the current user as a `Principal`.
+    The user row is only read on a principal cache miss (see `auth.py`).
     Raises HTTP_401_UNAUTHORIZED if invalid or not found.
     """
     credentials_exception = HTTPException(
@@ -35,20 +40,67 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if not user:
+    principal = _load_principal(db, token_data.username, token_data.user_id)
+    if principal is None:
         raise credentials_exception
-    if not user.is_active:
+    return principal
+
+
+def _load_principal(db: Session, username: str, user_id: Optional[int]) -> Optional[Principal]:
+    """Active principal of a token's user (None if the user is gone); 403 if inactive."""
+    principal = principal_cache.get(user_id) if user_id else None
+    # O username do token tem de coincidir (utilizador renomeado = token antigo inválido)
+    if principal is None or principal.username != username:
+        user = crud.get_user_by_username(db, username=username)
+        if not user:
+            return None
+        principal = Principal.from_user(user)
+        principal_cache.set(principal)
+
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
-    return user
+    return principal
+
+
+def download_grant(resource: str) -> Callable[..., dict]:
+    """
+    Build a dependency for download links of *resource* (see
+    `security.create_download_token`). It validates the signed ``?token=``
+    and that its user may still access the company in it, and returns the
+    parameters signed into the token.
+    """
+
+    def dependency(
+        token: str = Query(..., description="Signed download token"),
+        db: Session = Depends(database.get_db)
+    ) -> dict:
+        payload = verify_download_token(token, resource)
+        principal = payload and _load_principal(db, payload["sub"], payload.get("user_id"))
+        if not principal:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired download link"
+            )
+        params = payload["params"]
+        # O acesso pode ter mudado desde que o link foi criado
+        if params.get("company_id") is not None:
+            get_company_access(params["company_id"], principal)
+        elif principal.role != models.UserRoleEnum.admin:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have access to this company"
+            )
+        return params
+
+    return dependency
 
 
 def get_admin_user(
-    current_user: models.User = Depends(get_current_user)
-) -> models.User:
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     """
     Dependency for admin-only endpoints. Raises 403 if not an admin.
     """
@@ -62,7 +114,7 @@ def get_admin_user(
 
 def get_company_access(
     company_id: int,
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ) -> bool:
     """
     Validates if the user can access a specific company. 
@@ -97,7 +149,7 @@ def get_resource_company_id(
         return resource.company_id
 
     elif resource_type == "maintenance":
-        resource = crud.get_maintenance_by_id(db, resource_id)
+        resource = crud.get_maintenance_with_machine(db, resource_id)
         if not resource:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -108,27 +160,298 @@ def get_resource_company_id(
     raise ValueError(f"Invalid resource type: {resource_type}")
 
 
+def company_scope(
+    company_id: Optional[int] = Query(None, description="Limit the operation to this company"),
+    current_user: Principal = Depends(get_current_user)
+) -> Optional[int]:
+    """
+    Company a bulk operation (import, bulk update) or a cross-company listing
+    (rules, occurrences) is limited to: the requested one (if accessible),
+    otherwise the fleet manager's own company. None means any company (admin).
+    """
+    if company_id is not None:
+        get_company_access(company_id, current_user)
+        return company_id
+    if current_user.role == models.UserRoleEnum.admin:
+        return None
+    if current_user.company_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have access to this company"
+        )
+    return current_user.company_id
+
+
+def accessible_machine(
+    machine_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> models.Machine:
+    """
+    Loads the machine and validates the user's access to its company.
+    Routes receive the loaded machine instead of fetching it again.
+    """
+    machine = crud.get_machine_by_id(db, machine_id)
+    if not machine:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Machine not found"
+        )
+    get_company_access(machine.company_id, current_user)
+    return machine
+
+
+def accessible_maintenance(
+    maintenance_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> models.Maintenance:
+    """
+    Loads the maintenance together with its machine (one query) and validates
+    the user's access to the machine's company.
+    """
+    maintenance = crud.get_maintenance_with_machine(db, maintenance_id)
+    if not maintenance:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Maintenance not found"
+        )
+    get_company_access(maintenance.machine.company_id, current_user)
+    return maintenance
+
+
+def accessible_maintenance_rule(
+    rule_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> models.MaintenanceRule:
+    """
+    Loads the recurring maintenance rule together with its machine (one query)
+    and validates the user's access to the machine's company.
+    """
+    rule = crud.get_maintenance_rule_with_machine(db, rule_id)
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Maintenance rule not found"
+        )
+    get_company_access(rule.machine.company_id, current_user)
+    return rule
+
+
+def accessible_invoice(
+    invoice_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> models.Invoice:
+    """
+    Loads the invoice and validates the user's access to its company.
+    """
+    invoice = crud.get_invoice_by_id(db, invoice_id)
+    if not invoice:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Invoice not found"
+        )
+    get_company_access(invoice.company_id, current_user)
+    return invoice
+
+
+def existing_service(
+    service_id: int,
+    db: Session = Depends(database.get_db)
+) -> models.Service:
+    """
+    Loads the service (services are visible to every user).
+    """
+    service = crud.get_service_by_id(db, service_id)
+    if not service:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Service not found"
+        )
+    return service
+
+
 def check_machine_access(
     machine_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ) -> bool:
     """
     Validates if the user has access to the specified machine.
+    Prefer `accessible_machine` when the route also needs the machine.
     """
-    company_id = get_resource_company_id(machine_id, "machine", db)
-    get_company_access(company_id, current_user)
+    accessible_machine(machine_id, current_user, db)
     return True
 
 
 def check_maintenance_access(
     maintenance_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(database.get_db)
 ) -> bool:
     """
     Validates if the user has access to the specified maintenance.
+    Prefer `accessible_maintenance` when the route also needs the maintenance.
     """
-    company_id = get_resource_company_id(maintenance_id, "maintenance", db)
-    get_company_access(company_id, current_user)
+    accessible_maintenance(maintenance_id, current_user, db)
     return True
+
+
+def _version_scope(request: Request, current_user: Principal) -> Optional[int]:
+    """
+    Tenant whose data version covers this request, or None to skip ETags.
+    Admins reading unscoped lists depend on the global version.
+    """
+    path_company_id = request.path_params.get("company_id")
+    if path_company_id is not None:
+        company_id = int(path_company_id)
+        if current_user.role == models.UserRoleEnum.admin or current_user.company_id == company_id:
+            return company_id
+        # Sem acesso: a rota devolve o 403 habitual
+        return None
+    if current_user.role == models.UserRoleEnum.admin:
+        return models.GLOBAL_VERSION_SCOPE
+    return current_user.company_id
+
+
+def _conditional_get(request: Request, db: Session, scope: Optional[int], *, shared: bool = False) -> None:
+    """
+    Raise 304 if If-None-Match has the current ETag of *scope*, otherwise
+    store it in `request.state.etag`. The global scope stands for all
+    tenants (`crud.get_combined_version`), unless the data is *shared* by
+    all of them (e.g. services), which has a version of its own.
+    """
+    if scope is None:
+        return
+
+    if scope == models.GLOBAL_VERSION_SCOPE and not shared:
+        label, version = "all", crud.get_combined_version(db)
+    else:
+        label, version = scope, crud.get_tenant_version(db, scope)
+    # A data entra no ETag: estado/dias das manutenções mudam à meia-noite sem escritas
+    etag = f'W/"{label}-{version}-{date.today().isoformat()}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag},
+        )
+    request.state.etag = etag
+
+
+def conditional_get(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> None:
+    """
+    ETag support for read endpoints, driven by the tenant data version.
+
+    Costs one primary-key lookup in `tenant_versions`. If the client's
+    If-None-Match matches, raises 304 before the route queries anything;
+    otherwise stores the ETag in `request.state.etag` for the middleware in
+    main.py to attach to the response. The version is read before the data,
+    so a concurrent write can only make the ETag older than the body (one
+    extra full response later), never newer.
+
+    Only for lists: routes reading one resource use `conditional_get_for`.
+    """
+    _conditional_get(request, db, _version_scope(request, current_user))
+
+
+def conditional_get_global(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(database.get_db)
+) -> None:
+    """
+    Same as `conditional_get` for data shared by all tenants (e.g. services).
+    """
+    _conditional_get(request, db, models.GLOBAL_VERSION_SCOPE, shared=True)
+
+
+def conditional_get_for(accessor: Callable[..., object], *, shared: bool = False) -> Callable[..., None]:
+    """
+    `conditional_get` for routes reading one resource: the ETag is only
+    checked once *accessor* (e.g. `accessible_machine`) has loaded the row and
+    checked access, so a tenant-wide ETag never turns its 404/403 into a 304.
+    FastAPI caches dependencies per request, so the route's own
+    ``Depends(accessor)`` reuses the row.
+
+    Args:
+        accessor: Dependency loading the resource or raising 404/403
+        shared: Data shared by all tenants (see `conditional_get_global`)
+    """
+
+    def dependency(
+        request: Request,
+        resource: object = Depends(accessor),
+        current_user: Principal = Depends(get_current_user),
+        db: Session = Depends(database.get_db)
+    ) -> None:
+        if shared:
+            _conditional_get(request, db, models.GLOBAL_VERSION_SCOPE, shared=True)
+        else:
+            _conditional_get(request, db, _version_scope(request, current_user))
+
+    return dependency
+
+
+def _request_key(request: Request, current_user: Principal) -> str:
+    """
+    Identity of a read: path, sorted query string, tenant, role and the ETag
+    stored by `conditional_get`. Route-level dependencies run before the
+    route's own, so the data version is read first: requests that saw
+    different versions never share a cached body or an in-flight query, and
+    a shared body is never older than the ETag sent with it.
+    """
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    role = current_user.role.value if current_user.role else ""
+    version = getattr(request.state, "etag", "")
+    return f"{request.url.path}?{query}|{current_user.company_id}|{role}|{version}"
+
+
+def response_cache(resource: str, *, shared: bool = False) -> Callable[..., cache.CachedRoute]:
+    """
+    Build a dependency describing the cache entry for the current request.
+
+    Args:
+        resource: Tag name invalidated by the crud writes of that resource
+        shared: Data is the same for every tenant (e.g. services), so
+            entries are tagged with the global scope only
+
+    Returns:
+        Dependency returning a `cache.CachedRoute`
+    """
+
+    def dependency(
+        request: Request,
+        current_user: Principal = Depends(get_current_user),
+    ) -> cache.CachedRoute:
+        tenant = current_user.company_id
+        key = _request_key(request, current_user)
+
+        path_company_id = request.path_params.get("company_id")
+        if shared or (path_company_id is None and current_user.role == models.UserRoleEnum.admin):
+            scope = models.GLOBAL_VERSION_SCOPE
+        elif path_company_id is not None:
+            scope = int(path_company_id)
+        else:
+            scope = tenant if tenant is not None else models.GLOBAL_VERSION_SCOPE
+        return cache.CachedRoute(key=key, tags=((resource, scope),))
+
+    return dependency
+
+
+def coalesced_read(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+) -> singleflight.CoalescedRoute:
+    """
+    Single-flight key for uncached tenant-scoped reads: identical concurrent
+    requests (same path, query, tenant, role and data version) share one
+    database query.
+    """
+    return singleflight.CoalescedRoute(key=_request_key(request, current_user))
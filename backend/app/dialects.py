@@ -0,0 +1,80 @@
+"""Date arithmetic that compiles on every database the backend runs on.
+
+Production runs on PostgreSQL, where ``date - date`` is a number of days and
+``date + integer`` is a date. SQLite (development, smoke tests) stores dates
+as ``YYYY-MM-DD`` text and turns both into numeric nonsense, so these
+constructs emit ``julianday``/``date`` calls there instead:
+
+* :class:`days_between` ``(a, b)``: days from *b* to *a* (``a - b``);
+* :class:`add_days` ``(day, n)``: the date *n* days after *day*;
+* :class:`week_start` ``(day)``: the Monday of the ISO week of *day*.
+
+Other dialects get the PostgreSQL form.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy import Date, Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class days_between(FunctionElement):
+    """Whole days from the second date to the first (negative if earlier)."""
+
+    type = Integer()
+    name = "days_between"
+    inherit_cache = True
+
+
+class add_days(FunctionElement):
+    """The first argument (a date) plus the second (a number of days)."""
+
+    type = Date()
+    name = "add_days"
+    inherit_cache = True
+
+
+class week_start(FunctionElement):
+    """The Monday of the (ISO) week of a date."""
+
+    type = Date()
+    name = "week_start"
+    inherit_cache = True
+
+
+@compiles(days_between)
+def _days_between(element, compiler, **kw):
+    end, start = element.clauses
+    return f"({compiler.process(end, **kw)} - {compiler.process(start, **kw)})"
+
+
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    end, start = element.clauses
+    return f"CAST(julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)}) AS INTEGER)"
+
+
+@compiles(add_days)
+def _add_days(element, compiler, **kw):
+    day, days = element.clauses
+    return f"({compiler.process(day, **kw)} + {compiler.process(days, **kw)})"
+
+
+@compiles(add_days, "sqlite")
+def _add_days_sqlite(element, compiler, **kw):
+    day, days = element.clauses
+    return f"date(julianday({compiler.process(day, **kw)}) + {compiler.process(days, **kw)})"
+
+
+@compiles(week_start)
+def _week_start(element, compiler, **kw):
+    (day,) = element.clauses
+    return f"CAST(date_trunc('week', {compiler.process(day, **kw)}) AS DATE)"
+
+
+@compiles(week_start, "sqlite")
+def _week_start_sqlite(element, compiler, **kw):
+    # Recuar 6 dias e avançar até segunda-feira (o próprio dia, se já for segunda)
+    (day,) = element.clauses
+    return f"date({compiler.process(day, **kw)}, '-6 days', 'weekday 1')"
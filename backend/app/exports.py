@@ -0,0 +1,84 @@
+"""Streaming NDJSON/CSV exports for large list endpoints.
+
+Rows are read through a server-side cursor (``yield_per``/``stream_results``)
+and encoded batch by batch, so memory stays constant regardless of how many
+rows are exported and the first bytes go out as soon as the first batch is
+fetched.
+"""
+
+from __future__ import annotations
+
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Iterator, Literal
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy.sql import Select
+
+from .database import SessionLocal
+
+EXPORT_BATCH_SIZE = 1000
+
+ExportFormat = Literal["ndjson", "csv"]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _plain(value: Any) -> Any:
+    """Convert values that the json/csv encoders do not handle natively."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_export(statement: Select, fmt: ExportFormat) -> Iterator[bytes]:
+    """
+    Yield *statement*'s rows encoded as NDJSON lines or CSV, one batch per chunk.
+
+    The generator owns its database session: it outlives the request-scoped
+    session from ``get_db`` while the response is being streamed.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            statement.execution_options(yield_per=EXPORT_BATCH_SIZE, stream_results=True)
+        )
+        columns = list(result.keys())
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for batch in result.partitions():
+                writer.writerows([[_plain(value) for value in row] for row in batch])
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                # No rows at all: still send the header line
+                yield buffer.getvalue().encode("utf-8")
+        else:
+            for batch in result.partitions():
+                yield "".join(
+                    json.dumps({key: _plain(value) for key, value in zip(columns, row)}) + "\n"
+                    for row in batch
+                ).encode("utf-8")
+    finally:
+        db.close()
+
+
+def export_response(statement: Select, fmt: ExportFormat, filename: str) -> StreamingResponse:
+    """Wrap :func:`iter_export` in a download response named ``filename.<fmt>``."""
+    return StreamingResponse(
+        iter_export(statement, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,160 @@
+"""Password hashing off the request threads.
+
+bcrypt is deliberately slow (hundreds of milliseconds of CPU per call). Run
+inline, a burst of logins fills Starlette's shared threadpool and every other
+sync route waits behind it. Here hashing and verification go to a dedicated
+process pool of ``HASH_POOL_WORKERS`` processes; at most
+``HASH_POOL_MAX_PENDING`` calls may be running or queued, and further calls
+fail fast with :class:`HashingOverloaded` (a 503, see ``main.py``). Pool
+processes run with a lower CPU priority (``HASH_POOL_NICE``), so on a busy
+host request handling is scheduled first.
+
+``BCRYPT_ROUNDS`` sets the cost factor. Hashes made with another cost are
+flagged by :func:`verify_and_update_async` so the caller can store the new
+hash; ``HASH_POOL_WORKERS=0`` hashes inline (scripts, single-user tools).
+
+This module only imports passlib so that pool processes start quickly.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_POOL_MAX_PENDING = int(os.getenv("HASH_POOL_MAX_PENDING", str(max(1, HASH_POOL_WORKERS) * 8)))
+# Prioridade mais baixa para os processos do pool: os pedidos ganham o CPU
+HASH_POOL_NICE = int(os.getenv("HASH_POOL_NICE", "10"))
+
+# min = max = default: qualquer hash com outro custo precisa de ser refeito
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashingOverloaded(Exception):
+    """Too many password hashing calls are already running or queued."""
+
+
+# ──────────────────────────────
+# Functions run in the pool processes
+# ──────────────────────────────
+def _init_worker(niceness: int) -> None:
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+# ──────────────────────────────
+# Pool with admission control
+# ──────────────────────────────
+class HashingPool:
+    """Size-limited process pool that rejects work beyond *max_pending* calls."""
+
+    def __init__(self, workers: int = HASH_POOL_WORKERS, max_pending: int = HASH_POOL_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: o processo da API tem threads (scheduler, threadpool), fork não é seguro
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(HASH_POOL_NICE,),
+                )
+            return self._executor
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingOverloaded()
+            self.pending += 1
+
+    def _release(self, _future: Any = None) -> None:
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def submit(self, fn: Callable, *args: Any) -> Future:
+        """Queue *fn* in the pool, or raise :class:`HashingOverloaded`."""
+        self._admit()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn: Callable, *args: Any) -> Any:
+        """Blocking call (sync routes and crud)."""
+        if self.workers <= 0:
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable, *args: Any) -> Any:
+        """Awaitable call: the event loop stays free while the pool works."""
+        if self.workers <= 0:
+            return fn(*args)
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = HashingPool()
+
+
+def hash_password(password: str) -> str:
+    """bcrypt hash of *password*, computed in the pool."""
+    return pool.run(_hash, password)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """``(valid, new_hash)``; *new_hash* is set when the stored cost is outdated."""
+    return pool.run(_verify_and_update, password, hashed)
+
+
+async def verify_and_update_async(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Awaitable :func:`verify_and_update`, for async routes."""
+    return await pool.run_async(_verify_and_update, password, hashed)
@@ -0,0 +1,296 @@
+"""Bulk CSV/XLSX imports for list resources (machines, maintenances).
+
+The uploaded file is parsed as a stream (``csv`` reader, or openpyxl in
+read-only mode) and handled in chunks of ``IMPORT_CHUNK_SIZE`` rows: each
+chunk is validated row by row and the valid rows are written with a single
+multi-row INSERT (executemany) and one commit. If the INSERT fails, the
+chunk is retried row by row inside savepoints so only the offending rows are
+reported. Side effects that per-row creation would repeat run once per chunk
+(data versions, in the chunk's transaction; response cache and search
+index, right after its commit) or once per import (notifications), so an
+import that stops halfway leaves no committed rows behind stale versions.
+
+Row numbers in the report are spreadsheet numbers: the header is row 1.
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import logging
+import re
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Literal, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import crud, models, schemas
+from .notifications import notify_import_summary
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+# Limite de erros devolvidos no relatório; "failed" conta todos
+IMPORT_MAX_REPORTED_ERRORS = 1000
+
+ImportFormat = Literal["csv", "xlsx"]
+
+Row = Dict[str, Any]
+
+
+class ImportRowError(ValueError):
+    """A row that parsed but cannot be imported (unknown machine, no access...)."""
+
+
+def detect_format(filename: Optional[str], fmt: Optional[ImportFormat]) -> ImportFormat:
+    """Explicit ``?format=`` wins; otherwise use the file extension."""
+    if fmt:
+        return fmt
+    suffix = (filename or "").rsplit(".", 1)[-1].lower()
+    if suffix in ("csv", "xlsx"):
+        return suffix
+    raise ValueError("Unknown file type: upload a .csv or .xlsx file or pass ?format=csv|xlsx")
+
+
+def _header(value: Any) -> str:
+    return str(value or "").strip().lower().replace(" ", "_")
+
+
+def _cell(value: Any) -> Any:
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _row(headers: List[str], values) -> Row:
+    # Células vazias ficam de fora para que os valores por omissão do schema se apliquem
+    row = {}
+    for key, value in zip(headers, values):
+        value = _cell(value)
+        if key and value is not None:
+            row[key] = value
+    return row
+
+
+def _plate_key(plate: str) -> str:
+    return re.sub(r"[^0-9A-Z]", "", plate.upper())
+
+
+def iter_rows(file: BinaryIO, fmt: ImportFormat) -> Iterator[Tuple[int, Row]]:
+    """Yield ``(row_number, {column: value})`` for each non-empty data row."""
+    if fmt == "xlsx":
+        # Importado aqui: só é preciso para XLSX
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = [_header(value) for value in next(rows, ())]
+            for number, values in enumerate(rows, start=2):
+                row = _row(headers, values)
+                if row:
+                    yield number, row
+        finally:
+            workbook.close()
+        return
+
+    # utf-8-sig: ficheiros guardados pelo Excel começam com BOM
+    reader = csv.reader(codecs.getreader("utf-8-sig")(file))
+    headers = [_header(value) for value in next(reader, [])]
+    for number, values in enumerate(reader, start=2):
+        row = _row(headers, values)
+        if row:
+            yield number, row
+
+
+def _describe(exc: Exception) -> List[str]:
+    if isinstance(exc, ValidationError):
+        return [
+            f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}"
+            for error in exc.errors()
+        ]
+    return [str(exc)]
+
+
+@dataclass
+class ImportResult:
+    """Outcome of an import, returned to the client as `schemas.ImportReport`."""
+
+    created: int = 0
+    failed: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    company_ids: Set[int] = field(default_factory=set)
+    aborted: Optional[str] = None
+
+    def add_error(self, row: int, messages: List[str]) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "errors": messages})
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "created": self.created,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "aborted": self.aborted,
+        }
+
+
+def _commit_chunk(db: Session, resource: str, company_ids: Set[int], result: ImportResult, created: int) -> None:
+    # Versões na mesma transação que as linhas: nunca há linhas sem versão nova
+    if company_ids:
+        crud.bump_tenant_version(db, *company_ids)
+    db.commit()
+    result.created += created
+    result.company_ids.update(company_ids)
+    if company_ids:
+        crud.invalidate_bulk_write(resource, company_ids)
+
+
+def _insert_chunk(db: Session, table, resource: str, rows: List[Tuple[int, Row, int]], result: ImportResult) -> None:
+    if not rows:
+        return
+    try:
+        db.execute(insert(table), [values for _, values, _ in rows])
+        _commit_chunk(db, resource, {company_id for _, _, company_id in rows}, result, len(rows))
+        return
+    except SQLAlchemyError:
+        db.rollback()
+
+    # Encontrar as linhas que a base de dados rejeita, sem perder as restantes
+    company_ids: Set[int] = set()
+    created = 0
+    for number, values, company_id in rows:
+        try:
+            with db.begin_nested():
+                db.execute(insert(table), [values])
+        except SQLAlchemyError as exc:
+            result.add_error(number, [str(getattr(exc, "orig", exc)).splitlines()[0]])
+        else:
+            created += 1
+            company_ids.add(company_id)
+    _commit_chunk(db, resource, company_ids, result, created)
+
+
+def import_rows(
+    db: Session,
+    rows: Iterator[Tuple[int, Row]],
+    prepare: Callable[[Row], Tuple[Row, int]],
+    table,
+    resource: str,
+) -> ImportResult:
+    """
+    Validate and insert *rows* chunk by chunk.
+
+    *prepare* turns a raw row into ``(column values, company_id)`` or raises
+    ``ValidationError`` / :class:`ImportRowError`; *table* is the target table
+    and *resource* the name its writes invalidate in the response cache.
+    """
+    result = ImportResult()
+    while True:
+        try:
+            chunk = list(islice(rows, IMPORT_CHUNK_SIZE))
+        except Exception as exc:
+            # Ficheiro corrompido ou codificação errada: os chunks anteriores ficam importados
+            logger.warning(f"Import aborted while reading the file: {exc}")
+            result.aborted = f"Could not read the file: {exc}"
+            break
+        if not chunk:
+            break
+        valid = []
+        for number, raw in chunk:
+            try:
+                values, company_id = prepare(raw)
+            except (ValidationError, ImportRowError) as exc:
+                result.add_error(number, _describe(exc))
+            else:
+                valid.append((number, values, company_id))
+        _insert_chunk(db, table, resource, valid, result)
+    return result
+
+
+# ──────────────────────────────
+# Resources
+# ──────────────────────────────
+def machine_preparer(
+    company_ids: Set[int],
+    default_company_id: Optional[int],
+    restrict_to: Optional[int],
+) -> Callable[[Row], Tuple[Row, int]]:
+    """
+    Validate machine rows with `schemas.MachineCreate`. Rows without
+    company_id use *default_company_id*; *restrict_to* limits rows to one
+    company (fleet managers). *company_ids* are the existing companies.
+    """
+    def prepare(raw: Row) -> Tuple[Row, int]:
+        if raw.get("company_id") is None and default_company_id is not None:
+            raw["company_id"] = default_company_id
+        machine = schemas.MachineCreate.model_validate(raw)
+        if restrict_to is not None and machine.company_id != restrict_to:
+            raise ImportRowError("company_id: you don't have access to this company")
+        if machine.company_id not in company_ids:
+            raise ImportRowError(f"company_id: company {machine.company_id} not found")
+        return machine.model_dump(), machine.company_id
+
+    return prepare
+
+
+def maintenance_preparer(db: Session, company_id: Optional[int]) -> Callable[[Row], Tuple[Row, int]]:
+    """
+    Validate maintenance rows with `schemas.MaintenanceImportRow` and resolve
+    their machine among the machines of *company_id* (all machines if None).
+    Machines are read once per import, not once per row.
+    """
+    query = db.query(models.Machine.id, models.Machine.company_id, models.Machine.license_plate)
+    if company_id is not None:
+        query = query.filter(models.Machine.company_id == company_id)
+
+    machine_companies: Dict[int, int] = {}
+    by_plate: Dict[str, Optional[int]] = {}
+    for machine_id, machine_company_id, plate in query:
+        machine_companies[machine_id] = machine_company_id
+        if plate:
+            key = _plate_key(plate)
+            # Matrícula repetida: ambígua, exige machine_id
+            by_plate[key] = None if key in by_plate else machine_id
+
+    def prepare(raw: Row) -> Tuple[Row, int]:
+        row = schemas.MaintenanceImportRow.model_validate(raw)
+        machine_id = row.machine_id
+        if machine_id is None:
+            if not row.license_plate:
+                raise ImportRowError("machine_id or license_plate is required")
+            key = _plate_key(row.license_plate)
+            if key not in by_plate:
+                raise ImportRowError(f"license_plate: no machine with plate {row.license_plate}")
+            machine_id = by_plate[key]
+            if machine_id is None:
+                raise ImportRowError(f"license_plate: several machines with plate {row.license_plate}, use machine_id")
+        elif machine_id not in machine_companies:
+            raise ImportRowError(f"machine_id: machine {machine_id} not found")
+        values = row.model_dump(exclude={"machine_id", "license_plate"})
+        values["machine_id"] = machine_id
+        return values, machine_companies[machine_id]
+
+    return prepare
+
+
+def notify_summary(db: Session, resource: str, result: ImportResult) -> None:
+    """One notification per import (admins, plus the managers of a single-company import)."""
+    if not (result.created or result.failed):
+        return
+    company_id = company_name = None
+    if len(result.company_ids) == 1:
+        company_id = next(iter(result.company_ids))
+        company = crud.get_company_by_id(db, company_id)
+        company_name = company.name if company else None
+    try:
+        notify_import_summary(db, resource, result.created, result.failed, company_id, company_name)
+    except Exception as e:
+        logger.error(f"Failed to send import summary notification: {e}")
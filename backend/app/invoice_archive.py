@@ -0,0 +1,121 @@
+"""ZIP archive of invoice PDFs, streamed while the PDFs are rendered.
+
+The invoices of the period are read in id order, ``ARCHIVE_PAGE_SIZE`` at a
+time. PDFs already in the disk cache (``invoice_pdf.py``) are added to the
+archive straight away. Missing ones are rendered by the process pool, with
+at most ``ARCHIVE_WINDOW`` renders in flight per archive, and added in the
+order they finish. Each entry is sent to the client as soon as it is
+written, so memory is bounded by one page of invoices plus the window,
+however many invoices the period has.
+
+Entries are stored without compression (the PDFs already are compressed),
+which keeps the request thread nearly idle while the pool renders.
+"""
+
+from __future__ import annotations
+
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from . import invoice_pdf, models
+from .database import SessionLocal
+
+ARCHIVE_PAGE_SIZE = 200
+ARCHIVE_MAX_WINDOW_DAYS = 366
+# Renderizações pendentes por arquivo: o suficiente para manter o pool ocupado
+ARCHIVE_WINDOW = max(1, invoice_pdf.INVOICE_PDF_WORKERS) * 4
+
+
+class _ZipStream:
+    """Write-only, unseekable file for ZipFile; :meth:`take` drains what was written."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _documents(
+    db: Session, date_from: date, date_to: date, company_id: Optional[int]
+) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """``(document, digest)`` of every invoice issued in the period, page by page."""
+    Invoice = models.Invoice
+    last_id = 0
+    while True:
+        query = (
+            db.query(Invoice)
+            .options(joinedload(Invoice.company), selectinload(Invoice.items))
+            .filter(Invoice.id > last_id, Invoice.issue_date.between(date_from, date_to))
+        )
+        if company_id is not None:
+            query = query.filter(Invoice.company_id == company_id)
+        invoices = query.order_by(Invoice.id).limit(ARCHIVE_PAGE_SIZE).all()
+        if not invoices:
+            return
+        last_id = invoices[-1].id
+        documents = [invoice_pdf.invoice_document(invoice) for invoice in invoices]
+        # Os documentos bastam: libertar as faturas da sessão mantém a memória constante
+        db.expunge_all()
+        for document in documents:
+            yield document, invoice_pdf.document_digest(document)
+
+
+def _entry_name(document: Dict[str, Any]) -> str:
+    return f"fatura_{document['invoice_number']}.pdf"
+
+
+def iter_archive(date_from: date, date_to: date, company_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield a ZIP with the PDFs of the invoices issued between *date_from* and
+    *date_to* (of *company_id*, if given), one chunk per entry.
+
+    Like ``exports.iter_export``, the generator owns its database session.
+    """
+    db = SessionLocal()
+    stream = _ZipStream()
+    pending: Dict[Future, str] = {}
+
+    def add(path: Path, name: str) -> bytes:
+        archive.write(path, name)
+        return stream.take()
+
+    try:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as archive:
+            for document, digest in _documents(db, date_from, date_to, company_id):
+                path = invoice_pdf.cache_lookup(digest)
+                if path is not None:
+                    yield add(path, _entry_name(document))
+                    continue
+
+                pending[invoice_pdf.pool.submit(document, digest)] = _entry_name(document)
+                if len(pending) >= ARCHIVE_WINDOW:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield add(future.result(), pending.pop(future))
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield add(future.result(), pending.pop(future))
+        # Diretório central, escrito ao fechar o ZipFile
+        yield stream.take()
+    finally:
+        # Cliente desligou-se a meio: não renderizar o que já ninguém vai receber
+        for future in pending:
+            future.cancel()
+        db.close()
@@ -0,0 +1,275 @@
+"""Invoice PDFs rendered in the backend and cached on disk by content.
+
+The cache key is the SHA-256 of everything printed on the PDF (invoice
+fields, items and the company's billing data) plus ``PDF_LAYOUT_VERSION``.
+A PDF is therefore rendered again only when something it shows changes, or
+when the layout version is bumped; repeat downloads are a file read. The
+same digest is the response ETag.
+
+Files are written to a temporary name and renamed, so a concurrent request
+never sees a half-written PDF. Files not served for
+``INVOICE_PDF_MAX_AGE_DAYS`` are removed by :func:`purge_cache`.
+
+Bulk rendering (see ``invoice_archive.py``) goes to a process pool of
+``INVOICE_PDF_WORKERS`` processes, one per core by default;
+``INVOICE_PDF_WORKERS=0`` renders inline. The pool processes import this
+module, so it does not import the database layer.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import orjson
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+if TYPE_CHECKING:
+    from . import models
+
+INVOICE_PDF_CACHE_DIR = Path(os.getenv("INVOICE_PDF_CACHE_DIR", "cache/invoice_pdf"))
+INVOICE_PDF_MAX_AGE_DAYS = int(os.getenv("INVOICE_PDF_MAX_AGE_DAYS", "30"))
+INVOICE_PDF_WORKERS = int(os.getenv("INVOICE_PDF_WORKERS", str(os.cpu_count() or 1)))
+# Prioridade mais baixa para os processos do pool: os pedidos ganham o CPU
+INVOICE_PDF_NICE = int(os.getenv("INVOICE_PDF_NICE", "10"))
+# Incrementar quando o modelo do PDF mudar: todos os PDFs em cache ficam obsoletos
+PDF_LAYOUT_VERSION = 1
+
+COMPANY_FIELDS = ("name", "tax_id", "address", "postal_code", "city", "country")
+
+
+def invoice_document(invoice: "models.Invoice") -> Dict[str, Any]:
+    """The data printed on the PDF of *invoice* (and only that data)."""
+    company = invoice.company
+    return {
+        "invoice_number": invoice.invoice_number,
+        "issue_date": invoice.issue_date,
+        "due_date": invoice.due_date,
+        "company": {field: getattr(company, field) or "" for field in COMPANY_FIELDS},
+        "items": [
+            {
+                "description": item.description or "",
+                "quantity": item.quantity,
+                "unit_price": item.unit_price,
+                "tax_rate": item.tax_rate,
+                "total": item.total,
+            }
+            for item in sorted(invoice.items, key=lambda item: item.id)
+        ],
+        "subtotal": invoice.subtotal or 0.0,
+        "tax_total": invoice.tax_total or 0.0,
+        "total": invoice.total or 0.0,
+        "payment_method": invoice.payment_method,
+        "notes": invoice.notes,
+    }
+
+
+def document_digest(document: Dict[str, Any]) -> str:
+    payload = orjson.dumps({"layout": PDF_LAYOUT_VERSION, **document}, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(payload).hexdigest()
+
+
+def render_pdf(document: Dict[str, Any]) -> bytes:
+    """Render the invoice PDF with ReportLab."""
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name="Center", alignment=1))
+    styles.add(ParagraphStyle(name="Right", alignment=2))
+
+    elements = [
+        Paragraph(f"FATURA Nº {document['invoice_number']}", styles["Heading1"]),
+        Spacer(1, 12),
+    ]
+
+    # Data de emissão e vencimento
+    date_table = Table(
+        [
+            ["Data de emissão:", str(document["issue_date"])],
+            ["Data de vencimento:", str(document["due_date"])],
+        ],
+        colWidths=[120, 120],
+    )
+    date_table.setStyle(TableStyle([
+        ("ALIGN", (0, 0), (0, -1), "LEFT"),
+        ("ALIGN", (1, 0), (1, -1), "RIGHT"),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
+        ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
+    ]))
+    elements += [date_table, Spacer(1, 20)]
+
+    # Informações da empresa
+    company = document["company"]
+    company_table = Table(
+        [
+            ["Empresa:", company["name"]],
+            ["NIF:", company["tax_id"]],
+            ["Morada:", company["address"]],
+            ["Código Postal:", company["postal_code"]],
+            ["Cidade:", company["city"]],
+            ["País:", company["country"]],
+        ],
+        colWidths=[120, 300],
+    )
+    company_table.setStyle(TableStyle([
+        ("ALIGN", (0, 0), (0, -1), "LEFT"),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ("FONTNAME", (0, 0), (0, -1), "Helvetica-Bold"),
+        ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
+    ]))
+    elements += [company_table, Spacer(1, 20)]
+
+    # Itens e totais
+    item_data = [["Descrição", "Qtd", "Preço Unit.", "IVA %", "Total"]]
+    for item in document["items"]:
+        item_data.append([
+            item["description"],
+            f"{item['quantity']:.2f}",
+            f"{item['unit_price']:.2f} €",
+            f"{item['tax_rate']:.0f}%",
+            f"{item['total']:.2f} €",
+        ])
+    item_data.append(["", "", "", "Subtotal:", f"{document['subtotal']:.2f} €"])
+    item_data.append(["", "", "", "IVA Total:", f"{document['tax_total']:.2f} €"])
+    item_data.append(["", "", "", "TOTAL:", f"{document['total']:.2f} €"])
+
+    item_table = Table(item_data, colWidths=[200, 50, 80, 80, 80])
+    item_table.setStyle(TableStyle([
+        ("ALIGN", (0, 0), (0, -1), "LEFT"),
+        ("ALIGN", (1, 0), (-1, -1), "RIGHT"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("INNERGRID", (0, 0), (-1, -4), 0.25, colors.black),
+        ("BOX", (0, 0), (-1, -4), 0.25, colors.black),
+        ("LINEABOVE", (3, -3), (-1, -3), 1, colors.black),
+        ("LINEABOVE", (3, -1), (-1, -1), 2, colors.black),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTNAME", (3, -3), (3, -1), "Helvetica-Bold"),
+        ("FONTNAME", (-1, -1), (-1, -1), "Helvetica-Bold"),
+    ]))
+    elements += [item_table, Spacer(1, 20)]
+
+    # Informações de pagamento
+    if document["payment_method"]:
+        elements.append(Paragraph(f"Método de Pagamento: {document['payment_method']}", styles["Normal"]))
+    if document["notes"]:
+        elements += [
+            Spacer(1, 10),
+            Paragraph("Notas:", styles["Normal"]),
+            Paragraph(document["notes"], styles["Normal"]),
+        ]
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def cache_lookup(digest: str) -> Optional[Path]:
+    """Path of the cached PDF with *digest*, or None if it was not rendered yet."""
+    path = INVOICE_PDF_CACHE_DIR / f"{digest}.pdf"
+    try:
+        # Marca o uso, para o purge_cache não apagar PDFs pedidos com frequência
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def cached_pdf(document: Dict[str, Any], digest: str) -> Path:
+    """Path of the PDF of *document* (see `document_digest`), rendered only on a cache miss."""
+    path = cache_lookup(digest)
+    if path is not None:
+        return path
+
+    path = INVOICE_PDF_CACHE_DIR / f"{digest}.pdf"
+    INVOICE_PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    pdf = render_pdf(document)
+    fd, tmp_path = tempfile.mkstemp(dir=INVOICE_PDF_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(pdf)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+# ──────────────────────────────
+# Render pool
+# ──────────────────────────────
+def _init_worker(niceness: int) -> None:
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _render_to_cache(document: Dict[str, Any], digest: str) -> Path:
+    return cached_pdf(document, digest)
+
+
+class RenderPool:
+    """Process pool rendering PDFs into the cache, created on first use."""
+
+    def __init__(self, workers: int = INVOICE_PDF_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: o processo da API tem threads (scheduler, threadpool), fork não é seguro
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(INVOICE_PDF_NICE,),
+                )
+            return self._executor
+
+    def submit(self, document: Dict[str, Any], digest: str) -> Future:
+        """Render *document* into the cache; the future's result is its path."""
+        if self.workers <= 0:
+            future: Future = Future()
+            try:
+                future.set_result(_render_to_cache(document, digest))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._get_executor().submit(_render_to_cache, document, digest)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pool = RenderPool()
+
+
+def purge_cache(max_age_days: int = INVOICE_PDF_MAX_AGE_DAYS) -> int:
+    """Delete cached PDFs not served for *max_age_days*; returns how many."""
+    if not INVOICE_PDF_CACHE_DIR.exists():
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in INVOICE_PDF_CACHE_DIR.iterdir():
+        try:
+            if path.suffix in (".pdf", ".tmp") and path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
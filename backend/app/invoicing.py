@@ -0,0 +1,281 @@
+"""Recurring invoice generation in set-based batches.
+
+A `models.BillingRun` generates one month's invoices for every company with
+billing plans due that month (`models.BillingPlan`). Companies are handled
+in id order, ``BILLING_RUN_BATCH_COMPANIES`` at a time. Each batch is one
+transaction:
+
+1. one query reads the due plans of the batch, joined with their service
+   and machine (no per-item service lookups);
+2. invoice numbers are reserved for the whole batch at once;
+3. invoices and items are written with two multi-row INSERTs;
+4. the run's checkpoint (``last_company_id``) and the data versions are
+   updated and committed together with the invoices.
+
+If the process dies mid-run, the committed batches stay and the run resumes
+after its checkpoint; the unique index on ``(billing_run_id, company_id)``
+guarantees a company is never invoiced twice by the same run. A run is
+claimed with a conditional UPDATE, so two workers never process it at once;
+a ``running`` run without progress for ``BILLING_RUN_STALE_SECONDS`` is
+considered crashed and may be claimed again.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, extract, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+BILLING_RUN_BATCH_COMPANIES = int(os.getenv("BILLING_RUN_BATCH_COMPANIES", "500"))
+BILLING_RUN_STALE_SECONDS = int(os.getenv("BILLING_RUN_STALE_SECONDS", "300"))
+# Prazo de pagamento por omissão das faturas geradas
+BILLING_DUE_DAYS = 30
+
+Plan = models.BillingPlan
+Run = models.BillingRun
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _plans_due(period: date):
+    """Filters for the active plans billed in the month starting on *period*."""
+    period_end = period.replace(day=monthrange(period.year, period.month)[1])
+    # extract() é double precision antes do PostgreSQL 14, sem operador %: converter para inteiro
+    months = (period.year * 12 + period.month) - (
+        cast(extract("year", Plan.start_date), Integer) * 12 + cast(extract("month", Plan.start_date), Integer)
+    )
+    return (
+        Plan.is_active.is_(True),
+        Plan.start_date <= period_end,
+        or_(Plan.end_date.is_(None), Plan.end_date >= period),
+        months % Plan.interval_months == 0,
+        models.Service.is_active.is_(True),
+    )
+
+
+# ──────────────────────────────
+# Runs
+# ──────────────────────────────
+def get_or_create_run(
+    db: Session,
+    period: date,
+    *,
+    issue_date: Optional[date] = None,
+    due_date: Optional[date] = None,
+    invoice_status: models.InvoiceStatus = models.InvoiceStatus.DRAFT,
+) -> Run:
+    """The run of *period*'s month; created (pending) if there is none yet."""
+    period = month_start(period)
+    run = db.query(Run).filter(Run.period == period).first()
+    if run:
+        return run
+
+    issue_date = issue_date or datetime.now().date()
+    run = Run(
+        period=period,
+        issue_date=issue_date,
+        due_date=due_date or issue_date + timedelta(days=BILLING_DUE_DAYS),
+        invoice_status=invoice_status,
+        status=models.BillingRunStatus.pending,
+    )
+    db.add(run)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Criada entretanto por outro pedido ou pela tarefa agendada
+        db.rollback()
+        return db.query(Run).filter(Run.period == period).one()
+    db.refresh(run)
+    return run
+
+
+def claim_run(db: Session, run_id: int) -> bool:
+    """Mark the run as running if it is pending, failed or stale; False if not."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=BILLING_RUN_STALE_SECONDS)
+    result = db.execute(
+        update(Run)
+        .where(
+            Run.id == run_id,
+            or_(
+                Run.status.in_([models.BillingRunStatus.pending, models.BillingRunStatus.failed]),
+                (Run.status == models.BillingRunStatus.running) & (Run.updated_at < stale),
+            ),
+        )
+        .values(status=models.BillingRunStatus.running, updated_at=now, error=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _next_companies(db: Session, run: Run) -> List[int]:
+    return list(
+        db.scalars(
+            select(Plan.company_id)
+            .join(models.Service, models.Service.id == Plan.service_id)
+            .where(Plan.company_id > run.last_company_id, *_plans_due(run.period))
+            .group_by(Plan.company_id)
+            .order_by(Plan.company_id)
+            .limit(BILLING_RUN_BATCH_COMPANIES)
+        )
+    )
+
+
+def _build_invoices(
+    db: Session, run: Run, company_ids: List[int]
+) -> Tuple[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+    """Invoice rows and their item rows for *company_ids*, from one query."""
+    rows = db.execute(
+        select(
+            Plan.company_id,
+            Plan.service_id,
+            Plan.machine_id,
+            Plan.quantity,
+            Plan.unit_price,
+            Plan.tax_rate,
+            Plan.description,
+            models.Service.name.label("service_name"),
+            models.Service.unit_price.label("service_price"),
+            models.Service.tax_rate.label("service_tax_rate"),
+            models.Machine.name.label("machine_name"),
+        )
+        .join(models.Service, models.Service.id == Plan.service_id)
+        .outerjoin(models.Machine, models.Machine.id == Plan.machine_id)
+        .where(Plan.company_id.in_(company_ids), *_plans_due(run.period))
+        .order_by(Plan.company_id, Plan.id)
+    ).all()
+
+    period_label = f"{run.period.month:02d}/{run.period.year}"
+    by_company: Dict[int, List[Dict[str, Any]]] = {}
+    for row in rows:
+        unit_price = row.unit_price if row.unit_price is not None else row.service_price
+        tax_rate = row.tax_rate if row.tax_rate is not None else row.service_tax_rate
+        subtotal = unit_price * row.quantity
+        tax_amount = subtotal * (tax_rate / 100)
+        description = row.description or (
+            f"{row.service_name} ({row.machine_name})" if row.machine_name else row.service_name
+        )
+        by_company.setdefault(row.company_id, []).append({
+            "service_id": row.service_id,
+            "machine_id": row.machine_id,
+            "quantity": row.quantity,
+            "description": f"{description} - {period_label}",
+            "unit_price": unit_price,
+            "tax_rate": tax_rate,
+            "subtotal": subtotal,
+            "tax_amount": tax_amount,
+            "total": subtotal + tax_amount,
+        })
+
+    invoices, items = [], []
+    for company_id, company_items in by_company.items():
+        subtotal = sum(item["subtotal"] for item in company_items)
+        tax_total = sum(item["tax_amount"] for item in company_items)
+        invoices.append({
+            "company_id": company_id,
+            "issue_date": run.issue_date,
+            "due_date": run.due_date,
+            "status": run.invoice_status,
+            "subtotal": subtotal,
+            "tax_total": tax_total,
+            "total": subtotal + tax_total,
+            "notes": f"Faturação recorrente {period_label}",
+            "billing_run_id": run.id,
+        })
+        items.append(company_items)
+    return invoices, items
+
+
+def _write_batch(db: Session, run: Run, company_ids: List[int]) -> int:
+    invoices, items = _build_invoices(db, run, company_ids)
+    numbers = crud.allocate_invoice_numbers(db, len(invoices), run.issue_date)
+    for invoice, number in zip(invoices, numbers):
+        invoice["invoice_number"] = number
+
+    if invoices:
+        invoice_ids = db.scalars(
+            insert(models.Invoice).returning(models.Invoice.id, sort_by_parameter_order=True),
+            invoices,
+        ).all()
+        db.execute(
+            insert(models.InvoiceItem),
+            [
+                {**item, "invoice_id": invoice_id}
+                for invoice_id, company_items in zip(invoice_ids, items)
+                for item in company_items
+            ],
+        )
+
+    run.last_company_id = company_ids[-1]
+    run.invoices_created += len(invoices)
+    run.updated_at = datetime.utcnow()
+    # record_bulk_write faz o commit: faturas, ponto de retoma e versões juntos
+    crud.record_bulk_write(db, "invoices", company_ids)
+    return len(invoices)
+
+
+def execute_run(db: Session, run_id: int) -> Optional[Run]:
+    """
+    Claim the run and generate its remaining invoices batch by batch.
+    Returns None if the run is completed or being processed elsewhere.
+    """
+    if not claim_run(db, run_id):
+        return None
+    run = db.get(Run, run_id)
+    logger.info(f"Billing run {run.id} ({run.period}) started after company {run.last_company_id}")
+    try:
+        while True:
+            company_ids = _next_companies(db, run)
+            if not company_ids:
+                break
+            created = _write_batch(db, run, company_ids)
+            logger.info(f"Billing run {run.id}: {created} invoices up to company {company_ids[-1]}")
+        run.status = models.BillingRunStatus.completed
+        run.finished_at = run.updated_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        run.status = models.BillingRunStatus.failed
+        run.error = str(e)[:500]
+        run.updated_at = datetime.utcnow()
+        db.commit()
+        logger.error(f"Billing run {run.id} failed after company {run.last_company_id}: {e}")
+        raise
+    logger.info(f"Billing run {run.id} completed: {run.invoices_created} invoices")
+    return run
+
+
+def execute_run_in_background(run_id: int) -> None:
+    """`execute_run` with its own session (background tasks, scheduler)."""
+    db = SessionLocal()
+    try:
+        execute_run(db, run_id)
+    except Exception:
+        # Já registado e marcado como failed; pode ser retomado
+        pass
+    finally:
+        db.close()
+
+
+def stale_run_ids(db: Session) -> List[int]:
+    """Runs left running by a crashed process (no progress for a while)."""
+    stale = datetime.utcnow() - timedelta(seconds=BILLING_RUN_STALE_SECONDS)
+    return list(
+        db.scalars(
+            select(Run.id).where(Run.status == models.BillingRunStatus.running, Run.updated_at < stale)
+        )
+    )
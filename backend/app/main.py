@@ -1,11 +1,15 @@
 import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from .database import Base, engine
 from . import models
-from .routers import companies, machines, maintenances, auth_router, notifications_router
+from .hashing import HashingOverloaded, pool as hashing_pool
+from .invoice_pdf import pool as invoice_pdf_pool
+from .routers import companies, machines, maintenances, maintenance_rules, auth_router, notifications_router, search_router, metrics_router
 from .routers.billing_router import router as billing_router  # Explicit import
 from .alarms import start_scheduler
 from .create_admin import create_admin_user
@@ -35,6 +39,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Listas JSON comprimem muito; respostas pequenas não compensam o custo
+app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+@app.middleware("http")
+async def add_etag_header(request: Request, call_next):
+    """
+    Attaches the ETag computed by `dependencies.conditional_get`, also to
+    routes that return a Response directly (fast/projection paths).
+    """
+    response = await call_next(request)
+    etag = getattr(request.state, "etag", None)
+    if etag and response.status_code == 200:
+        response.headers["ETag"] = etag
+        # O cliente pode guardar a resposta, mas revalida sempre
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(request: Request, exc: HashingOverloaded):
+    """
+    Too many logins/password changes queued for the hashing pool: shed load
+    instead of letting them pile up.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication service busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
 @app.on_event("startup")
 def startup_event():
     """
@@ -47,13 +80,24 @@ def startup_event():
     # create_admin_user() # Uncomment if you need a separate general admin
     start_scheduler()
 
+@app.on_event("shutdown")
+def shutdown_event():
+    """
+    Stops the password hashing and PDF rendering processes.
+    """
+    hashing_pool.shutdown()
+    invoice_pdf_pool.shutdown()
+
 # Register routes
 app.include_router(auth_router.router)
 app.include_router(companies.router)
 app.include_router(machines.router)
+app.include_router(maintenance_rules.router)  # antes de maintenances: /maintenances/{id}
 app.include_router(maintenances.router)
 app.include_router(notifications_router.router)
 app.include_router(billing_router)
+app.include_router(search_router.router)
+app.include_router(metrics_router.router)
 
 @app.get("/")
 def home():
@@ -1,8 +1,9 @@
 import enum
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Enum, Boolean, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Enum, Boolean, Float, Index, case, func
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime
 from .database import Base
+from .dialects import add_days, days_between
 
 class MachineTypeEnum(str, enum.Enum):
     """Defines machine types."""
@@ -25,8 +26,8 @@ class User(Base):
     email = Column(String, index=True)
     full_name = Column(String)
     hashed_password = Column(String, nullable=False)
-    role = Column(Enum(UserRoleEnum), default=UserRoleEnum.fleet_manager)
-    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True)
+    role = Column(Enum(UserRoleEnum), default=UserRoleEnum.fleet_manager, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=True, index=True)
     is_active = Column(Boolean, default=True)
     phone_number = Column(String(20), nullable=True)
     notifications_enabled = Column(Boolean, default=True)
@@ -79,16 +80,16 @@ class Machine(Base):
     __tablename__ = "machines"
 
     id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    type = Column(Enum(MachineTypeEnum), nullable=False)
-    company_id = Column(Integer, ForeignKey("companies.id"))
+    name = Column(String, nullable=False, index=True)
+    type = Column(Enum(MachineTypeEnum), nullable=False, index=True)
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
     
     # Campos comuns para ambos os tipos
     brand = Column(String, nullable=True)
     model = Column(String, nullable=True)
     year = Column(Integer, nullable=True)
     serial_number = Column(String, nullable=True)
-    purchase_date = Column(Date, nullable=True)
+    purchase_date = Column(Date, nullable=True, index=True)
     
     # Campos específicos para camiões
     license_plate = Column(String, nullable=True)
@@ -104,6 +105,11 @@ class Machine(Base):
         back_populates="machine",
         cascade="all, delete-orphan"
     )
+    maintenance_rules = relationship(
+        "MaintenanceRule",
+        back_populates="machine",
+        cascade="all, delete-orphan"
+    )
 
     invoice_items = relationship(
         "InvoiceItem",
@@ -112,20 +118,76 @@ class Machine(Base):
     
 
 
+# Número de dias em que uma manutenção pendente é considerada "próxima"
+UPCOMING_WINDOW_DAYS = 7
+
+
+class MaintenanceStatusEnum(str, enum.Enum):
+    """Defines the server-computed maintenance states."""
+    completed = "completed"
+    overdue = "overdue"
+    upcoming = "upcoming"
+    scheduled = "scheduled"
+
+
 class Maintenance(Base):
     """Represents a maintenance record for a machine."""
     __tablename__ = "maintenances"
+    __table_args__ = (
+        Index("ix_maintenances_completed_scheduled_date", "completed", "scheduled_date"),
+        # No máximo uma manutenção materializada por ocorrência de uma regra
+        Index("ux_maintenances_rule_occurrence", "rule_id", "occurrence_date", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
-    machine_id = Column(Integer, ForeignKey("machines.id"))
+    machine_id = Column(Integer, ForeignKey("machines.id"), index=True)
     type = Column(String, nullable=False)
-    scheduled_date = Column(Date, nullable=False)
+    scheduled_date = Column(Date, nullable=False, index=True)
     completed = Column(Boolean, default=False)
     notes = Column(String, nullable=True)
+    # Ocorrência (concluída ou editada) de uma regra recorrente; data original da ocorrência
+    rule_id = Column(Integer, ForeignKey("maintenance_rules.id", ondelete="SET NULL"), nullable=True)
+    occurrence_date = Column(Date, nullable=True)
+
+    # Calculados em SQL (relativos a CURRENT_DATE) em vez de no cliente; ver dialects.py
+    days_delta = column_property(days_between(scheduled_date, func.current_date()))
+    status = column_property(
+        case(
+            (completed.is_(True), MaintenanceStatusEnum.completed.value),
+            (scheduled_date < func.current_date(), MaintenanceStatusEnum.overdue.value),
+            (
+                scheduled_date <= add_days(func.current_date(), UPCOMING_WINDOW_DAYS),
+                MaintenanceStatusEnum.upcoming.value,
+            ),
+            else_=MaintenanceStatusEnum.scheduled.value,
+        )
+    )
 
     machine = relationship("Machine", back_populates="maintenances")
 
 
+class MaintenanceRule(Base):
+    """
+    A periodic maintenance (every *interval_days* days, or every
+    *interval_months* calendar months on the anchor's day) from *anchor_date*
+    until *end_date*. Occurrences are expanded per query window (recurrence.py);
+    only completed or edited occurrences are stored as `Maintenance` rows.
+    """
+    __tablename__ = "maintenance_rules"
+
+    id = Column(Integer, primary_key=True)
+    machine_id = Column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=False, index=True)
+    type = Column(String, nullable=False)
+    interval_days = Column(Integer, nullable=True)
+    interval_months = Column(Integer, nullable=True)
+    anchor_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=True)
+    notes = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    machine = relationship("Machine", back_populates="maintenance_rules")
+
+
 
 class InvoiceStatus(str, enum.Enum):
     """Define os estados possíveis de uma fatura."""
@@ -154,13 +216,19 @@ class Service(Base):
 class Invoice(Base):
     """Representa uma fatura emitida para uma empresa."""
     __tablename__ = "invoices"
+    __table_args__ = (
+        # Usado pela tarefa que marca faturas vencidas (status = sent AND due_date < hoje)
+        Index("ix_invoices_status_due_date", "status", "due_date"),
+        # Uma fatura por empresa em cada execução de faturação (retomar não duplica)
+        Index("ux_invoices_billing_run_company", "billing_run_id", "company_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     invoice_number = Column(String, unique=True, nullable=False)
-    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False)
-    issue_date = Column(Date, nullable=False, default=lambda: datetime.now().date())
-    due_date = Column(Date, nullable=False)
-    status = Column(Enum(InvoiceStatus), default=InvoiceStatus.DRAFT)
+    company_id = Column(Integer, ForeignKey("companies.id"), nullable=False, index=True)
+    issue_date = Column(Date, nullable=False, default=lambda: datetime.now().date(), index=True)
+    due_date = Column(Date, nullable=False, index=True)
+    status = Column(Enum(InvoiceStatus), default=InvoiceStatus.DRAFT, index=True)
     
     # Valores calculados
     subtotal = Column(Float, default=0.0)
@@ -171,6 +239,8 @@ class Invoice(Base):
     notes = Column(String, nullable=True)
     payment_method = Column(String, nullable=True)
     payment_date = Column(Date, nullable=True)
+    # Execução de faturação recorrente que gerou a fatura (None se criada à mão)
+    billing_run_id = Column(Integer, ForeignKey("billing_runs.id"), nullable=True)
     
     # Relacionamentos
     company = relationship("Company", back_populates="invoices")
@@ -201,4 +271,92 @@ class InvoiceItem(Base):
     # Relacionamentos
     invoice = relationship("Invoice", back_populates="items")
     service = relationship("Service", back_populates="invoice_items")
-    machine = relationship("Machine", back_populates="invoice_items")
\ No newline at end of file
+    machine = relationship("Machine", back_populates="invoice_items")
+
+
+class BillingPlan(Base):
+    """
+    Serviço faturado a uma empresa a cada *interval_months* meses (opcionalmente
+    por máquina), desde *start_date* até *end_date*. As faturas são geradas em
+    lote pelas execuções de faturação (invoicing.py).
+    """
+    __tablename__ = "billing_plans"
+
+    id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    machine_id = Column(Integer, ForeignKey("machines.id", ondelete="CASCADE"), nullable=True, index=True)
+    quantity = Column(Float, nullable=False, default=1.0)
+    unit_price = Column(Float, nullable=True)  # Se vazio, usa o preço do serviço
+    tax_rate = Column(Float, nullable=True)    # Se vazio, usa a taxa do serviço
+    description = Column(String, nullable=True)
+    interval_months = Column(Integer, nullable=False, default=1)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=True)
+    is_active = Column(Boolean, default=True)
+
+
+class BillingRunStatus(str, enum.Enum):
+    """Estados de uma execução de faturação."""
+    pending = "pending"
+    running = "running"
+    completed = "completed"
+    failed = "failed"
+
+
+class BillingRun(Base):
+    """
+    Geração das faturas de um mês para todas as empresas com planos ativos.
+    Avança por lotes de empresas (por id); *last_company_id* é o ponto de
+    retoma, gravado na mesma transação que as faturas do lote.
+    """
+    __tablename__ = "billing_runs"
+
+    id = Column(Integer, primary_key=True)
+    period = Column(Date, nullable=False, unique=True)  # Primeiro dia do mês faturado
+    issue_date = Column(Date, nullable=False)
+    due_date = Column(Date, nullable=False)
+    # native_enum=False: VARCHAR, sem tipos enum a criar nas migrações
+    invoice_status = Column(Enum(InvoiceStatus, native_enum=False), nullable=False, default=InvoiceStatus.DRAFT)
+    status = Column(Enum(BillingRunStatus, native_enum=False), nullable=False, default=BillingRunStatus.pending)
+    last_company_id = Column(Integer, nullable=False, default=0)
+    invoices_created = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+# Âmbito da versão "global" (listas de admin sem filtro de empresa, serviços)
+GLOBAL_VERSION_SCOPE = 0
+
+
+class TenantVersion(Base):
+    """
+    Monotonic data version per company, bumped by every write to that company's
+    data. Row GLOBAL_VERSION_SCOPE is bumped by writes to data shared by all
+    tenants (services); unscoped admin reads use the sum of all rows. Used for ETags.
+    """
+    __tablename__ = "tenant_versions"
+
+    # Sem ForeignKey: 0 é o âmbito global, não uma empresa
+    company_id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class RefreshToken(Base):
+    """
+    Long-lived, single-use token that renews access tokens without a password.
+    Only the SHA-256 of the token is stored. Each refresh rotates it within the
+    same family; presenting a rotated token again revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
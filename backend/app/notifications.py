@@ -4,11 +4,11 @@ import vonage
 import os
 import logging
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
-from .models import User, UserRoleEnum
+from .models import Company, User, UserRoleEnum
 from .crud import get_users_by_company, get_user_by_id
 from .email_service import send_email
 
@@ -223,6 +223,59 @@ def notify_maintenance_completed(db: Session, machine_name: str, maintenance_typ
     # Notify company managers
     notify_company_managers(db, company_id, message)
 
+def notify_maintenances_completed_bulk(db: Session, completed_by_company: Dict[int, int]):
+    """Notify once per bulk completion (admins get the total, managers their company's count)"""
+    total = sum(completed_by_company.values())
+    if not total:
+        return
+
+    # Notify admins
+    notify_admins(db, unidecode(f"{total} manutenções concluídas em lote"))
+
+    # Notify company managers
+    names = dict(
+        db.query(Company.id, Company.name).filter(Company.id.in_(list(completed_by_company))).all()
+    )
+    for company_id, count in completed_by_company.items():
+        message = unidecode(
+            f"{count} manutenções da empresa '{names.get(company_id, company_id)}' concluídas em lote"
+        )
+        notify_company_managers(db, company_id, message)
+
+def notify_invoices_overdue(db: Session, overdue_by_company: Dict[int, Tuple[int, float]]):
+    """Notify once per overdue sweep (admins get the totals, managers their company's)"""
+    if not overdue_by_company:
+        return
+    count = sum(count for count, _ in overdue_by_company.values())
+    amount = sum(amount for _, amount in overdue_by_company.values())
+
+    # Notify admins
+    notify_admins(db, unidecode(f"{count} faturas passaram a vencidas ({amount:.2f} EUR)"))
+
+    # Notify company managers
+    names = dict(
+        db.query(Company.id, Company.name).filter(Company.id.in_(list(overdue_by_company))).all()
+    )
+    for company_id, (count, amount) in overdue_by_company.items():
+        message = unidecode(
+            f"{count} faturas da empresa '{names.get(company_id, company_id)}' "
+            f"passaram a vencidas ({amount:.2f} EUR)"
+        )
+        notify_company_managers(db, company_id, message)
+
+def notify_import_summary(db: Session, resource: str, created: int, failed: int,
+                          company_id: Optional[int] = None, company_name: Optional[str] = None):
+    """Single notification for a bulk import, instead of one per imported row"""
+    target = f" para a empresa '{company_name}'" if company_name else ""
+    message = unidecode(f"Importação de {resource}{target}: {created} criados, {failed} com erros")
+
+    # Notify admins
+    notify_admins(db, message)
+
+    # Notify company managers (só quando a importação é de uma empresa)
+    if company_id is not None:
+        notify_company_managers(db, company_id, message)
+
 def notify_new_user_created(db: Session, username: str, role: str, company_name: Optional[str] = None):
     """Notify admins about a new user being created"""
     if company_name:
@@ -0,0 +1,208 @@
+"""Sparse fieldsets and embedded relations for list endpoints.
+
+    ?fields=id,name              only these columns are selected and returned
+    ?embed=company,machine       related rows are joined in and nested as
+                                 {"company": {"id": 1, "name": "..."}}
+
+Both are translated into a single column-limited SELECT (embeds are LEFT
+OUTER JOINs), so neither the ORM objects nor the unused columns are ever
+loaded, and clients no longer have to re-join names on their side. Rows are
+encoded with the orjson response from ``serialization.py``.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from . import models
+from .serialization import ORJSONResponse
+
+EMBED_SEPARATOR = "__"
+
+
+@dataclass(frozen=True)
+class Embed:
+    """A to-one relation that can be expanded with ``?embed=``."""
+
+    columns: Dict[str, Any]
+    # (target, onclause) pairs, in join order
+    joins: Tuple[Tuple[Any, Any], ...] = ()
+
+
+@dataclass(frozen=True)
+class Projection:
+    """Columns and relations a list endpoint is allowed to project."""
+
+    model: Any
+    fields: Dict[str, Any]
+    tenant_column: Any
+    embeds: Dict[str, Embed] = field(default_factory=dict)
+    # Inner joins always needed, e.g. to reach the tenant column
+    joins: Tuple[Tuple[Any, Any], ...] = ()
+
+
+@dataclass
+class Selection:
+    """The fields and embeds requested for one call."""
+
+    projection: Projection
+    fields: List[str]
+    embeds: List[str]
+
+    def statement(self, company_id: Optional[int] = None) -> Select:
+        """Build the SELECT, restricted to *company_id* when given."""
+        projection = self.projection
+        columns = [projection.fields[name].label(name) for name in self.fields]
+        for embed_name in self.embeds:
+            columns.extend(
+                column.label(f"{embed_name}{EMBED_SEPARATOR}{name}")
+                for name, column in projection.embeds[embed_name].columns.items()
+            )
+
+        statement = select(*columns).select_from(projection.model)
+        joined = set()
+        for target, onclause in projection.joins:
+            statement = statement.join(target, onclause)
+            joined.add(target)
+        for embed_name in self.embeds:
+            for target, onclause in projection.embeds[embed_name].joins:
+                if target not in joined:
+                    statement = statement.outerjoin(target, onclause)
+                    joined.add(target)
+
+        if company_id is not None:
+            statement = statement.where(projection.tenant_column == company_id)
+        return statement
+
+    def shape(self, rows: Iterable[Any]) -> List[dict]:
+        """Nest the ``embed__column`` labels of each row under the embed name."""
+        embeds = {name: list(self.projection.embeds[name].columns) for name in self.embeds}
+        shaped = []
+        for row in rows:
+            item = {name: row[name] for name in self.fields}
+            for embed_name, names in embeds.items():
+                nested = {name: row[f"{embed_name}{EMBED_SEPARATOR}{name}"] for name in names}
+                # LEFT JOIN without a match: the whole relation is missing
+                item[embed_name] = nested if any(v is not None for v in nested.values()) else None
+            shaped.append(item)
+        return shaped
+
+    def response(self, db: Session, statement: Select) -> ORJSONResponse:
+        """Execute *statement* (built from :meth:`statement`) and encode it."""
+        return ORJSONResponse(self.shape(db.execute(statement).mappings()))
+
+
+def _split(raw: Optional[str]) -> List[str]:
+    return [part.strip() for part in (raw or "").split(",") if part.strip()]
+
+
+def projection_query(projection: Projection) -> Callable[..., Optional[Selection]]:
+    """
+    Build a FastAPI dependency that parses ``fields`` and ``embed``.
+
+    The dependency returns None when neither parameter is given, so routes can
+    keep their regular ORM/response_model path for unchanged clients.
+    """
+
+    def dependency(fields: Optional[str] = None, embed: Optional[str] = None) -> Optional[Selection]:
+        if fields is None and embed is None:
+            return None
+
+        names = _split(fields) or list(projection.fields)
+        unknown = [name for name in names if name not in projection.fields]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown field(s): {', '.join(unknown)}",
+            )
+
+        embeds = _split(embed)
+        unknown = [name for name in embeds if name not in projection.embeds]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot embed: {', '.join(unknown)}",
+            )
+
+        # dict.fromkeys keeps the requested order and drops duplicates
+        return Selection(projection, list(dict.fromkeys(names)), list(dict.fromkeys(embeds)))
+
+    return dependency
+
+
+# ──────────────────────────────
+# Projections per resource
+# ──────────────────────────────
+def _columns(model, names: Iterable[str]) -> Dict[str, Any]:
+    return {name: getattr(model, name) for name in names}
+
+
+COMPANY_EMBED_COLUMNS = _columns(models.Company, ("id", "name"))
+
+COMPANY_PROJECTION = Projection(
+    model=models.Company,
+    fields=_columns(models.Company, (
+        "id", "name", "address", "logo_path", "tax_id", "postal_code", "city",
+        "country", "billing_email", "phone", "payment_method", "iban",
+    )),
+    tenant_column=models.Company.id,
+)
+
+MACHINE_PROJECTION = Projection(
+    model=models.Machine,
+    fields=_columns(models.Machine, (
+        "id", "name", "type", "company_id", "brand", "model", "year", "serial_number",
+        "purchase_date", "license_plate", "vehicle_identification_number", "location",
+        "installation_date",
+    )),
+    tenant_column=models.Machine.company_id,
+    embeds={
+        "company": Embed(
+            COMPANY_EMBED_COLUMNS,
+            ((models.Company, models.Machine.company_id == models.Company.id),),
+        ),
+    },
+)
+
+MAINTENANCE_PROJECTION = Projection(
+    model=models.Maintenance,
+    fields=_columns(models.Maintenance, (
+        "id", "machine_id", "type", "scheduled_date", "completed", "notes", "status", "days_delta",
+    )),
+    tenant_column=models.Machine.company_id,
+    embeds={
+        # The machine is already joined for tenant scoping
+        "machine": Embed(_columns(models.Machine, ("id", "name", "type", "company_id"))),
+        "company": Embed(
+            COMPANY_EMBED_COLUMNS,
+            ((models.Company, models.Machine.company_id == models.Company.id),),
+        ),
+    },
+    joins=((models.Machine, models.Maintenance.machine_id == models.Machine.id),),
+)
+
+INVOICE_PROJECTION = Projection(
+    model=models.Invoice,
+    fields=_columns(models.Invoice, (
+        "id", "invoice_number", "company_id", "issue_date", "due_date", "status",
+        "subtotal", "tax_total", "total", "notes", "payment_method", "payment_date",
+    )),
+    tenant_column=models.Invoice.company_id,
+    embeds={
+        "company": Embed(
+            COMPANY_EMBED_COLUMNS,
+            ((models.Company, models.Invoice.company_id == models.Company.id),),
+        ),
+    },
+)
+
+company_projection = projection_query(COMPANY_PROJECTION)
+machine_projection = projection_query(MACHINE_PROJECTION)
+maintenance_projection = projection_query(MAINTENANCE_PROJECTION)
+invoice_projection = projection_query(INVOICE_PROJECTION)
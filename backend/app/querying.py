@@ -0,0 +1,171 @@
+"""Whitelisted filter/sort grammar shared by the list routers.
+
+Grammar (all parameters are optional)::
+
+    ?type=truck                 equality filter on a whitelisted field
+    ?company_id=3,4             comma separated values become an IN (...)
+    ?issue_date__gte=2024-01-01 range operators: __gte, __lte, __gt, __lt
+    ?sort=-purchase_date,name   order by; a leading "-" means descending
+    ?skip=0&limit=100           page window
+
+Only fields explicitly whitelisted by the router (and backed by an index) can
+be filtered or sorted on; anything else is rejected with HTTP 400.
+"""
+
+from __future__ import annotations
+
+import enum
+import operator
+from dataclasses import dataclass, field, replace
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException, Query as QueryParam, Request, status
+from sqlalchemy.orm import Query
+
+MAX_LIMIT = 1000
+# Página por omissão das listas sem âmbito de empresa (admin)
+DEFAULT_LIMIT = 100
+RESERVED_PARAMS = {"skip", "limit", "sort"}
+RANGE_OPERATORS = {
+    "gte": operator.ge,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "lt": operator.lt,
+}
+
+
+@dataclass
+class ListQuery:
+    """Parsed filters, ordering and page window for a list endpoint."""
+
+    criteria: List[Any] = field(default_factory=list)
+    order_by: List[Any] = field(default_factory=list)
+    skip: int = 0
+    limit: Optional[int] = None
+
+    def filter(self, query: Query) -> Query:
+        """Apply only the filter criteria to *query*."""
+        for criterion in self.criteria:
+            query = query.filter(criterion)
+        return query
+
+    def apply(self, query: Query) -> Query:
+        """Apply filters, ordering and the page window to *query*."""
+        query = self.filter(query).order_by(*self.order_by)
+        if self.skip:
+            query = query.offset(self.skip)
+        if self.limit is not None:
+            query = query.limit(self.limit)
+        return query
+
+    def with_default_limit(self, limit: int) -> "ListQuery":
+        """This query, paged by *limit* unless the client asked for a page size."""
+        return self if self.limit is not None else replace(self, limit=limit)
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _coerce(column, name: str, raw: str) -> Any:
+    """Convert a raw query-string value to the Python type of *column*."""
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return raw
+
+    try:
+        if python_type is bool:
+            if raw.lower() in ("true", "1", "yes"):
+                return True
+            if raw.lower() in ("false", "0", "no"):
+                return False
+            raise ValueError(raw)
+        if python_type is date:
+            return date.fromisoformat(raw)
+        if issubclass(python_type, enum.Enum):
+            return python_type(raw)
+        return python_type(raw)
+    except (TypeError, ValueError):
+        raise _bad_request(f"Invalid value '{raw}' for filter '{name}'")
+
+
+def _parse_criteria(fields: Dict[str, Any], params: Iterable[tuple], passthrough: set) -> List[Any]:
+    criteria = []
+    for key, raw in params:
+        if key in RESERVED_PARAMS or key in passthrough:
+            continue
+
+        name, _, op_name = key.partition("__")
+        column = fields.get(name)
+        if column is None:
+            raise _bad_request(f"Filtering on '{name}' is not allowed")
+
+        if not op_name:
+            values = [_coerce(column, name, value) for value in raw.split(",") if value != ""]
+            if not values:
+                continue
+            criteria.append(column == values[0] if len(values) == 1 else column.in_(values))
+        elif op_name in RANGE_OPERATORS:
+            criteria.append(RANGE_OPERATORS[op_name](column, _coerce(column, name, raw)))
+        else:
+            raise _bad_request(f"Unknown filter operator '{op_name}'")
+    return criteria
+
+
+def _parse_sort(fields: Dict[str, Any], sort: Optional[str], default_sort: str, tiebreaker) -> List[Any]:
+    order_by = []
+    for token in (sort or default_sort).split(","):
+        token = token.strip()
+        if not token:
+            continue
+        descending = token.startswith("-")
+        name = token.lstrip("-+")
+        column = fields.get(name)
+        if column is None:
+            raise _bad_request(f"Sorting on '{name}' is not allowed")
+        order_by.append(column.desc() if descending else column.asc())
+
+    # Stable ordering so that skip/limit pages never overlap
+    if tiebreaker is not None:
+        order_by.append(tiebreaker)
+    return order_by
+
+
+def list_query(
+    fields: Dict[str, Any],
+    *,
+    default_sort: str = "id",
+    default_limit: Optional[int] = DEFAULT_LIMIT,
+    passthrough: Iterable[str] = (),
+) -> Callable[..., ListQuery]:
+    """
+    Build a FastAPI dependency that parses the filter/sort grammar.
+
+    Args:
+        fields: Whitelist mapping query-string names to indexed model columns
+        default_sort: Sort expression used when ``sort`` is not provided
+        default_limit: Page size when ``limit`` is not provided (None = unbounded)
+        passthrough: Extra query parameters handled by the route itself
+
+    Returns:
+        Dependency returning a :class:`ListQuery`
+    """
+    passthrough = set(passthrough)
+    tiebreaker = fields.get("id")
+
+    def dependency(
+        request: Request,
+        skip: int = QueryParam(0, ge=0),
+        limit: Optional[int] = QueryParam(default_limit, ge=1, le=MAX_LIMIT),
+        sort: Optional[str] = None,
+    ) -> ListQuery:
+        return ListQuery(
+            criteria=_parse_criteria(fields, request.query_params.multi_items(), passthrough),
+            order_by=_parse_sort(fields, sort, default_sort, tiebreaker),
+            skip=skip,
+            limit=limit,
+        )
+
+    return dependency
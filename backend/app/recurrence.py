@@ -0,0 +1,160 @@
+"""Recurring maintenance rules, expanded lazily per query window.
+
+A `models.MaintenanceRule` stands for an open-ended series of maintenances.
+Instead of storing one ``maintenances`` row per occurrence, the occurrences
+are computed for the window a query asks for. The index of the first
+occurrence inside the window is found arithmetically (not by walking from
+the anchor), so the cost depends on the occurrences in the window, not on
+how old the rule is. All rules overlapping the window are read with one
+query, and the occurrences already stored (completed or edited, see
+``Maintenance.rule_id``/``occurrence_date``) with a second one; those are
+left out here because the regular maintenance queries return them.
+"""
+
+from __future__ import annotations
+
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+Occurrence = Dict[str, Any]
+
+
+def _add_months(day: date, months: int) -> date:
+    # Dia do mês da âncora, limitado ao último dia do mês (31 jan + 1 mês = 28/29 fev)
+    month = day.month - 1 + months
+    year = day.year + month // 12
+    month = month % 12 + 1
+    return date(year, month, min(day.day, monthrange(year, month)[1]))
+
+
+def occurrence_dates(rule: models.MaintenanceRule, date_from: date, date_to: date) -> List[date]:
+    """Occurrence dates of *rule* between *date_from* and *date_to* (inclusive)."""
+    start = max(date_from, rule.anchor_date)
+    end = date_to if rule.end_date is None else min(date_to, rule.end_date)
+    if end < start:
+        return []
+
+    anchor = rule.anchor_date
+    if rule.interval_days:
+        step = rule.interval_days
+        first = -(-(start - anchor).days // step)
+        last = (end - anchor).days // step
+        return [anchor + timedelta(days=k * step) for k in range(first, last + 1)]
+
+    step = rule.interval_months
+    # Primeiro índice pelo número de meses; no máximo uma ocorrência fica antes de start
+    k = ((start.year - anchor.year) * 12 + start.month - anchor.month) // step
+    dates = []
+    while True:
+        day = _add_months(anchor, k * step)
+        if day > end:
+            return dates
+        if day >= start:
+            dates.append(day)
+        k += 1
+
+
+def is_occurrence(rule: models.MaintenanceRule, day: date) -> bool:
+    """Whether *day* is one of the occurrence dates of *rule*."""
+    return occurrence_dates(rule, day, day) == [day]
+
+
+def occurrence_status(day: date, today: date) -> Tuple[str, int]:
+    """``(status, days_delta)`` of a pending occurrence, as ``Maintenance.status`` computes it."""
+    delta = (day - today).days
+    if delta < 0:
+        return models.MaintenanceStatusEnum.overdue.value, delta
+    if delta <= models.UPCOMING_WINDOW_DAYS:
+        return models.MaintenanceStatusEnum.upcoming.value, delta
+    return models.MaintenanceStatusEnum.scheduled.value, delta
+
+
+def _status_window(status: Optional[str], date_from: date, date_to: date, today: date) -> Tuple[date, date]:
+    # Estreitar a janela pelo estado pedido evita expandir ocorrências que seriam descartadas
+    horizon = today + timedelta(days=models.UPCOMING_WINDOW_DAYS)
+    if status == "overdue":
+        return date_from, min(date_to, today - timedelta(days=1))
+    if status == "upcoming":
+        return max(date_from, today), min(date_to, horizon)
+    if status == "scheduled":
+        return max(date_from, horizon + timedelta(days=1)), date_to
+    return date_from, date_to
+
+
+def expand_rules(
+    db: Session,
+    date_from: date,
+    date_to: date,
+    *,
+    company_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    status: Optional[str] = None,
+) -> List[Occurrence]:
+    """
+    Pending occurrences of the rules in scope between *date_from* and
+    *date_to*, sorted by date, as maintenance-like dicts (``id`` is None).
+    *status* accepts the values of `filter_maintenances`.
+    """
+    if status == "completed":
+        return []
+    today = date.today()
+    date_from, date_to = _status_window(status, date_from, date_to, today)
+    if date_to < date_from:
+        return []
+
+    Rule = models.MaintenanceRule
+    query = (
+        db.query(Rule, models.Machine.name, models.Machine.company_id, models.Company.name)
+        .join(models.Machine, models.Machine.id == Rule.machine_id)
+        .outerjoin(models.Company, models.Company.id == models.Machine.company_id)
+        .filter(
+            Rule.anchor_date <= date_to,
+            or_(Rule.end_date.is_(None), Rule.end_date >= date_from),
+        )
+    )
+    if company_id is not None:
+        query = query.filter(models.Machine.company_id == company_id)
+    if machine_id is not None:
+        query = query.filter(Rule.machine_id == machine_id)
+    rules = query.all()
+    if not rules:
+        return []
+
+    stored = set(
+        db.query(models.Maintenance.rule_id, models.Maintenance.occurrence_date)
+        .filter(
+            models.Maintenance.rule_id.in_([rule.id for rule, *_ in rules]),
+            models.Maintenance.occurrence_date.between(date_from, date_to),
+        )
+        .all()
+    )
+
+    occurrences = []
+    for rule, machine_name, rule_company_id, company_name in rules:
+        for day in occurrence_dates(rule, date_from, date_to):
+            if (rule.id, day) in stored:
+                continue
+            day_status, days_delta = occurrence_status(day, today)
+            occurrences.append({
+                "id": None,
+                "rule_id": rule.id,
+                "occurrence_date": day,
+                "machine_id": rule.machine_id,
+                "type": rule.type,
+                "scheduled_date": day,
+                "completed": False,
+                "notes": rule.notes,
+                "status": day_status,
+                "days_delta": days_delta,
+                "machine_name": machine_name,
+                "company_id": rule_company_id,
+                "company_name": company_name,
+            })
+    occurrences.sort(key=lambda occurrence: (occurrence["scheduled_date"], occurrence["rule_id"]))
+    return occurrences
@@ -0,0 +1,261 @@
+"""Billing report exports (CSV, XLSX, PDF) streamed by the backend.
+
+The report lists the invoices issued in a period, with a summary by status.
+Invoice rows are read through a server-side cursor, ``REPORT_BATCH_SIZE`` at
+a time, like ``exports.py``:
+
+* CSV is encoded and sent batch by batch;
+* XLSX is written with a write-only openpyxl workbook (rows go to disk, not
+  to memory) into a temporary file, which is then streamed;
+* PDF is built into a temporary file and streamed. ReportLab keeps the whole
+  table in memory, so it lists at most ``REPORT_PDF_MAX_ROWS`` invoices (the
+  summary covers all of them).
+
+The summary is one GROUP BY query. The browser downloads the files through
+short-lived signed links (``security.create_download_token``), so they never
+pass through the Streamlit process.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import tempfile
+from datetime import date, datetime
+from typing import IO, Any, Dict, Iterator, List, Literal, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from . import models
+from .database import SessionLocal
+
+REPORT_BATCH_SIZE = 1000
+REPORT_PDF_MAX_ROWS = 500
+REPORT_MAX_WINDOW_DAYS = 3660
+FILE_CHUNK_SIZE = 64 * 1024
+
+ReportFormat = Literal["csv", "xlsx", "pdf"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+COLUMNS = ["Nº Fatura", "Empresa", "Data Emissão", "Vencimento", "Status", "Total (€)", "Data Pagamento"]
+
+# Status da fatura para exibição em português (como na página de faturação)
+STATUS_LABELS = {
+    "draft": "Rascunho",
+    "sent": "Enviada",
+    "paid": "Paga",
+    "overdue": "Vencida",
+    "canceled": "Cancelada",
+}
+
+
+def report_statement(date_from: date, date_to: date, company_id: Optional[int] = None) -> Select:
+    """Invoice rows of the report, ordered by issue date."""
+    Invoice = models.Invoice
+    statement = (
+        select(
+            Invoice.invoice_number,
+            models.Company.name,
+            Invoice.issue_date,
+            Invoice.due_date,
+            Invoice.status,
+            Invoice.total,
+            Invoice.payment_date,
+        )
+        .join(models.Company, models.Company.id == Invoice.company_id)
+        .where(Invoice.issue_date.between(date_from, date_to))
+        .order_by(Invoice.issue_date, Invoice.id)
+    )
+    if company_id is not None:
+        statement = statement.where(Invoice.company_id == company_id)
+    return statement
+
+
+def report_summary(db: Session, date_from: date, date_to: date, company_id: Optional[int] = None) -> Dict[str, Any]:
+    """Invoice count and total per status for the period."""
+    Invoice = models.Invoice
+    statement = (
+        select(Invoice.status, func.count(Invoice.id), func.coalesce(func.sum(Invoice.total), 0.0))
+        .where(Invoice.issue_date.between(date_from, date_to))
+        .group_by(Invoice.status)
+    )
+    if company_id is not None:
+        statement = statement.where(Invoice.company_id == company_id)
+    by_status = {status.value: (count, total) for status, count, total in db.execute(statement)}
+
+    def count(*statuses: str) -> int:
+        return sum(by_status.get(status, (0, 0.0))[0] for status in statuses)
+
+    def total(*statuses: str) -> float:
+        return sum(by_status.get(status, (0, 0.0))[1] for status in statuses)
+
+    return {
+        "total_invoiced": total(*STATUS_LABELS),
+        "total_paid": total("paid"),
+        "total_pending": total("draft", "sent"),
+        "total_overdue": total("overdue"),
+        "count_total": count(*STATUS_LABELS),
+        "count_paid": count("paid"),
+        "count_pending": count("draft", "sent"),
+        "count_overdue": count("overdue"),
+    }
+
+
+def _batches(db: Session, statement: Select) -> Iterator[List[List[Any]]]:
+    """Report rows formatted for display, one batch at a time."""
+    result = db.execute(statement.execution_options(yield_per=REPORT_BATCH_SIZE, stream_results=True))
+    for batch in result.partitions():
+        yield [
+            [
+                number,
+                company,
+                issue_date.isoformat(),
+                due_date.isoformat(),
+                STATUS_LABELS.get(status.value, status.value),
+                round(total or 0.0, 2),
+                payment_date.isoformat() if payment_date else "",
+            ]
+            for number, company, issue_date, due_date, status, total, payment_date in batch
+        ]
+
+
+def _iter_file(file: IO[bytes]) -> Iterator[bytes]:
+    """Stream a temporary file from the start and close (delete) it."""
+    try:
+        file.seek(0)
+        while chunk := file.read(FILE_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
+
+
+def _write_xlsx(db: Session, statement: Select, file: IO[bytes]) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Faturas")
+    sheet.append(COLUMNS)
+    for batch in _batches(db, statement):
+        for row in batch:
+            sheet.append(row)
+    workbook.save(file)
+
+
+def _write_pdf(
+    db: Session, statement: Select, summary: Dict[str, Any], date_from: date, date_to: date, file: IO[bytes]
+) -> None:
+    doc = SimpleDocTemplate(file, pagesize=A4, rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=72)
+    styles = getSampleStyleSheet()
+    grid = [
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.black),
+        ("BOX", (0, 0), (-1, -1), 0.25, colors.black),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+    ]
+
+    elements = [
+        Paragraph("Relatório de Faturação", styles["Heading1"]),
+        Paragraph(f"Período: {date_from.strftime('%d/%m/%Y')} a {date_to.strftime('%d/%m/%Y')}", styles["Heading2"]),
+        Spacer(1, 20),
+        Paragraph("Resumo Financeiro", styles["Heading2"]),
+    ]
+
+    financial_table = Table(
+        [
+            ["Métrica", "Valor"],
+            ["Total Faturado", f"{summary['total_invoiced']:.2f} €"],
+            ["Total Pago", f"{summary['total_paid']:.2f} €"],
+            ["Pendente", f"{summary['total_pending']:.2f} €"],
+            ["Vencido", f"{summary['total_overdue']:.2f} €"],
+            ["Nº Faturas", str(summary["count_total"])],
+            ["Faturas Pagas", str(summary["count_paid"])],
+            ["Faturas Pendentes", str(summary["count_pending"])],
+            ["Faturas Vencidas", str(summary["count_overdue"])],
+        ],
+        colWidths=[200, 100],
+    )
+    financial_table.setStyle(TableStyle([("ALIGN", (0, 0), (0, -1), "LEFT"), ("ALIGN", (1, 0), (1, -1), "RIGHT"), *grid]))
+    elements += [financial_table, Spacer(1, 20), Paragraph("Detalhamento de Faturas", styles["Heading2"])]
+
+    # ReportLab guarda a tabela toda em memória: só as primeiras linhas
+    invoice_data: List[List[str]] = [COLUMNS]
+    for batch in _batches(db, statement.limit(REPORT_PDF_MAX_ROWS)):
+        invoice_data += [
+            [number, company, issue_date, due_date, status, f"{total:.2f} €", payment_date]
+            for number, company, issue_date, due_date, status, total, payment_date in batch
+        ]
+    invoice_table = Table(invoice_data, colWidths=[60, 80, 60, 60, 60, 60, 60], repeatRows=1)
+    invoice_table.setStyle(TableStyle([
+        ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+        ("ALIGN", (0, 1), (1, -1), "LEFT"),
+        ("ALIGN", (2, 1), (-1, -1), "RIGHT"),
+        *grid,
+    ]))
+    elements.append(invoice_table)
+    if summary["count_total"] > REPORT_PDF_MAX_ROWS:
+        elements.append(Paragraph(
+            f"Mostradas {REPORT_PDF_MAX_ROWS} de {summary['count_total']} faturas; "
+            "exporte em CSV ou Excel para a lista completa.",
+            styles["Normal"],
+        ))
+
+    elements += [
+        Spacer(1, 20),
+        Paragraph(f"Relatório gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles["Normal"]),
+    ]
+    doc.build(elements)
+
+
+def iter_report(fmt: ReportFormat, date_from: date, date_to: date, company_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yield the report encoded as *fmt*. Like ``exports.iter_export``, the
+    generator owns its database session.
+    """
+    db = SessionLocal()
+    try:
+        statement = report_statement(date_from, date_to, company_id)
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(COLUMNS)
+            for batch in _batches(db, statement):
+                writer.writerows(batch)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                # Nenhuma fatura: enviar na mesma o cabeçalho
+                yield buffer.getvalue().encode("utf-8")
+            return
+
+        # XLSX e PDF só ficam completos no fim: escrever em disco e enviar o ficheiro
+        file = tempfile.TemporaryFile()
+        try:
+            if fmt == "xlsx":
+                _write_xlsx(db, statement, file)
+            else:
+                summary = report_summary(db, date_from, date_to, company_id)
+                _write_pdf(db, statement, summary, date_from, date_to, file)
+        except BaseException:
+            file.close()
+            raise
+        db.close()
+        yield from _iter_file(file)
+    finally:
+        db.close()
+
+
+def report_filename(fmt: ReportFormat, date_from: date, date_to: date) -> str:
+    return f"relatorio_faturacao_{date_from}_{date_to}.{fmt}"
@@ -1,34 +1,54 @@
 import logging
 from datetime import timedelta
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 from .. import database, crud, schemas, models
 from ..security import (
-    verify_password,
+    verify_and_update_async,
     create_token,
     ACCESS_TOKEN_EXPIRE_MINUTES,
     create_user_token
 )
+from ..auth import Principal
 from ..dependencies import get_admin_user, get_current_user
 from ..notifications import notify_new_user_created
 from ..crud import get_company_by_id
+from ..querying import ListQuery, list_query
 
 router = APIRouter(tags=["authentication"], prefix="/auth")
 
+# Filterable/sortable (indexed) user fields, e.g. ?role=fleet_manager&company_id=3
+USER_FIELDS = {
+    "id": models.User.id,
+    "username": models.User.username,
+    "email": models.User.email,
+    "role": models.User.role,
+    "company_id": models.User.company_id,
+}
+user_list_query = list_query(USER_FIELDS, default_sort="username")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(database.get_db)
 ):
-    user = crud.get_user_by_username(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    """
+    Checks the password in the hashing pool (see hashing.py) while the event
+    loop stays free; database work runs in the threadpool.
+    """
+    user = await run_in_threadpool(crud.get_user_by_username, db, form_data.username)
+    valid, new_hash = False, None
+    if user:
+        valid, new_hash = await verify_and_update_async(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -39,6 +59,17 @@ def login(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Inactive user"
         )
+    return await run_in_threadpool(_complete_login, db, user, new_hash)
+
+
+def _complete_login(db: Session, user: models.User, new_hash: Optional[str]) -> dict:
+    if new_hash:
+        # O custo do bcrypt mudou (BCRYPT_ROUNDS): guardar o novo hash
+        crud.update_password_hash(db, user.id, new_hash)
+    return _token_response(user, crud.create_refresh_token(db, user.id))
+
+
+def _token_response(user: models.User, refresh_token: str) -> dict:
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
     # Garanta que token_data seja um dicionário 
@@ -56,13 +87,49 @@ def login(
         "user_id": user.id,
         "username": user.username,
         "role": user.role,
-        "company_id": user.company_id
+        "company_id": user.company_id,
+        "expires_in": int(access_token_expires.total_seconds()),
+        "refresh_token": refresh_token,
     }
 
 
+@router.post("/refresh", response_model=schemas.Token)
+def refresh(
+    body: schemas.RefreshRequest,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Issues a new access token and rotates the refresh token, without checking
+    the password. The presented refresh token can no longer be used, except
+    by a concurrent refresh within a few seconds (see `crud.rotate_refresh_token`).
+    """
+    rotated = crud.rotate_refresh_token(db, body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
+    return _token_response(user, refresh_token)
+
+
+@router.post("/logout", response_model=dict)
+def logout(
+    body: schemas.RefreshRequest,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Revokes the refresh token (and its rotations) of the current device.
+    Access tokens already issued stay valid until they expire.
+    """
+    crud.revoke_refresh_token(db, body.refresh_token)
+    return {"success": True}
+
+
 @router.get("/users/me", response_model=schemas.User)
 def get_current_user_info(
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Returns information about the currently logged-in user.
@@ -72,22 +139,21 @@ def get_current_user_info(
 
 @router.get("/users", response_model=List[schemas.User])
 def get_users(
-    skip: int = 0,
-    limit: int = 100,
+    params: ListQuery = Depends(user_list_query),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
-    Retrieves all users (admin only).
+    Retrieves all users (admin only), with optional filters and sorting.
     """
-    return crud.get_users(db, skip=skip, limit=limit)
+    return crud.get_users(db, list_query=params)
 
 
 @router.post("/users", response_model=schemas.User)
 def create_new_user(
     user: schemas.UserCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Creates a new user (admin only).
@@ -129,7 +195,7 @@ def update_user(
     user_id: int,
     user_data: schemas.UserUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Updates user information. 
@@ -160,7 +226,7 @@ def update_user(
 def delete_user(
     user_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Deletes a user (admin only).
@@ -1,44 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import false
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import date
 
-from .. import database, crud, schemas, models
-from ..dependencies import get_current_user, get_admin_user, get_company_access
+from .. import database, crud, invoice_archive, invoice_pdf, invoicing, reports, schemas, models
+from ..auth import Principal
+from ..dependencies import (
+    get_current_user, get_admin_user, get_company_access, conditional_get, conditional_get_global,
+    conditional_get_for, response_cache, accessible_invoice, existing_service, company_scope, download_grant
+)
+from ..querying import DEFAULT_LIMIT, ListQuery, list_query
+from ..exports import ExportFormat, export_response
+from ..projection import Selection, invoice_projection
+from ..cache import CachedRoute
+from ..security import DOWNLOAD_TOKEN_EXPIRE_SECONDS, create_download_token
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
+# Campos filtráveis/ordenáveis (indexados), ex.: ?status=sent&issue_date__gte=2024-01-01
+INVOICE_FIELDS = {
+    "id": models.Invoice.id,
+    "invoice_number": models.Invoice.invoice_number,
+    "company_id": models.Invoice.company_id,
+    "status": models.Invoice.status,
+    "issue_date": models.Invoice.issue_date,
+    "due_date": models.Invoice.due_date,
+}
+
+SERVICE_LIST = TypeAdapter(List[schemas.Service])
+
+INVOICE_PASSTHROUGH = ("fields", "embed")
+# Sem limite por omissão para uma empresa; o admin recebe DEFAULT_LIMIT (ver list_invoices)
+invoice_list_query = list_query(
+    INVOICE_FIELDS, default_sort="-issue_date", default_limit=None, passthrough=INVOICE_PASSTHROUGH
+)
+invoice_export_query = list_query(
+    INVOICE_FIELDS, default_sort="-issue_date", default_limit=None, passthrough=("format",)
+)
+
 # Rotas para serviços
-@router.get("/services", response_model=List[schemas.Service])
+@router.get("/services", response_model=List[schemas.Service], dependencies=[Depends(conditional_get_global)])
 def list_services(
     active_only: bool = False,
     skip: int = 0,
     limit: int = 100,
+    cached: CachedRoute = Depends(response_cache("services", shared=True)),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Lista todos os serviços disponíveis"""
-    return crud.get_services(db, skip=skip, limit=limit, active_only=active_only)
+    """Lista todos os serviços disponíveis (resposta em cache, igual para todas as empresas)"""
+    return cached.respond(
+        SERVICE_LIST,
+        lambda: crud.get_services(db, skip=skip, limit=limit, active_only=active_only),
+    )
 
 @router.post("/services", response_model=schemas.Service)
 def create_service(
     service: schemas.ServiceCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """Cria um novo serviço (apenas admin)"""
     return crud.create_service(db, service)
 
-@router.get("/services/{service_id}", response_model=schemas.Service)
+@router.get(
+    "/services/{service_id}",
+    response_model=schemas.Service,
+    dependencies=[Depends(conditional_get_for(existing_service, shared=True))]
+)
 def get_service(
-    service_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    service: models.Service = Depends(existing_service),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Obtém detalhes de um serviço específico"""
-    service = crud.get_service_by_id(db, service_id)
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
     return service
 
 @router.put("/services/{service_id}", response_model=schemas.Service)
@@ -46,7 +83,7 @@ def update_service(
     service_id: int,
     service_data: schemas.ServiceUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """Atualiza um serviço existente (apenas admin)"""
     updated_service = crud.update_service(db, service_id, service_data)
@@ -58,7 +95,7 @@ def update_service(
 def delete_service(
     service_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """Desativa um serviço (apenas admin)"""
     result = crud.delete_service(db, service_id)
@@ -67,25 +104,73 @@ def delete_service(
     return {"success": True, "message": "Service deactivated successfully"}
 
 # Rotas para faturas
-@router.get("/invoices", response_model=List[schemas.Invoice])
+@router.get("/invoices", response_model=List[schemas.Invoice], dependencies=[Depends(conditional_get)])
 def list_invoices(
-    skip: int = 0,
-    limit: int = 100,
+    params: ListQuery = Depends(invoice_list_query),
+    selection: Optional[Selection] = Depends(invoice_projection),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Lista todas as faturas (admin vê todas, gestores veem apenas as suas).
+    Gestores recebem todas as suas faturas se não pedirem uma página;
+    o admin recebe `DEFAULT_LIMIT`.
+    """
+    if current_user.role == models.UserRoleEnum.admin:
+        company_id = None
+        params = params.with_default_limit(DEFAULT_LIMIT)
+    elif current_user.company_id:
+        company_id = current_user.company_id
+    else:
+        return []
+
+    # fields/embed: só as colunas pedidas, sem itens (ver projection.py)
+    if selection:
+        return selection.response(db, params.apply(selection.statement(company_id)))
+    if company_id is None:
+        return crud.get_invoices(db, list_query=params)
+    return crud.get_company_invoices(db, company_id, list_query=params)
+
+@router.get("/invoices/export")
+def export_invoices(
+    fmt: ExportFormat = Query("ndjson", alias="format"),
+    params: ListQuery = Depends(invoice_export_query),
+    current_user: Principal = Depends(get_current_user)
 ):
-    """Lista todas as faturas (admin vê todas, gestores veem apenas as suas)"""
+    """Exporta faturas (sem itens) em NDJSON ou CSV, em streaming e memória constante"""
     if current_user.role == models.UserRoleEnum.admin:
-        return crud.get_invoices(db, skip=skip, limit=limit)
-    if current_user.company_id:
-        return crud.get_company_invoices(db, current_user.company_id)
-    return []
+        statement = crud.invoice_rows_statement()
+    elif current_user.company_id:
+        statement = crud.invoice_rows_statement(current_user.company_id)
+    else:
+        statement = crud.invoice_rows_statement().where(false())
+    return export_response(params.apply(statement), fmt, "invoices")
+
+@router.get("/invoices/pdf-archive")
+def export_invoice_pdfs(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    company_id: Optional[int] = Depends(company_scope)
+):
+    """Exporta num ZIP, em streaming, os PDFs das faturas emitidas no período"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (date_to - date_from).days >= invoice_archive.ARCHIVE_MAX_WINDOW_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The period may span at most {invoice_archive.ARCHIVE_MAX_WINDOW_DAYS} days"
+        )
+    return StreamingResponse(
+        invoice_archive.iter_archive(date_from, date_to, company_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="faturas_{date_from}_{date_to}.zip"'},
+    )
 
 @router.post("/invoices", response_model=schemas.Invoice)
 def create_invoice(
     invoice: schemas.InvoiceCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Cria uma nova fatura"""
     # Verificar acesso à empresa
@@ -97,73 +182,241 @@ def create_invoice(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/invoices/{invoice_id}", response_model=schemas.Invoice)
+@router.get("/invoices/{invoice_id}", response_model=schemas.Invoice, dependencies=[Depends(conditional_get_for(accessible_invoice))])
 def get_invoice(
-    invoice_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    invoice: models.Invoice = Depends(accessible_invoice)
 ):
-    """Obtém detalhes de uma fatura específica"""
-    invoice = crud.get_invoice_by_id(db, invoice_id)
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
-    # Verificar acesso à empresa
-    from ..dependencies import get_company_access
-    get_company_access(invoice.company_id, current_user)
-    
+    """Obtém detalhes de uma fatura específica (acesso verificado em accessible_invoice)"""
     return invoice
 
+@router.get("/invoices/{invoice_id}/pdf", response_class=FileResponse)
+def get_invoice_pdf(
+    request: Request,
+    invoice: models.Invoice = Depends(accessible_invoice)
+):
+    """PDF da fatura, gerado uma vez por conteúdo e servido da cache em disco (ver invoice_pdf.py)"""
+    document = invoice_pdf.invoice_document(invoice)
+    digest = invoice_pdf.document_digest(document)
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(
+        invoice_pdf.cached_pdf(document, digest),
+        media_type="application/pdf",
+        filename=f"fatura_{invoice.invoice_number}.pdf",
+        headers=headers,
+    )
+
 @router.patch("/invoices/{invoice_id}/status", response_model=schemas.Invoice)
 def update_invoice_status(
-    invoice_id: int,
     status: schemas.InvoiceStatus,
     payment_date: Optional[date] = None,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    invoice: models.Invoice = Depends(accessible_invoice),
+    db: Session = Depends(database.get_db)
 ):
     """Atualiza o status de uma fatura"""
-    invoice = crud.get_invoice_by_id(db, invoice_id)
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
-    # Verificar acesso à empresa
-    from ..dependencies import get_company_access
-    get_company_access(invoice.company_id, current_user)
-    
-    updated_invoice = crud.update_invoice_status(db, invoice_id, status, payment_date)
+    updated_invoice = crud.update_invoice_status(db, invoice, status, payment_date)
     return updated_invoice
 
 @router.delete("/invoices/{invoice_id}", response_model=dict)
 def delete_invoice(
-    invoice_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    invoice: models.Invoice = Depends(accessible_invoice),
+    db: Session = Depends(database.get_db)
 ):
     """Exclui uma fatura (apenas se estiver em rascunho)"""
-    invoice = crud.get_invoice_by_id(db, invoice_id)
-    if not invoice:
-        raise HTTPException(status_code=404, detail="Invoice not found")
-    
-    # Verificar acesso à empresa
-    from ..dependencies import get_company_access
-    get_company_access(invoice.company_id, current_user)
-    
-    result = crud.delete_invoice(db, invoice_id)
+    result = crud.delete_invoice(db, invoice)
     if not result:
         raise HTTPException(status_code=400, detail="Only invoices in draft status can be deleted")
     
     return {"success": True, "message": "Invoice deleted successfully"}
 
-@router.get("/invoices/company/{company_id}", response_model=List[schemas.Invoice])
+@router.get("/invoices/company/{company_id}", response_model=List[schemas.Invoice], dependencies=[Depends(conditional_get)])
 def get_company_invoices(
     company_id: int,
+    params: ListQuery = Depends(invoice_list_query),
+    selection: Optional[Selection] = Depends(invoice_projection),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Lista todas as faturas de uma empresa específica"""
     # Verificar acesso à empresa
     from ..dependencies import get_company_access
     get_company_access(company_id, current_user)
     
-    return crud.get_company_invoices(db, company_id)
\ No newline at end of file
+    if selection:
+        return selection.response(db, params.apply(selection.statement(company_id)))
+    return crud.get_company_invoices(db, company_id, list_query=params)
+
+# Rotas para planos de faturação recorrente
+@router.get("/plans", response_model=List[schemas.BillingPlan], dependencies=[Depends(conditional_get)])
+def list_billing_plans(
+    company_id: Optional[int] = Depends(company_scope),
+    db: Session = Depends(database.get_db)
+):
+    """Lista os planos de faturação (admin vê todos ou ?company_id, gestores os da sua empresa)"""
+    return crud.get_billing_plans(db, company_id)
+
+@router.post("/plans", response_model=schemas.BillingPlan)
+def create_billing_plan(
+    plan: schemas.BillingPlanCreate,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Cria um plano de faturação recorrente (apenas admin)"""
+    if not crud.get_company_by_id(db, plan.company_id):
+        raise HTTPException(status_code=404, detail="Company not found")
+    try:
+        return crud.create_billing_plan(db, plan)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/plans/{plan_id}", response_model=schemas.BillingPlan)
+def update_billing_plan(
+    plan_id: int,
+    plan_data: schemas.BillingPlanUpdate,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Atualiza um plano de faturação (apenas admin)"""
+    updated_plan = crud.update_billing_plan(db, plan_id, plan_data)
+    if not updated_plan:
+        raise HTTPException(status_code=404, detail="Billing plan not found")
+    return updated_plan
+
+@router.delete("/plans/{plan_id}", response_model=dict)
+def delete_billing_plan(
+    plan_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Exclui um plano de faturação (apenas admin)"""
+    if not crud.delete_billing_plan(db, plan_id):
+        raise HTTPException(status_code=404, detail="Billing plan not found")
+    return {"success": True, "message": "Billing plan deleted successfully"}
+
+# Rotas para execuções de faturação (geração em lote das faturas de um mês)
+@router.get("/runs", response_model=List[schemas.BillingRun])
+def list_billing_runs(
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Lista as execuções de faturação, mais recentes primeiro (apenas admin)"""
+    return db.query(models.BillingRun).order_by(models.BillingRun.period.desc()).all()
+
+@router.post("/runs", response_model=schemas.BillingRun, status_code=status.HTTP_202_ACCEPTED)
+def create_billing_run(
+    request: schemas.BillingRunCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """
+    Gera em segundo plano as faturas do mês de `period` para todas as empresas
+    com planos ativos (apenas admin). Pedir de novo o mesmo mês devolve a
+    execução existente e retoma-a se tiver falhado.
+    """
+    run = invoicing.get_or_create_run(
+        db,
+        request.period,
+        issue_date=request.issue_date,
+        due_date=request.due_date,
+        invoice_status=models.InvoiceStatus(request.invoice_status.value),
+    )
+    if run.status != models.BillingRunStatus.completed:
+        background_tasks.add_task(invoicing.execute_run_in_background, run.id)
+    return run
+
+@router.get("/runs/{run_id}", response_model=schemas.BillingRun)
+def get_billing_run(
+    run_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Obtém o estado e o progresso de uma execução de faturação (apenas admin)"""
+    run = db.get(models.BillingRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Billing run not found")
+    return run
+
+@router.post("/runs/{run_id}/resume", response_model=schemas.BillingRun, status_code=status.HTTP_202_ACCEPTED)
+def resume_billing_run(
+    run_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_admin_user)
+):
+    """Retoma uma execução que falhou ou ficou parada, a partir do último lote gravado (apenas admin)"""
+    run = db.get(models.BillingRun, run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Billing run not found")
+    if run.status == models.BillingRunStatus.completed:
+        raise HTTPException(status_code=409, detail="Billing run already completed")
+    background_tasks.add_task(invoicing.execute_run_in_background, run.id)
+    return run
+
+
+# Rotas para relatórios (exportação em streaming, sem passar pelo Streamlit)
+REPORT_DOWNLOAD = "billing_report"
+
+def _report_response(fmt: reports.ReportFormat, date_from: date, date_to: date, company_id: Optional[int]):
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (date_to - date_from).days >= reports.REPORT_MAX_WINDOW_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The period may span at most {reports.REPORT_MAX_WINDOW_DAYS} days"
+        )
+    return StreamingResponse(
+        reports.iter_report(fmt, date_from, date_to, company_id),
+        media_type=reports.MEDIA_TYPES[fmt],
+        headers={
+            "Content-Disposition": f'attachment; filename="{reports.report_filename(fmt, date_from, date_to)}"'
+        },
+    )
+
+@router.get("/reports/export")
+def export_billing_report(
+    fmt: reports.ReportFormat = Query("csv", alias="format"),
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    company_id: Optional[int] = Depends(company_scope)
+):
+    """Exporta o relatório de faturação do período em CSV, Excel ou PDF, em streaming"""
+    return _report_response(fmt, date_from, date_to, company_id)
+
+@router.get("/reports/export-link", response_model=dict)
+def get_billing_report_link(
+    fmt: reports.ReportFormat = Query("csv", alias="format"),
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    company_id: Optional[int] = Depends(company_scope),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Link assinado e de curta duração para o browser descarregar o relatório sem o token de acesso"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    token = create_download_token(current_user.id, current_user.username, REPORT_DOWNLOAD, {
+        "format": fmt,
+        "from": date_from.isoformat(),
+        "to": date_to.isoformat(),
+        "company_id": company_id,
+    })
+    return {
+        "url": f"billing/reports/download?token={token}",
+        "filename": reports.report_filename(fmt, date_from, date_to),
+        "expires_in": DOWNLOAD_TOKEN_EXPIRE_SECONDS,
+    }
+
+@router.get("/reports/download")
+def download_billing_report(
+    params: dict = Depends(download_grant(REPORT_DOWNLOAD))
+):
+    """Descarrega o relatório de um link criado em /reports/export-link"""
+    return _report_response(
+        params["format"],
+        date.fromisoformat(params["from"]),
+        date.fromisoformat(params["to"]),
+        params["company_id"],
+    )
@@ -1,32 +1,43 @@
 import os
 import shutil
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
 from .. import database, crud, schemas, models
-from ..dependencies import get_current_user, get_admin_user, get_company_access
+from ..auth import Principal
+from ..dependencies import (
+    get_current_user, get_admin_user, get_company_access, conditional_get, response_cache
+)
 from ..email_service import send_company_creation_email
 from ..notifications import notify_new_company_added
+from ..projection import Selection, company_projection
+from ..cache import CachedRoute
 import os
 import logging
 
 # Configure router
 router = APIRouter(prefix="/companies", tags=["companies"])
 
+COMPANY = TypeAdapter(schemas.Company)
+COMPANY_LIST = TypeAdapter(List[schemas.Company])
+
 # Directory for company logos
 LOGO_DIR = Path("frontend/images/company_logos")
 os.makedirs(LOGO_DIR, exist_ok=True)
 
 
-@router.get("/", response_model=List[schemas.Company])
+@router.get("/", response_model=List[schemas.Company], dependencies=[Depends(conditional_get)])
 def list_companies(
     skip: int = 0,
     limit: int = 100,
+    selection: Optional[Selection] = Depends(company_projection),
+    cached: CachedRoute = Depends(response_cache("companies")),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Lists companies based on user role.
@@ -36,25 +47,39 @@ def list_companies(
     Args:
         skip: Number of records to skip for pagination
         limit: Maximum number of records to return
+        selection: Optional `fields` projection (e.g. `?fields=id,name` for dropdowns)
+        cached: Response cache entry for this request (see `cache.py`)
         db: Database session
         current_user: Current authenticated user
         
     Returns:
         List of companies the user has access to
     """
-    if current_user.role == models.UserRoleEnum.admin:
-        return crud.get_companies(db, skip=skip, limit=limit)
-    if current_user.company_id:
-        company = crud.get_company_by_id(db, current_user.company_id)
-        return [company] if company else []
-    return []
+    def produce():
+        if selection:
+            if current_user.role == models.UserRoleEnum.admin:
+                statement = selection.statement().order_by(models.Company.id).offset(skip).limit(limit)
+            elif current_user.company_id:
+                statement = selection.statement(current_user.company_id)
+            else:
+                return []
+            return selection.response(db, statement)
+
+        if current_user.role == models.UserRoleEnum.admin:
+            return crud.get_companies(db, skip=skip, limit=limit)
+        if current_user.company_id:
+            company = crud.get_company_by_id(db, current_user.company_id)
+            return [company] if company else []
+        return []
+
+    return cached.respond(COMPANY_LIST, produce)
 
 
 @router.post("/", response_model=schemas.Company)
 def create_company(
     company: schemas.CompanyCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     db_company = crud.create_company(db, company)
     
@@ -66,11 +91,12 @@ def create_company(
     
     return db_company
 
-@router.get("/{company_id}", response_model=schemas.Company)
+@router.get("/{company_id}", response_model=schemas.Company, dependencies=[Depends(conditional_get)])
 def get_company(
     company_id: int,
+    cached: CachedRoute = Depends(response_cache("companies")),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Retrieves a company's details.
@@ -89,10 +115,14 @@ def get_company(
         HTTPException: If company not found or user lacks access permission
     """
     get_company_access(company_id, current_user)
-    company = crud.get_company_by_id(db, company_id)
-    if not company:
-        raise HTTPException(status_code=404, detail="Company not found")
-    return company
+
+    def produce():
+        company = crud.get_company_by_id(db, company_id)
+        if not company:
+            raise HTTPException(status_code=404, detail="Company not found")
+        return company
+
+    return cached.respond(COMPANY, produce)
 
 
 @router.put("/{company_id}", response_model=schemas.Company)
@@ -100,7 +130,7 @@ def update_company(
     company_id: int,
     company_data: schemas.CompanyUpdate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Updates a company (admin only).
@@ -127,7 +157,7 @@ def update_company(
 def delete_company(
     company_id: int,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Deletes a company and all its associated machines and maintenances (admin only).
@@ -162,7 +192,7 @@ def upload_company_logo(
     company_id: int,
     logo: UploadFile = File(...),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_admin_user)
+    current_user: Principal = Depends(get_admin_user)
 ):
     """
     Uploads and updates the company's logo (admin only).
@@ -1,44 +1,112 @@
 import logging
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from pydantic import TypeAdapter
+from sqlalchemy import false
 from sqlalchemy.orm import Session
 
 from .. import database, crud, schemas, models
+from ..auth import Principal
 from ..dependencies import (
     get_current_user, 
     get_admin_user, 
     get_company_access, 
-    check_machine_access
+    accessible_machine,
+    company_scope,
+    conditional_get,
+    conditional_get_for,
+    response_cache
 )
 from ..notifications import notify_new_machine_added
 from ..crud import get_company_by_id
+from ..querying import DEFAULT_LIMIT, ListQuery, list_query
+from ..exports import ExportFormat, export_response
+from ..imports import ImportFormat, detect_format, import_rows, iter_rows, machine_preparer, notify_summary
+from ..serialization import MACHINE_ROWS, rows_response
+from ..projection import Selection, machine_projection
+from ..cache import CachedRoute
 
 router = APIRouter(prefix="/machines", tags=["machines"])
 
+# Filterable/sortable (indexed) fields, e.g. ?type=truck&company_id=3&sort=-purchase_date
+MACHINE_FIELDS = {
+    "id": models.Machine.id,
+    "name": models.Machine.name,
+    "type": models.Machine.type,
+    "company_id": models.Machine.company_id,
+    "purchase_date": models.Machine.purchase_date,
+}
+MACHINE_LIST = TypeAdapter(List[schemas.Machine])
 
-@router.get("/", response_model=List[schemas.Machine])
+MACHINE_PASSTHROUGH = ("fast", "fields", "embed")
+# Sem limite por omissão para a frota de uma empresa; o admin recebe DEFAULT_LIMIT (ver list_machines)
+machine_list_query = list_query(MACHINE_FIELDS, default_limit=None, passthrough=MACHINE_PASSTHROUGH)
+machine_export_query = list_query(MACHINE_FIELDS, default_limit=None, passthrough=("format",))
+
+
+@router.get("/", response_model=List[schemas.Machine], dependencies=[Depends(conditional_get)])
 def list_machines(
-    skip: int = 0,
-    limit: int = 100,
+    params: ListQuery = Depends(machine_list_query),
+    selection: Optional[Selection] = Depends(machine_projection),
+    fast: bool = False,
+    cached: CachedRoute = Depends(response_cache("machines")),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Lists machines. Admin can see all; fleet managers only their company's machines.
+    Supports the filter/sort grammar described in `querying.py`; `fast=true`
+    selects plain rows and encodes them with orjson (see `serialization.py`),
+    `fields`/`embed` project columns and relations (see `projection.py`).
+    Responses are cached per tenant (see `cache.py`). Fleet managers get
+    their whole fleet unless they ask for a page; admins get `DEFAULT_LIMIT`.
+    """
+    if current_user.role == models.UserRoleEnum.admin:
+        company_id = None
+        params = params.with_default_limit(DEFAULT_LIMIT)
+    elif current_user.company_id:
+        company_id = current_user.company_id
+    else:
+        return []
+
+    def produce():
+        if selection:
+            return selection.response(db, params.apply(selection.statement(company_id)))
+        if fast:
+            statement = params.apply(crud.machine_rows_statement(company_id))
+            return rows_response(MACHINE_ROWS, db.execute(statement).mappings())
+        if company_id is None:
+            return crud.get_machines(db, list_query=params)
+        return crud.get_machines_by_company(db, company_id, list_query=params)
+
+    return cached.respond(MACHINE_LIST, produce)
+
+
+@router.get("/export")
+def export_machines(
+    fmt: ExportFormat = Query("ndjson", alias="format"),
+    params: ListQuery = Depends(machine_export_query),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Streams machines as NDJSON or CSV in constant memory.
+    Accepts the same filters/sort as the list endpoint; tenant-scoped for fleet managers.
     """
     if current_user.role == models.UserRoleEnum.admin:
-        return crud.get_machines(db, skip=skip, limit=limit)
-    if current_user.company_id:
-        return crud.get_machines_by_company(db, current_user.company_id)
-    return []
+        statement = crud.machine_rows_statement()
+    elif current_user.company_id:
+        statement = crud.machine_rows_statement(current_user.company_id)
+    else:
+        statement = crud.machine_rows_statement().where(false())
+    return export_response(params.apply(statement), fmt, "machines")
 
 
 @router.post("/", response_model=schemas.Machine)
 def create_machine(
     machine: schemas.MachineCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Creates a new machine.
@@ -64,39 +132,62 @@ def create_machine(
     return new_machine
 
 
-@router.get("/{machine_id}", response_model=schemas.Machine)
+@router.post("/import", response_model=schemas.ImportReport)
+def import_machines(
+    file: UploadFile = File(...),
+    fmt: Optional[ImportFormat] = Query(None, alias="format"),
+    company_id: Optional[int] = Depends(company_scope),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Creates machines in bulk from a CSV or XLSX file: a header row with the
+    MachineCreate field names, then one machine per row. Rows without
+    company_id use ?company_id (or the fleet manager's company).
+    Returns the per-row errors; sends a single summary notification.
+    """
+    try:
+        fmt = detect_format(file.filename, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    company_ids = {cid for (cid,) in db.query(models.Company.id)}
+    result = import_rows(
+        db,
+        iter_rows(file.file, fmt),
+        machine_preparer(company_ids, default_company_id=company_id, restrict_to=company_id),
+        models.Machine.__table__,
+        "machines",
+    )
+    notify_summary(db, "máquinas", result)
+    return result.report()
+
+
+@router.get("/{machine_id}", response_model=schemas.Machine, dependencies=[Depends(conditional_get_for(accessible_machine))])
 def get_machine(
-    machine_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    machine: models.Machine = Depends(accessible_machine)
 ):
     """
     Retrieves details for a specific machine.
     Validates that the user has access to this machine.
     """
-    check_machine_access(machine_id, current_user, db)
-    machine = crud.get_machine_by_id(db, machine_id)
-    if not machine:
-        raise HTTPException(status_code=404, detail="Machine not found")
     return machine
 
 
 @router.put("/{machine_id}", response_model=schemas.Machine)
 def update_machine(
-    machine_id: int,
     machine_data: schemas.MachineUpdate,
+    machine: models.Machine = Depends(accessible_machine),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Updates machine details.
     Admin can update any; fleet managers can only update their company's machines.
     """
-    check_machine_access(machine_id, current_user, db)
     if machine_data.company_id is not None:
         get_company_access(machine_data.company_id, current_user)
 
-    updated_machine = crud.update_machine(db, machine_id, machine_data)
+    updated_machine = crud.update_machine(db, machine, machine_data)
     if not updated_machine:
         raise HTTPException(status_code=404, detail="Machine not found")
     return updated_machine
@@ -104,16 +195,14 @@ def update_machine(
 
 @router.delete("/{machine_id}", response_model=dict)
 def delete_machine(
-    machine_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    machine: models.Machine = Depends(accessible_machine),
+    db: Session = Depends(database.get_db)
 ):
     """
     Deletes a machine (and its maintenances).
     Admin can delete any; fleet managers only their own company's machines.
     """
-    check_machine_access(machine_id, current_user, db)
-    result = crud.delete_machine(db, machine_id)
+    result = crud.delete_machine(db, machine)
     if not result:
         raise HTTPException(status_code=404, detail="Machine not found")
 
@@ -123,15 +212,28 @@ def delete_machine(
     }
 
 
-@router.get("/company/{company_id}", response_model=List[schemas.Machine])
+@router.get("/company/{company_id}", response_model=List[schemas.Machine], dependencies=[Depends(conditional_get)])
 def get_company_machines(
     company_id: int,
+    params: ListQuery = Depends(machine_list_query),
+    selection: Optional[Selection] = Depends(machine_projection),
+    fast: bool = False,
+    cached: CachedRoute = Depends(response_cache("machines")),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Lists machines for a specific company.
     Admin can see any; fleet managers only their own company's machines.
     """
     get_company_access(company_id, current_user)
-    return crud.get_machines_by_company(db, company_id)
+
+    def produce():
+        if selection:
+            return selection.response(db, params.apply(selection.statement(company_id)))
+        if fast:
+            statement = params.apply(crud.machine_rows_statement(company_id))
+            return rows_response(MACHINE_ROWS, db.execute(statement).mappings())
+        return crud.get_machines_by_company(db, company_id, list_query=params)
+
+    return cached.respond(MACHINE_LIST, produce)
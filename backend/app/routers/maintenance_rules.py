@@ -0,0 +1,143 @@
+import logging
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from .. import database, crud, schemas, models
+from ..auth import Principal
+from ..dependencies import (
+    get_current_user,
+    accessible_machine,
+    accessible_maintenance_rule,
+    check_machine_access,
+    company_scope,
+    conditional_get,
+    conditional_get_for
+)
+from ..notifications import notify_maintenance_completed
+from ..crud import get_company_by_id
+
+# Registado antes de maintenances.router, cuja rota /{maintenance_id} apanharia "/rules"
+router = APIRouter(prefix="/maintenances/rules", tags=["maintenances"])
+
+
+@router.get("/", response_model=List[schemas.MaintenanceRule], dependencies=[Depends(conditional_get)])
+def list_maintenance_rules(
+    machine_id: Optional[int] = None,
+    company_id: Optional[int] = Depends(company_scope),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Lists recurring maintenance rules, optionally for one machine.
+    Admin sees all (or ?company_id); fleet managers see their own company's.
+    """
+    if machine_id is not None:
+        check_machine_access(machine_id, current_user, db)
+    return crud.get_maintenance_rules(db, company_id=company_id, machine_id=machine_id)
+
+
+@router.post("/", response_model=schemas.MaintenanceRule)
+def create_maintenance_rule(
+    rule: schemas.MaintenanceRuleCreate,
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Creates a recurring maintenance rule. Its occurrences show up in the
+    occurrence listing, the calendar and the reminders without being stored.
+    """
+    accessible_machine(rule.machine_id, current_user, db)
+    return crud.create_maintenance_rule(db, rule)
+
+
+@router.get("/{rule_id}", response_model=schemas.MaintenanceRule, dependencies=[Depends(conditional_get_for(accessible_maintenance_rule))])
+def get_maintenance_rule(
+    rule: models.MaintenanceRule = Depends(accessible_maintenance_rule)
+):
+    """
+    Retrieves rule details. Validates user access.
+    """
+    return rule
+
+
+@router.put("/{rule_id}", response_model=schemas.MaintenanceRule)
+def update_maintenance_rule(
+    rule_data: schemas.MaintenanceRuleUpdate,
+    rule: models.MaintenanceRule = Depends(accessible_maintenance_rule),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Updates a rule. Pending occurrences follow the new schedule; completed or
+    edited occurrences are kept.
+    """
+    try:
+        return crud.update_maintenance_rule(db, rule, rule_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.delete("/{rule_id}", response_model=dict)
+def delete_maintenance_rule(
+    rule: models.MaintenanceRule = Depends(accessible_maintenance_rule),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Deletes a rule and its pending occurrences. Completed or edited
+    occurrences remain as regular maintenances.
+    """
+    crud.delete_maintenance_rule(db, rule)
+    return {"success": True, "message": "Maintenance rule deleted successfully"}
+
+
+@router.put("/{rule_id}/occurrences/{occurrence_date}", response_model=schemas.Maintenance)
+def update_rule_occurrence(
+    occurrence_date: date,
+    maintenance_data: schemas.MaintenanceUpdate,
+    rule: models.MaintenanceRule = Depends(accessible_maintenance_rule),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Edits one occurrence of a rule (e.g. moves it to another date), which
+    stores it as a maintenance.
+    """
+    maintenance = crud.store_rule_occurrence(db, rule, occurrence_date, maintenance_data)
+    if not maintenance:
+        raise HTTPException(status_code=404, detail="The rule has no occurrence on this date")
+    return maintenance
+
+
+@router.patch("/{rule_id}/occurrences/{occurrence_date}/complete", response_model=schemas.Maintenance)
+def complete_rule_occurrence(
+    occurrence_date: date,
+    rule: models.MaintenanceRule = Depends(accessible_maintenance_rule),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Marks one occurrence of a rule as completed, storing it as a maintenance.
+    """
+    # A máquina já vem carregada: ler antes do commit, que expira a instância
+    machine_name = rule.machine.name
+    company_id = rule.machine.company_id
+    maintenance = crud.store_rule_occurrence(
+        db, rule, occurrence_date, schemas.MaintenanceUpdate(completed=True)
+    )
+    if not maintenance:
+        raise HTTPException(status_code=404, detail="The rule has no occurrence on this date")
+
+    company = get_company_by_id(db, company_id)
+    company_name = company.name if company else "Desconhecida"
+    try:
+        notify_maintenance_completed(
+            db,
+            machine_name=machine_name,
+            maintenance_type=maintenance.type,
+            company_id=company_id,
+            company_name=company_name
+        )
+    except Exception as e:
+        logging.error(f"Failed to send maintenance completion notification: {e}")
+
+    return maintenance
@@ -1,54 +1,251 @@
 import logging
-from typing import List
+from datetime import date, timedelta
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
+from pydantic import TypeAdapter
+from sqlalchemy import false
 from sqlalchemy.orm import Session
 
 from .. import database, crud, schemas, models
+from ..auth import Principal
 from ..dependencies import (
     get_current_user,
-    check_maintenance_access,
-    check_machine_access
+    get_company_access,
+    accessible_machine,
+    accessible_maintenance,
+    check_machine_access,
+    company_scope,
+    conditional_get,
+    conditional_get_for,
+    coalesced_read
 )
-from ..notifications import notify_new_maintenance_scheduled, notify_maintenance_completed
-from ..crud import get_machine_by_id, get_company_by_id
+from ..notifications import (
+    notify_new_maintenance_scheduled,
+    notify_maintenance_completed,
+    notify_maintenances_completed_bulk
+)
+from ..crud import get_company_by_id
+from ..querying import DEFAULT_LIMIT, ListQuery, list_query
+from ..exports import ExportFormat, export_response
+from ..imports import ImportFormat, detect_format, import_rows, iter_rows, maintenance_preparer, notify_summary
+from ..serialization import MAINTENANCE_ROWS, rows_response
+from ..projection import Selection, maintenance_projection
+from ..singleflight import CoalescedRoute
 
 router = APIRouter(prefix="/maintenances", tags=["maintenances"])
 
+# Janela máxima de /maintenances/occurrences (as regras são expandidas a pedido)
+OCCURRENCE_MAX_WINDOW_DAYS = 366
+
+# Filterable/sortable (indexed) fields; status/from/to are handled by the routes
+MAINTENANCE_FIELDS = {
+    "id": models.Maintenance.id,
+    "machine_id": models.Maintenance.machine_id,
+    "completed": models.Maintenance.completed,
+    "scheduled_date": models.Maintenance.scheduled_date,
+}
+
+MAINTENANCE_LIST = TypeAdapter(List[schemas.Maintenance])
+OCCURRENCE_LIST = TypeAdapter(List[schemas.MaintenanceOccurrence])
+CALENDAR = TypeAdapter(List[schemas.CalendarBucket])
+
+MAINTENANCE_PASSTHROUGH = ("status", "from", "to", "fast", "fields", "embed")
+# Sem limite por omissão (listas de uma empresa ou máquina); o admin recebe DEFAULT_LIMIT (ver list_maintenances)
+maintenance_list_query = list_query(MAINTENANCE_FIELDS, default_limit=None, passthrough=MAINTENANCE_PASSTHROUGH)
+maintenance_export_query = list_query(
+    MAINTENANCE_FIELDS, default_limit=None, passthrough=MAINTENANCE_PASSTHROUGH + ("format",)
+)
+
+
+def _maintenance_rows(
+    db: Session,
+    params: ListQuery,
+    selection: Optional[Selection] = None,
+    company_id: Optional[int] = None,
+    machine_id: Optional[int] = None,
+    **filters
+):
+    """Row-based orjson response for `fast=true` and `fields`/`embed` listings."""
+    if selection:
+        statement = selection.statement(company_id)
+    else:
+        statement = crud.maintenance_rows_statement(company_id)
+    if machine_id is not None:
+        statement = statement.where(models.Maintenance.machine_id == machine_id)
+    statement = params.apply(crud.filter_maintenances(statement, **filters))
+    if selection:
+        return selection.response(db, statement)
+    return rows_response(MAINTENANCE_ROWS, db.execute(statement).mappings())
 
-@router.get("/", response_model=List[schemas.Maintenance])
+
+@router.get("/", response_model=List[schemas.Maintenance], dependencies=[Depends(conditional_get)])
 def list_maintenances(
-    skip: int = 0,
-    limit: int = 100,
+    params: ListQuery = Depends(maintenance_list_query),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    selection: Optional[Selection] = Depends(maintenance_projection),
+    fast: bool = False,
+    coalesced: CoalescedRoute = Depends(coalesced_read),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Lists all maintenances. Admin sees all; fleet managers see only their own company's.
+    Optionally filtered by computed status (overdue, upcoming, scheduled, pending,
+    completed) and by a `from`/`to` scheduled date window. `fields`/`embed`
+    return only the requested columns, with machine/company nested in.
+    Fleet managers get all their maintenances unless they ask for a page;
+    admins get `DEFAULT_LIMIT`.
     """
+    filters = {
+        "status": status_filter.value if status_filter else None,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
     if current_user.role == models.UserRoleEnum.admin:
-        return crud.get_maintenances(db, skip=skip, limit=limit)
-    if current_user.company_id:
-        return crud.get_company_maintenances(db, current_user.company_id)
-    return []
+        company_id = None
+        params = params.with_default_limit(DEFAULT_LIMIT)
+    elif current_user.company_id:
+        company_id = current_user.company_id
+    else:
+        return []
+
+    def produce():
+        if selection or fast:
+            return _maintenance_rows(db, params, selection, company_id, **filters)
+        if company_id is None:
+            return crud.get_maintenances(db, list_query=params, **filters)
+        return crud.get_company_maintenances(db, company_id, list_query=params, **filters)
+
+    return coalesced.respond(MAINTENANCE_LIST, produce)
+
+
+@router.get("/export")
+def export_maintenances(
+    fmt: ExportFormat = Query("ndjson", alias="format"),
+    params: ListQuery = Depends(maintenance_export_query),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Streams maintenances (with computed status and machine name) as NDJSON or CSV.
+    Accepts the same filters as the list endpoint; tenant-scoped for fleet managers.
+    """
+    if current_user.role == models.UserRoleEnum.admin:
+        statement = crud.maintenance_rows_statement()
+    elif current_user.company_id:
+        statement = crud.maintenance_rows_statement(current_user.company_id)
+    else:
+        statement = crud.maintenance_rows_statement().where(false())
+
+    statement = crud.filter_maintenances(
+        statement,
+        status=status_filter.value if status_filter else None,
+        date_from=date_from,
+        date_to=date_to,
+    )
+    return export_response(params.apply(statement), fmt, "maintenances")
+
+
+@router.get("/calendar", response_model=List[schemas.CalendarBucket], dependencies=[Depends(conditional_get)])
+def get_maintenance_calendar(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    granularity: Literal["day", "week"] = "day",
+    top: int = Query(0, ge=0, le=20),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    company_id: Optional[int] = None,
+    coalesced: CoalescedRoute = Depends(coalesced_read),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Returns maintenance counts per day or week for calendar/heatmap views,
+    optionally with the first `top` events of each bucket. Defaults to the next
+    30 days; `status` narrows the events (e.g. `pending`). Admin may filter by
+    company; fleet managers always see their own company's.
+    """
+    date_from = date_from or date.today()
+    date_to = date_to or date_from + timedelta(days=29)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+
+    if current_user.role != models.UserRoleEnum.admin:
+        if not current_user.company_id:
+            return []
+        company_id = current_user.company_id
+    elif company_id is not None:
+        get_company_access(company_id, current_user)
+
+    return coalesced.respond(CALENDAR, lambda: crud.get_maintenance_calendar(
+        db,
+        date_from=date_from,
+        date_to=date_to,
+        granularity=granularity,
+        company_id=company_id,
+        status=status_filter.value if status_filter else None,
+        top_k=top,
+    ))
+
+
+@router.get("/occurrences", response_model=List[schemas.MaintenanceOccurrence], dependencies=[Depends(conditional_get)])
+def list_maintenance_occurrences(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    machine_id: Optional[int] = None,
+    company_id: Optional[int] = Depends(company_scope),
+    coalesced: CoalescedRoute = Depends(coalesced_read),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Lists the maintenances of a date window (default: the next 30 days,
+    at most a year) including the pending occurrences of recurring rules,
+    which have no `id` until they are completed or edited. Sorted by date.
+    """
+    date_from = date_from or date.today()
+    date_to = date_to or date_from + timedelta(days=29)
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (date_to - date_from).days >= OCCURRENCE_MAX_WINDOW_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The window may span at most {OCCURRENCE_MAX_WINDOW_DAYS} days"
+        )
+    if machine_id is not None:
+        check_machine_access(machine_id, current_user, db)
+
+    return coalesced.respond(OCCURRENCE_LIST, lambda: crud.get_maintenance_occurrences(
+        db,
+        date_from=date_from,
+        date_to=date_to,
+        company_id=company_id,
+        machine_id=machine_id,
+        status=status_filter.value if status_filter else None,
+    ))
 
 
 @router.post("/", response_model=schemas.Maintenance)
 def create_maintenance(
     maintenance: schemas.MaintenanceCreate,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Creates a new maintenance. Admin can create for any machine; fleet managers only for their own company's machines.
     """
-    check_machine_access(maintenance.machine_id, current_user, db)
+    machine = accessible_machine(maintenance.machine_id, current_user, db)
+    # Ler antes do commit, que expira a máquina carregada
+    machine_name = machine.name
+    company_id = machine.company_id
     new_maintenance = crud.create_maintenance(db, maintenance)
 
-    machine = get_machine_by_id(db, maintenance.machine_id)
-    if machine:
-        machine_name = machine.name
-        company_id = machine.company_id
+    if new_maintenance:
         company = get_company_by_id(db, company_id)
         company_name = company.name if company else "Desconhecida"
 
@@ -67,34 +264,88 @@ def create_maintenance(
     return new_maintenance
 
 
-@router.get("/{maintenance_id}", response_model=schemas.Maintenance)
+@router.post("/import", response_model=schemas.ImportReport)
+def import_maintenances(
+    file: UploadFile = File(...),
+    fmt: Optional[ImportFormat] = Query(None, alias="format"),
+    company_id: Optional[int] = Depends(company_scope),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Creates maintenances in bulk from a CSV or XLSX file (columns: machine_id
+    or license_plate, type, scheduled_date, completed, notes). Machines are
+    looked up within ?company_id (or the fleet manager's company).
+    Returns the per-row errors; sends a single summary notification.
+    """
+    try:
+        fmt = detect_format(file.filename, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    result = import_rows(
+        db,
+        iter_rows(file.file, fmt),
+        maintenance_preparer(db, company_id),
+        models.Maintenance.__table__,
+        "maintenances",
+    )
+    notify_summary(db, "manutenções", result)
+    return result.report()
+
+
+@router.post("/bulk", response_model=schemas.MaintenanceBulkResult)
+def bulk_maintenances(
+    request: schemas.MaintenanceBulkRequest,
+    company_id: Optional[int] = Depends(company_scope),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Completes, reschedules or deletes many maintenances at once, in one
+    transaction. Ids that do not exist or belong to another company are
+    returned in `not_found`. Completing sends one aggregated notification.
+    """
+    changed, found = crud.bulk_maintenance_action(
+        db,
+        request.action,
+        request.ids,
+        company_id=company_id,
+        scheduled_date=request.scheduled_date,
+    )
+
+    if request.action == "complete":
+        try:
+            notify_maintenances_completed_bulk(db, changed)
+        except Exception as e:
+            logging.error(f"Failed to send bulk completion notification: {e}")
+
+    return {
+        "action": request.action,
+        "matched": len(found),
+        "changed": sum(changed.values()),
+        "not_found": sorted(set(request.ids) - found),
+    }
+
+
+@router.get("/{maintenance_id}", response_model=schemas.Maintenance, dependencies=[Depends(conditional_get_for(accessible_maintenance))])
 def get_maintenance(
-    maintenance_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    maintenance: models.Maintenance = Depends(accessible_maintenance)
 ):
     """
     Retrieves maintenance details. Validates user access.
     """
-    check_maintenance_access(maintenance_id, current_user, db)
-    maintenance = crud.get_maintenance_by_id(db, maintenance_id)
-    if not maintenance:
-        raise HTTPException(status_code=404, detail="Maintenance not found")
     return maintenance
 
 
 @router.put("/{maintenance_id}", response_model=schemas.Maintenance)
 def update_maintenance(
-    maintenance_id: int,
     maintenance_data: schemas.MaintenanceUpdate,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    maintenance: models.Maintenance = Depends(accessible_maintenance),
+    db: Session = Depends(database.get_db)
 ):
     """
     Updates maintenance details. Admin can update any; fleet managers only their own company's.
     """
-    check_maintenance_access(maintenance_id, current_user, db)
-    updated_maintenance = crud.update_maintenance(db, maintenance_id, maintenance_data)
+    updated_maintenance = crud.update_maintenance(db, maintenance, maintenance_data)
     if not updated_maintenance:
         raise HTTPException(status_code=404, detail="Maintenance not found")
     return updated_maintenance
@@ -102,24 +353,18 @@ def update_maintenance(
 
 @router.patch("/{maintenance_id}/complete", response_model=schemas.Maintenance)
 def mark_maintenance_completed(
-    maintenance_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    maintenance_before: models.Maintenance = Depends(accessible_maintenance),
+    db: Session = Depends(database.get_db)
 ):
     """
     Marks a maintenance as completed. Admin can update any; fleet managers only their own company's.
     """
-    check_maintenance_access(maintenance_id, current_user, db)
-    maintenance_before = crud.get_maintenance_by_id(db, maintenance_id)
-    if not maintenance_before:
-        raise HTTPException(status_code=404, detail="Maintenance not found")
-
-    maintenance = crud.update_maintenance_status(db, maintenance_id, True)
+    # A máquina já vem carregada: ler antes do commit, que expira a instância
+    machine_name = maintenance_before.machine.name
+    company_id = maintenance_before.machine.company_id
+    maintenance = crud.update_maintenance_status(db, maintenance_before, True)
 
-    if maintenance and maintenance_before.machine:
-        machine = maintenance_before.machine
-        machine_name = machine.name
-        company_id = machine.company_id
+    if maintenance:
         company = get_company_by_id(db, company_id)
         company_name = company.name if company else "Desconhecida"
 
@@ -139,44 +384,69 @@ def mark_maintenance_completed(
 
 @router.delete("/{maintenance_id}", response_model=dict)
 def delete_maintenance(
-    maintenance_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    maintenance: models.Maintenance = Depends(accessible_maintenance),
+    db: Session = Depends(database.get_db)
 ):
     """
     Deletes a maintenance. Admin can delete any; fleet managers only their own company's.
     """
-    check_maintenance_access(maintenance_id, current_user, db)
-    result = crud.delete_maintenance(db, maintenance_id)
+    result = crud.delete_maintenance(db, maintenance)
     if not result:
         raise HTTPException(status_code=404, detail="Maintenance not found")
 
     return {"success": True, "message": "Maintenance deleted successfully"}
 
 
-@router.get("/machine/{machine_id}", response_model=List[schemas.Maintenance])
+@router.get("/machine/{machine_id}", response_model=List[schemas.Maintenance], dependencies=[Depends(conditional_get_for(accessible_machine))])
 def get_machine_maintenances(
     machine_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    params: ListQuery = Depends(maintenance_list_query),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    selection: Optional[Selection] = Depends(maintenance_projection),
+    fast: bool = False,
+    db: Session = Depends(database.get_db)
 ):
     """
     Lists maintenances for a specific machine.
-    Validates user access, then retrieves the data.
+    Access is validated by the conditional GET dependency (`accessible_machine`).
     """
-    check_machine_access(machine_id, current_user, db)
-    return crud.get_machine_maintenances(db, machine_id)
+    filters = {
+        "status": status_filter.value if status_filter else None,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    if selection or fast:
+        return _maintenance_rows(db, params, selection, machine_id=machine_id, **filters)
+    return crud.get_machine_maintenances(db, machine_id, list_query=params, **filters)
 
 
-@router.get("/company/{company_id}", response_model=List[schemas.Maintenance])
+@router.get("/company/{company_id}", response_model=List[schemas.Maintenance], dependencies=[Depends(conditional_get)])
 def get_company_maintenances(
     company_id: int,
+    params: ListQuery = Depends(maintenance_list_query),
+    status_filter: Optional[schemas.MaintenanceStatusFilter] = Query(None, alias="status"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    selection: Optional[Selection] = Depends(maintenance_projection),
+    fast: bool = False,
+    coalesced: CoalescedRoute = Depends(coalesced_read),
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Lists maintenances for a specific company. Validates access first.
     """
-    from ..dependencies import get_company_access
     get_company_access(company_id, current_user)
-    return crud.get_company_maintenances(db, company_id)
+    filters = {
+        "status": status_filter.value if status_filter else None,
+        "date_from": date_from,
+        "date_to": date_to,
+    }
+    def produce():
+        if selection or fast:
+            return _maintenance_rows(db, params, selection, company_id, **filters)
+        return crud.get_company_maintenances(db, company_id, list_query=params, **filters)
+
+    return coalesced.respond(MAINTENANCE_LIST, produce)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, Depends
+
+from .. import cache, hashing, singleflight
+from ..auth import Principal
+from ..dependencies import get_admin_user
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/cache")
+def cache_metrics(current_user: Principal = Depends(get_admin_user)):
+    """
+    Response cache counters (hits, misses, evictions, invalidations) and hit
+    ratio of this worker. Admin only.
+    """
+    return cache.stats()
+
+
+@router.get("/singleflight")
+def singleflight_metrics(current_user: Principal = Depends(get_admin_user)):
+    """
+    Request coalescing counters of this worker: `executed` reads hit the
+    database, `shared` reads reused an in-flight result. Admin only.
+    """
+    return singleflight.group.stats()
+
+
+@router.get("/hashing")
+def hashing_metrics(current_user: Principal = Depends(get_admin_user)):
+    """
+    Password hashing pool of this worker: calls `pending` (running or
+    queued), `completed`, and `rejected` with a 503. Admin only.
+    """
+    return hashing.pool.stats()
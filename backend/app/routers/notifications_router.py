@@ -4,6 +4,7 @@ from pydantic import BaseModel
 from typing import Optional
 
 from .. import database, models
+from ..auth import Principal
 from ..dependencies import get_current_user
 from ..notifications import notify_specific_user, send_sms_notification
 
@@ -18,7 +19,7 @@ class TestNotificationRequest(BaseModel):
 def test_notification(
     request: TestNotificationRequest,
     db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Sends a test notification to the current user or a specific user (admin only).
@@ -0,0 +1,34 @@
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from .. import database, models, schemas
+from ..auth import Principal
+from ..dependencies import get_current_user
+from ..search import MAX_RESULTS, search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("/", response_model=List[schemas.SearchHit])
+def search_fleet(
+    q: str = Query(..., min_length=2, max_length=100),
+    kind: Optional[Literal["machine", "company"]] = None,
+    limit: int = Query(20, ge=1, le=MAX_RESULTS),
+    db: Session = Depends(database.get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Fuzzy search over machine names, license plates, VINs, serial numbers and
+    company names. Admins search every tenant; fleet managers only their own company.
+    """
+    if current_user.role == models.UserRoleEnum.admin:
+        company_id = None
+    elif current_user.company_id:
+        company_id = current_user.company_id
+    else:
+        return []
+
+    kinds = (kind,) if kind else ("machine", "company")
+    return search(db, q, company_id=company_id, kinds=kinds, limit=limit)
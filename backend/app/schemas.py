@@ -1,8 +1,8 @@
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Literal, Optional, List
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, model_validator
 
 # Enums
 class MachineTypeEnum(str, Enum):
@@ -15,6 +15,21 @@ class UserRoleEnum(str, Enum):
     FLEET_MANAGER = "fleet_manager"
 
 
+class MaintenanceStatusEnum(str, Enum):
+    COMPLETED = "completed"
+    OVERDUE = "overdue"
+    UPCOMING = "upcoming"
+    SCHEDULED = "scheduled"
+
+
+class MaintenanceStatusFilter(str, Enum):
+    COMPLETED = "completed"
+    OVERDUE = "overdue"
+    UPCOMING = "upcoming"
+    SCHEDULED = "scheduled"
+    PENDING = "pending"
+
+
 # User schemas
 class UserBase(BaseModel):
     """
@@ -212,17 +227,157 @@ class MaintenanceUpdate(BaseModel):
     notes: Optional[str] = None
 
 
+class MaintenanceImportRow(BaseModel):
+    """
+    One row of a maintenance import. The machine is given by `machine_id` or,
+    for machines created by an earlier import, by `license_plate`.
+    """
+    machine_id: Optional[int] = None
+    license_plate: Optional[str] = None
+    type: str
+    scheduled_date: date
+    completed: bool = False
+    notes: Optional[str] = None
+
+
+# Limite de ids por pedido em /maintenances/bulk
+MAINTENANCE_BULK_MAX_IDS = 5000
+
+
+class MaintenanceBulkRequest(BaseModel):
+    """
+    A set-based operation on many maintenances: mark them completed,
+    move them to `scheduled_date`, or delete them.
+    """
+    action: Literal["complete", "reschedule", "delete"]
+    ids: List[int] = Field(..., min_length=1, max_length=MAINTENANCE_BULK_MAX_IDS)
+    scheduled_date: Optional[date] = None
+
+    @model_validator(mode="after")
+    def _check_date(self):
+        if self.action == "reschedule" and self.scheduled_date is None:
+            raise ValueError("scheduled_date is required to reschedule")
+        return self
+
+
+class MaintenanceBulkResult(BaseModel):
+    """
+    Outcome of a bulk operation. `matched` ids were found (and accessible);
+    `changed` rows were actually modified; `not_found` lists the other ids.
+    """
+    action: str
+    matched: int
+    changed: int
+    not_found: List[int] = []
+
+
 class Maintenance(MaintenanceBase):
     """
     Returns maintenance data with its ID and completion status.
+    `status` and `days_delta` are computed by the database relative to today.
     """
     id: int
     completed: bool = False
+    status: Optional[MaintenanceStatusEnum] = None
+    days_delta: Optional[int] = None
+    rule_id: Optional[int] = None
+    occurrence_date: Optional[date] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MaintenanceOccurrence(Maintenance):
+    """
+    A maintenance in a date window: a stored maintenance, or an occurrence of
+    a recurring rule that was not completed or edited yet (`id` is None; use
+    `rule_id` and `occurrence_date` to complete or edit it).
+    """
+    id: Optional[int] = None
+    machine_name: Optional[str] = None
+    company_id: Optional[int] = None
+
+
+# Recurring maintenance rule schemas
+class MaintenanceRuleBase(BaseModel):
+    """
+    A periodic maintenance: every `interval_days` days or every
+    `interval_months` months (on the anchor's day of the month), starting on
+    `anchor_date` and until `end_date` (inclusive, optional).
+    """
+    machine_id: int
+    type: str
+    interval_days: Optional[int] = Field(None, ge=1)
+    interval_months: Optional[int] = Field(None, ge=1)
+    anchor_date: date
+    end_date: Optional[date] = None
+    notes: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_interval(self):
+        if (self.interval_days is None) == (self.interval_months is None):
+            raise ValueError("Set exactly one of interval_days or interval_months")
+        if self.end_date is not None and self.end_date < self.anchor_date:
+            raise ValueError("end_date must not be before anchor_date")
+        return self
+
+
+class MaintenanceRuleCreate(MaintenanceRuleBase):
+    """
+    Schema used when creating a recurring maintenance rule.
+    """
+    pass
+
+
+class MaintenanceRuleUpdate(BaseModel):
+    """
+    Schema used for updating a rule. The machine cannot be changed; set
+    `interval_days` or `interval_months` to null to switch between them.
+    """
+    type: Optional[str] = None
+    interval_days: Optional[int] = Field(None, ge=1)
+    interval_months: Optional[int] = Field(None, ge=1)
+    anchor_date: Optional[date] = None
+    end_date: Optional[date] = None
+    notes: Optional[str] = None
+
+
+class MaintenanceRule(MaintenanceRuleBase):
+    """
+    Returns rule data with its ID.
+    """
+    id: int
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
 
+class CalendarEvent(BaseModel):
+    """
+    A maintenance shown inside a calendar bucket. Occurrences of recurring
+    rules that are not stored yet have no `id`.
+    """
+    id: Optional[int] = None
+    rule_id: Optional[int] = None
+    type: str
+    scheduled_date: date
+    status: Optional[MaintenanceStatusEnum] = None
+    machine_id: int
+    machine_name: Optional[str] = None
+    company_id: Optional[int] = None
+    company_name: Optional[str] = None
+
+
+class CalendarBucket(BaseModel):
+    """
+    Number of maintenances in one day/week bucket, plus its first events.
+    """
+    bucket: date
+    count: int
+    events: List[CalendarEvent] = []
+
+
 # Token schemas
 class Token(BaseModel):
     """
@@ -234,6 +389,16 @@ class Token(BaseModel):
     username: str
     role: str
     company_id: Optional[int] = None
+    # Segundos até o access token expirar
+    expires_in: Optional[int] = None
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    """
+    Body of /auth/refresh and /auth/logout.
+    """
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -339,4 +504,96 @@ class Invoice(InvoiceBase):
     items: List[InvoiceItem]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# Schemas de faturação recorrente
+class BillingPlanBase(BaseModel):
+    company_id: int
+    service_id: int
+    machine_id: Optional[int] = None
+    quantity: float = 1.0
+    unit_price: Optional[float] = None  # Se não fornecido, usa o preço do serviço
+    tax_rate: Optional[float] = None    # Se não fornecido, usa a taxa do serviço
+    description: Optional[str] = None
+    interval_months: int = Field(1, ge=1)  # 1 = mensal, 3 = trimestral, 12 = anual
+    start_date: date
+    end_date: Optional[date] = None
+    is_active: bool = True
+
+class BillingPlanCreate(BillingPlanBase):
+    pass
+
+class BillingPlanUpdate(BaseModel):
+    quantity: Optional[float] = None
+    unit_price: Optional[float] = None
+    tax_rate: Optional[float] = None
+    description: Optional[str] = None
+    interval_months: Optional[int] = Field(None, ge=1)
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    is_active: Optional[bool] = None
+
+class BillingPlan(BillingPlanBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class BillingRunCreate(BaseModel):
+    period: date  # Qualquer dia do mês a faturar
+    issue_date: Optional[date] = None
+    due_date: Optional[date] = None
+    invoice_status: InvoiceStatus = InvoiceStatus.DRAFT
+
+class BillingRun(BaseModel):
+    id: int
+    period: date
+    issue_date: date
+    due_date: date
+    invoice_status: InvoiceStatus
+    status: Literal["pending", "running", "completed", "failed"]
+    last_company_id: int
+    invoices_created: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+# Schemas de pesquisa
+class SearchHit(BaseModel):
+    """
+    A ranked search match for a machine or company.
+    """
+    kind: str
+    id: int
+    label: str
+    company_id: Optional[int] = None
+    matched_field: str
+    matched_value: Optional[str] = None
+    score: float
+
+
+# Schemas para importações em massa
+class ImportRowError(BaseModel):
+    """
+    Errors of one rejected row; `row` is the spreadsheet row (header = 1).
+    """
+    row: int
+    errors: List[str]
+
+
+class ImportReport(BaseModel):
+    """
+    Result of a CSV/XLSX import. `errors` is capped; `failed` counts every
+    rejected row. `aborted` is set when the file could not be read to the end.
+    """
+    created: int
+    failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    aborted: Optional[str] = None
@@ -0,0 +1,293 @@
+"""Fuzzy search over machines (name, plate, VIN, serial) and companies.
+
+On PostgreSQL the queries use ``pg_trgm`` (``similarity`` for ranking, the
+``%`` and ``ILIKE`` operators for matching) so they are served by the GIN
+trigram indexes created in ``database/migrate_add_search_indexes.py``.
+
+Other dialects (SQLite in development) fall back to an in-process trie that
+stores the first ``LOCAL_KEY_LENGTH`` characters of every suffix of every
+normalized value (memory grows linearly with the values, not quadratically).
+A prefix lookup in the trie finds the values containing the start of the
+query; longer queries are then checked against the whole value.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, literal, or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+MAX_RESULTS = 50
+# Tempo máximo (segundos) antes de reconstruir o índice local
+LOCAL_INDEX_TTL = 300
+# Número máximo de candidatos recolhidos da trie antes de ordenar
+LOCAL_CANDIDATE_CAP = 5000
+# Caracteres indexados por sufixo; consultas mais longas são verificadas no valor
+LOCAL_KEY_LENGTH = 4
+
+MACHINE_SEARCH_FIELDS = {
+    "name": models.Machine.name,
+    "license_plate": models.Machine.license_plate,
+    "vehicle_identification_number": models.Machine.vehicle_identification_number,
+    "serial_number": models.Machine.serial_number,
+}
+
+_NORMALIZE_RE = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(value: Optional[str]) -> str:
+    """Lowercase and drop separators so 'AA-12-BB' matches 'aa12bb'."""
+    return _NORMALIZE_RE.sub("", (value or "").lower())
+
+
+def _like_pattern(q: str) -> str:
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _matched_field(q: str, values: Dict[str, Optional[str]]) -> Tuple[str, Optional[str]]:
+    """Pick the field that best explains a hit, preferring substring matches."""
+    nq = normalize(q)
+    for field, value in values.items():
+        if value and nq and nq in normalize(value):
+            return field, value
+    return "name", values.get("name")
+
+
+# ──────────────────────────────
+# PostgreSQL (pg_trgm)
+# ──────────────────────────────
+def _search_postgres(
+    db: Session, q: str, company_id: Optional[int], kinds: Iterable[str], limit: int
+) -> List[dict]:
+    pattern = _like_pattern(q)
+    results: List[dict] = []
+
+    if "machine" in kinds:
+        columns = list(MACHINE_SEARCH_FIELDS.values())
+        score = func.greatest(
+            *(
+                case((column.ilike(pattern), literal(1.0)), else_=func.similarity(column, q))
+                for column in columns
+            )
+        ).label("score")
+        query = db.query(
+            models.Machine.id,
+            models.Machine.company_id,
+            *columns,
+            score,
+        ).filter(or_(*(column.ilike(pattern) for column in columns), *(column.op("%")(q) for column in columns)))
+        if company_id is not None:
+            query = query.filter(models.Machine.company_id == company_id)
+
+        for row in query.order_by(score.desc()).limit(limit):
+            values = {field: getattr(row, field) for field in MACHINE_SEARCH_FIELDS}
+            field, value = _matched_field(q, values)
+            results.append({
+                "kind": "machine",
+                "id": row.id,
+                "label": row.name,
+                "company_id": row.company_id,
+                "matched_field": field,
+                "matched_value": value,
+                "score": float(row.score),
+            })
+
+    if "company" in kinds:
+        name = models.Company.name
+        score = case((name.ilike(pattern), literal(1.0)), else_=func.similarity(name, q)).label("score")
+        query = db.query(models.Company.id, name, score).filter(or_(name.ilike(pattern), name.op("%")(q)))
+        if company_id is not None:
+            query = query.filter(models.Company.id == company_id)
+
+        for row in query.order_by(score.desc()).limit(limit):
+            results.append({
+                "kind": "company",
+                "id": row.id,
+                "label": row.name,
+                "company_id": row.id,
+                "matched_field": "name",
+                "matched_value": row.name,
+                "score": float(row.score),
+            })
+
+    return results
+
+
+# ──────────────────────────────
+# Fallback: in-process suffix trie
+# ──────────────────────────────
+class _TrieNode:
+    __slots__ = ("children", "refs")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.refs: List[int] = []
+
+
+class PrefixTrie:
+    """Character trie mapping keys to integer references."""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, key: str, ref: int) -> None:
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+        node.refs.append(ref)
+
+    def collect(self, prefix: str, cap: int, accept: Optional[Callable[[int], bool]] = None) -> set:
+        """
+        Return up to *cap* references stored under *prefix*. With *accept*,
+        only references it accepts are returned (and count towards *cap*).
+        """
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+
+        found: set = set()
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            for ref in current.refs:
+                if ref not in found and (accept is None or accept(ref)):
+                    found.add(ref)
+                    if len(found) >= cap:
+                        return found
+            stack.extend(current.children.values())
+        return found
+
+
+class LocalSearchIndex:
+    """Suffix trie over machine and company fields, rebuilt lazily when stale."""
+
+    def __init__(self, ttl: int = LOCAL_INDEX_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._trie: Optional[PrefixTrie] = None
+        self._entries: List[dict] = []
+        self._built_at = 0.0
+
+    def invalidate(self) -> None:
+        """Force a rebuild on the next search (called by crud writes)."""
+        self._built_at = 0.0
+
+    def _add(self, trie: PrefixTrie, entry: dict) -> None:
+        ref = len(self._entries)
+        self._entries.append(entry)
+        value = entry["normalized"]
+        for start in range(len(value)):
+            trie.insert(value[start:start + LOCAL_KEY_LENGTH], ref)
+
+    def _build(self, db: Session) -> None:
+        trie = PrefixTrie()
+        self._entries = []
+
+        columns = list(MACHINE_SEARCH_FIELDS.values())
+        for row in db.query(models.Machine.id, models.Machine.company_id, *columns):
+            for field in MACHINE_SEARCH_FIELDS:
+                value = getattr(row, field)
+                if value:
+                    self._add(trie, {
+                        "kind": "machine",
+                        "id": row.id,
+                        "label": row.name,
+                        "company_id": row.company_id,
+                        "matched_field": field,
+                        "matched_value": value,
+                        "normalized": normalize(value),
+                    })
+
+        for row in db.query(models.Company.id, models.Company.name):
+            self._add(trie, {
+                "kind": "company",
+                "id": row.id,
+                "label": row.name,
+                "company_id": row.id,
+                "matched_field": "name",
+                "matched_value": row.name,
+                "normalized": normalize(row.name),
+            })
+
+        self._trie = trie
+        self._built_at = time.monotonic()
+
+    def search(
+        self, db: Session, q: str, company_id: Optional[int], kinds: Iterable[str], limit: int
+    ) -> List[dict]:
+        with self._lock:
+            if self._trie is None or time.monotonic() - self._built_at > self.ttl:
+                self._build(db)
+            trie, entries = self._trie, self._entries
+
+        nq = normalize(q)
+        if not nq:
+            return []
+
+        def accept(ref: int) -> bool:
+            # Filtrar ao recolher: o limite de candidatos conta só os do tenant
+            entry = entries[ref]
+            return (
+                entry["kind"] in kinds
+                and (company_id is None or entry["company_id"] == company_id)
+                and (len(nq) <= LOCAL_KEY_LENGTH or nq in entry["normalized"])
+            )
+
+        best: Dict[Tuple[str, int], dict] = {}
+        for ref in trie.collect(nq[:LOCAL_KEY_LENGTH], LOCAL_CANDIDATE_CAP, accept):
+            entry = entries[ref]
+            # Coverage of the value by the query, with a bonus for prefix hits
+            score = len(nq) / len(entry["normalized"])
+            if entry["normalized"].startswith(nq):
+                score += 1.0
+            key = (entry["kind"], entry["id"])
+            if key not in best or score > best[key]["score"]:
+                best[key] = {k: v for k, v in entry.items() if k != "normalized"}
+                best[key]["score"] = score
+
+        return sorted(best.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+
+
+local_index = LocalSearchIndex()
+
+
+def search(
+    db: Session,
+    q: str,
+    *,
+    company_id: Optional[int] = None,
+    kinds: Iterable[str] = ("machine", "company"),
+    limit: int = 20,
+) -> List[dict]:
+    """
+    Ranked search across machines and companies.
+
+    Args:
+        db: Database session
+        q: Free-text query (partial plate, VIN, serial number or name)
+        company_id: Restrict hits to this tenant (None = all, admins only)
+        kinds: Entity kinds to search ("machine", "company")
+        limit: Maximum number of hits returned
+
+    Returns:
+        Hits as dicts, best first
+    """
+    q = q.strip()
+    kinds = set(kinds)
+    limit = min(limit, MAX_RESULTS)
+    if not q:
+        return []
+
+    if db.get_bind().dialect.name == "postgresql":
+        hits = _search_postgres(db, q, company_id, kinds, limit)
+        return sorted(hits, key=lambda hit: hit["score"], reverse=True)[:limit]
+    return local_index.search(db, q, company_id, kinds, limit)
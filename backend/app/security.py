@@ -1,11 +1,13 @@
 import os
+import hashlib
 import logging
+import secrets
 from dotenv import load_dotenv
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
 from typing import Optional, Dict, Any
 from . import models
+from .hashing import hash_password, verify_and_update, verify_and_update_async
 
 load_dotenv()
 
@@ -22,17 +24,24 @@ ALGORITHM = os.getenv("ALGORITHM", "HS256")
 # Fallback to 30 minutes if the environment variable is not set
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Refresh tokens renew access tokens without bcrypt; the family expires this
+# many days after login, whatever the number of rotations
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
 
+# Download links (e.g. report exports) carry a short-lived token in the URL,
+# because the browser cannot send the Authorization header. It is signed with
+# a key derived from SECRET_KEY, so it is never accepted as an access token.
+DOWNLOAD_TOKEN_EXPIRE_SECONDS = int(os.getenv("DOWNLOAD_TOKEN_EXPIRE_SECONDS", "300"))
+DOWNLOAD_TOKEN_KEY = hashlib.sha256(f"download:{SECRET_KEY}".encode("utf-8")).hexdigest()
 
 def generate_hash(password: str) -> str:
-    """Generate a bcrypt hash from a plain text password."""
-    return pwd_context.hash(password)
+    """Generate a bcrypt hash from a plain text password (in the hashing pool)."""
+    return hash_password(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Check if the plain text password matches the stored bcrypt hash."""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Check if the plain text password matches the stored bcrypt hash (in the hashing pool)."""
+    return verify_and_update(plain_password, hashed_password)[0]
 
 
 def create_token(payload: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
@@ -62,6 +71,33 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+def create_download_token(user_id: int, username: str, resource: str, params: Dict[str, Any]) -> str:
+    """
+    Signed token for one download of *resource* with *params* (JSON values),
+    valid for DOWNLOAD_TOKEN_EXPIRE_SECONDS.
+    """
+    payload = {
+        "sub": username,
+        "user_id": user_id,
+        "resource": resource,
+        "params": params,
+        "exp": datetime.utcnow() + timedelta(seconds=DOWNLOAD_TOKEN_EXPIRE_SECONDS),
+    }
+    return jwt.encode(payload, DOWNLOAD_TOKEN_KEY, algorithm=ALGORITHM)
+
+
+def verify_download_token(token: str, resource: str) -> Optional[Dict[str, Any]]:
+    """Payload of a download token for *resource*, or None if invalid, expired or for another resource."""
+    try:
+        payload = jwt.decode(token, DOWNLOAD_TOKEN_KEY, algorithms=[ALGORITHM])
+    except JWTError as exc:
+        logger.info(f"Download token rejected: {exc}")
+        return None
+    if payload.get("resource") != resource or not payload.get("sub"):
+        return None
+    return payload
+
+
 def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None) -> str:
     """
     Create a JWT for the given user, including role and optional company information.
@@ -76,3 +112,16 @@ def create_user_token(user: models.User, expires_delta: Optional[timedelta] = No
         token_data["company_id"] = user.company_id
 
     return create_token(token_data, expires_delta=expires_delta)
+
+
+def new_refresh_token() -> str:
+    """Generate an opaque, URL-safe refresh token (256 random bits)."""
+    return secrets.token_urlsafe(32)
+
+
+def hash_refresh_token(token: str) -> str:
+    """
+    SHA-256 of a refresh token, as stored in the database. The token is random
+    and high-entropy, so a fast hash is enough (unlike passwords).
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
@@ -0,0 +1,72 @@
+"""Fast JSON path for large ORM-backed list responses.
+
+The default path loads ORM objects, validates each one through a
+``from_attributes`` Pydantic model and encodes the result with the standard
+JSON encoder. The fast path (opt-in with ``?fast=true``) instead:
+
+1. selects exactly the needed columns as rows (no ORM identity map),
+2. validates the row dicts with TypeAdapters built once at import time,
+3. encodes with orjson.
+"""
+
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, List, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from . import schemas
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (dates, enums and UUIDs natively)."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MachineRow(TypedDict):
+    id: int
+    name: str
+    type: schemas.MachineTypeEnum
+    company_id: int
+    brand: Optional[str]
+    model: Optional[str]
+    year: Optional[int]
+    serial_number: Optional[str]
+    purchase_date: Optional[date]
+    license_plate: Optional[str]
+    vehicle_identification_number: Optional[str]
+    location: Optional[str]
+    installation_date: Optional[date]
+
+
+class MaintenanceRow(TypedDict):
+    id: int
+    machine_id: int
+    type: str
+    scheduled_date: date
+    completed: Optional[bool]
+    notes: Optional[str]
+    status: Optional[schemas.MaintenanceStatusEnum]
+    days_delta: Optional[int]
+    rule_id: Optional[int]
+    occurrence_date: Optional[date]
+    machine_name: Optional[str]
+    company_id: Optional[int]
+
+
+# Precompiled once; validating plain dicts avoids per-object attribute lookups
+MACHINE_ROWS = TypeAdapter(List[MachineRow])
+MAINTENANCE_ROWS = TypeAdapter(List[MaintenanceRow])
+
+
+def rows_response(adapter: TypeAdapter, rows) -> ORJSONResponse:
+    """Validate SQL result *rows* (mappings) with *adapter* and encode with orjson."""
+    return ORJSONResponse(adapter.validate_python([dict(row) for row in rows]))
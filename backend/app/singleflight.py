@@ -0,0 +1,105 @@
+"""Request coalescing ("single-flight") for identical concurrent reads.
+
+When several requests with the same key arrive while the first one is still
+running, only that first request (the leader) executes; the others wait for
+it and reuse its result or exception. Routes share the *rendered* response
+body, never ORM objects, because those belong to the leader's session.
+
+Sync routes run in the worker thread pool, so waiting is a plain
+``threading.Event`` wait. Coalescing is per process; across workers the
+shared response cache (``cache.py``) plays that role.
+"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from .serialization import ORJSONResponse
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Group of in-flight calls keyed by string."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """Run *fn* once for all concurrent callers with the same *key*."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            # Retirar antes de acordar: pedidos seguintes fazem uma leitura nova
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executed + self.shared
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+                "shared_ratio": round(self.shared / total, 4) if total else 0.0,
+            }
+
+
+group = SingleFlight()
+
+
+def render(adapter: TypeAdapter, result: Any) -> bytes:
+    """JSON body of a route result: ORM objects via *adapter*, or a rendered Response."""
+    if isinstance(result, Response):
+        return result.body
+    return adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+
+
+@dataclass
+class CoalescedRoute:
+    """Single-flight key for one request (see `dependencies.coalesced_read`)."""
+
+    key: str
+
+    def respond(self, adapter: TypeAdapter, produce: Callable[[], Any]) -> Response:
+        """Run *produce* once per group of identical concurrent requests."""
+        body = group.do(self.key, lambda: render(adapter, produce()))
+        return Response(content=body, media_type=ORJSONResponse.media_type)
@@ -0,0 +1,83 @@
+"""
+Microbenchmark do caminho de autenticação (dependencies.get_current_user).
+
+Compara, para o mesmo token:
+  - só descodificar o JWT;
+  - get_current_user sem cache de principal (uma consulta por pedido);
+  - get_current_user com a cache de principal (auth.py).
+
+Usa a base de dados configurada em DATABASE_URL (apenas leituras) e um
+utilizador existente.
+
+Uso:
+    python benchmarks/bench_auth.py <username> [iterações]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from jose import jwt
+from sqlalchemy import event
+
+from app import crud, database
+from app.auth import principal_cache
+from app.dependencies import get_current_user
+from app.security import ALGORITHM, SECRET_KEY, create_user_token
+
+
+def measure(label, fn, iterations, queries):
+    fn()  # aquecimento
+    queries[0] = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(
+        f"  {label:<28} {elapsed / iterations * 1e6:>9.1f} µs/pedido"
+        f"  {queries[0] / iterations:>5.2f} consultas/pedido"
+    )
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    username = sys.argv[1]
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    queries = [0]
+
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def count_query(*_):
+        queries[0] += 1
+
+    db = database.SessionLocal()
+    try:
+        user = crud.get_user_by_username(db, username)
+        if not user:
+            sys.exit(f"Utilizador '{username}' não encontrado")
+        token = create_user_token(user)
+
+        print(f"{iterations} pedidos autenticados como '{username}'")
+        measure("JWT decode", lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), iterations, queries)
+
+        ttl = principal_cache.ttl
+        principal_cache.ttl = 0
+        principal_cache.clear()
+
+        def uncached():
+            get_current_user(token=token, db=db)
+            # Sem identity map entre pedidos, como numa sessão nova por pedido
+            db.expunge_all()
+
+        measure("sem cache de principal", uncached, iterations, queries)
+
+        principal_cache.ttl = ttl
+        measure("com cache de principal", lambda: get_current_user(token=token, db=db), iterations, queries)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
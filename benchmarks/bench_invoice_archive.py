@@ -0,0 +1,105 @@
+"""
+Benchmark: escalabilidade da renderização de PDFs de faturas com o número de
+processos do pool (invoice_pdf.RenderPool), tal como a usa o arquivo ZIP.
+
+Renderiza N faturas sintéticas para uma cache vazia com 1, 2, 4, ... processos
+(até ao número de cores) e mostra faturas/s e o ganho face a um processo.
+Não precisa de base de dados.
+
+    python benchmarks/bench_invoice_archive.py --invoices 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def synthetic_document(n):
+    items = [
+        {
+            "description": f"Serviço {k} - máquina {n % 50}",
+            "quantity": float(k + 1),
+            "unit_price": 42.5,
+            "tax_rate": 23.0,
+            "total": 42.5 * (k + 1) * 1.23,
+        }
+        for k in range(1 + n % 8)
+    ]
+    subtotal = sum(item["quantity"] * item["unit_price"] for item in items)
+    return {
+        "invoice_number": f"FT-BENCH-{n:06d}",
+        "issue_date": date(2026, 9, 1) + timedelta(days=n % 28),
+        "due_date": date(2026, 10, 31),
+        "company": {
+            "name": f"Empresa {n % 300}",
+            "tax_id": f"{500000000 + n % 300}",
+            "address": "Rua das Flores, 10",
+            "postal_code": "4000-000",
+            "city": "Porto",
+            "country": "Portugal",
+        },
+        "items": items,
+        "subtotal": subtotal,
+        "tax_total": subtotal * 0.23,
+        "total": subtotal * 1.23,
+        "payment_method": "Transferência bancária",
+        "notes": None,
+    }
+
+
+def run(invoice_pdf, workers, documents):
+    """Renderiza todos os documentos com *workers* processos; devolve os segundos."""
+    # Cache vazia por medição; os processos do pool leem-na do ambiente ao arrancar
+    os.environ["INVOICE_PDF_CACHE_DIR"] = tempfile.mkdtemp()
+    pool = invoice_pdf.RenderPool(workers)
+    # Arrancar os processos antes de medir
+    wait([pool.submit(synthetic_document(10**6 + k), f"warmup{k}") for k in range(workers)])
+
+    window = workers * 4
+    pending = set()
+    start = time.perf_counter()
+    for document in documents:
+        pending.add(pool.submit(document, invoice_pdf.document_digest(document)))
+        if len(pending) >= window:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result()
+    for future in pending:
+        future.result()
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invoices", type=int, default=1000, help="Faturas a renderizar por medição")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from backend.app import invoice_pdf
+
+    documents = [synthetic_document(n) for n in range(args.invoices)]
+    counts = []
+    workers = 1
+    while workers < args.max_workers:
+        counts.append(workers)
+        workers *= 2
+    counts.append(args.max_workers)
+
+    baseline = None
+    for workers in counts:
+        elapsed = run(invoice_pdf, workers, documents)
+        rate = args.invoices / elapsed
+        baseline = baseline or rate
+        print(f"  {workers:>3} processos  {elapsed:>7.2f} s  {rate:>8.1f} faturas/s  x{rate / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
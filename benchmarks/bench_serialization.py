@@ -0,0 +1,92 @@
+"""
+Compara o caminho de serialização por omissão (ORM + from_attributes +
+jsonable_encoder + json) com o caminho rápido (linhas + TypeAdapter + orjson)
+usado pelos endpoints de listagem com ?fast=true.
+
+Não precisa de base de dados: as linhas são geradas em memória.
+
+Uso:
+    python benchmarks/bench_serialization.py [n_linhas]
+"""
+import json
+import os
+import sys
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app import schemas
+from app.serialization import MACHINE_ROWS
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+REPEAT = 5
+
+
+def make_rows(n):
+    types = list(schemas.MachineTypeEnum)
+    start = date(2020, 1, 1)
+    return [
+        {
+            "id": i,
+            "name": f"Máquina {i}",
+            "type": types[i % len(types)].value,
+            "company_id": i % 50 + 1,
+            "brand": "Volvo",
+            "model": "FH16",
+            "year": 2015 + i % 10,
+            "serial_number": f"SN{i:08d}",
+            "purchase_date": start + timedelta(days=i % 1000),
+            "license_plate": f"AA-{i % 100:02d}-BB",
+            "vehicle_identification_number": None,
+            "location": "Lisboa",
+            "installation_date": None,
+        }
+        for i in range(n)
+    ]
+
+
+def default_path(objects):
+    adapter = TypeAdapter(List[schemas.Machine])
+    models = adapter.validate_python(objects, from_attributes=True)
+    return json.dumps(jsonable_encoder(models)).encode("utf-8")
+
+
+def fast_path(rows):
+    return orjson.dumps(MACHINE_ROWS.validate_python(rows))
+
+
+def best_of(fn, arg):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        body = fn(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    rows = make_rows(ROWS)
+    objects = [SimpleNamespace(**row) for row in rows]
+
+    default_time, default_body = best_of(default_path, objects)
+    fast_time, fast_body = best_of(fast_path, rows)
+
+    # Os dois caminhos têm de produzir o mesmo conteúdo
+    assert json.loads(default_body) == json.loads(fast_body), "payloads differ"
+    assert json.loads(fast_body)[1]["type"] == rows[1]["type"]
+
+    print(f"{ROWS} linhas, melhor de {REPEAT}")
+    print(f"  default: {default_time * 1000:8.1f} ms  ({len(default_body)} bytes)")
+    print(f"  fast:    {fast_time * 1000:8.1f} ms  ({len(fast_body)} bytes)")
+    print(f"  speedup: {default_time / fast_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
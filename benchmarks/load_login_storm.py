@@ -0,0 +1,105 @@
+"""
+Teste de carga: latência de endpoints que não são de autenticação durante uma
+tempestade de logins.
+
+Mede a latência (p50/p99) de um GET leve, primeiro em repouso e depois
+enquanto várias threads fazem logins em ciclo contra /auth/login. Com o
+bcrypt no pool de processos (hashing.py) o p99 do GET deve manter-se; os
+logins em excesso recebem 503 (com Retry-After, que as threads respeitam) em
+vez de ocuparem o threadpool.
+
+    python benchmarks/load_login_storm.py --url http://localhost:8000 \\
+        --username gestor --password segredo --path machines
+
+O GET usa um token obtido com um login inicial do mesmo utilizador.
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def probe(url, headers, seconds, interval):
+    """GETs sequenciais durante *seconds*; devolve as latências em segundos."""
+    session = requests.Session()
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+        time.sleep(interval)
+    return timings
+
+
+def report(label, timings):
+    print(
+        f"  {label:<18} {len(timings):>6} pedidos"
+        f"  p50 {percentile(timings, 0.50) * 1000:>8.1f} ms"
+        f"  p99 {percentile(timings, 0.99) * 1000:>8.1f} ms"
+        f"  max {max(timings) * 1000:>8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", required=True, help="URL base do backend")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--path", default="machines", help="GET medido (sem ser de autenticação)")
+    parser.add_argument("--logins", type=int, default=50, help="Threads a fazer login em simultâneo")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duração de cada fase")
+    parser.add_argument("--interval", type=float, default=0.02, help="Pausa entre GETs (s)")
+    args = parser.parse_args()
+
+    base = args.url.rstrip("/")
+    credentials = {"username": args.username, "password": args.password}
+    login = requests.post(f"{base}/auth/login", data=credentials, timeout=60)
+    login.raise_for_status()
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    url = f"{base}/{args.path.lstrip('/')}"
+
+    print(f"GET {url}")
+    report("em repouso", probe(url, headers, args.seconds, args.interval))
+
+    stop = threading.Event()
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def storm(_):
+        session = requests.Session()
+        while not stop.is_set():
+            response = session.post(f"{base}/auth/login", data=credentials, timeout=60)
+            with lock:
+                statuses[response.status_code] += 1
+            if response.status_code == 503:
+                # Como um cliente bem comportado: esperar o Retry-After
+                stop.wait(float(response.headers.get("Retry-After", "1")))
+
+    with ThreadPoolExecutor(args.logins) as pool:
+        for i in range(args.logins):
+            pool.submit(storm, i)
+        try:
+            timings = probe(url, headers, args.seconds, args.interval)
+        finally:
+            stop.set()
+
+    report(f"{args.logins} logins conc.", timings)
+    total = sum(statuses.values())
+    print(
+        f"  logins: {total} em {args.seconds:.0f} s ({total / args.seconds:.1f}/s); "
+        + ", ".join(f"{code}: {count}" for code, count in sorted(statuses.items()))
+    )
+
+
+if __name__ == "__main__":
+    main()
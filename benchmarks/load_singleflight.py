@@ -0,0 +1,125 @@
+"""
+Teste de carga do single-flight: N pedidos idênticos e concorrentes devem
+executar uma só consulta à base de dados, qualquer que seja N.
+
+Modo local (por omissão): simula a consulta com uma espera e conta quantas
+vezes é executada, com e sem coalescência.
+
+    python benchmarks/load_singleflight.py
+
+Modo servidor: dispara ondas de pedidos concorrentes contra um backend em
+execução e lê /metrics/singleflight (token de admin) antes e depois de cada
+onda; "executed" conta as consultas feitas à base de dados.
+
+    python benchmarks/load_singleflight.py --url http://localhost:8000 \\
+        --token <token gestor> --admin-token <token admin> \\
+        --path maintenances/company/1
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+LEVELS = (1, 10, 25, 50, 100, 200)
+QUERY_SECONDS = 0.05
+
+
+def run_local(levels):
+    from app.singleflight import SingleFlight
+
+    print(f"Consulta simulada de {QUERY_SECONDS * 1000:.0f} ms")
+    print(f"{'concorrência':>12} {'sem coalescência':>18} {'com coalescência':>18} {'tempo (ms)':>11}")
+    for n in levels:
+        counts = {"plain": 0, "coalesced": 0}
+        lock = threading.Lock()
+
+        def query(kind):
+            with lock:
+                counts[kind] += 1
+            time.sleep(QUERY_SECONDS)
+            return b"[]"
+
+        group = SingleFlight()
+        barrier = threading.Barrier(n)
+
+        def plain(_):
+            barrier.wait()
+            return query("plain")
+
+        def coalesced(_):
+            barrier.wait()
+            return group.do("maintenances/company/1|1|fleet_manager", lambda: query("coalesced"))
+
+        with ThreadPoolExecutor(n) as pool:
+            list(pool.map(plain, range(n)))
+        barrier.reset()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(n) as pool:
+            results = list(pool.map(coalesced, range(n)))
+        elapsed = time.perf_counter() - start
+
+        assert all(result == b"[]" for result in results)
+        print(f"{n:>12} {counts['plain']:>18} {counts['coalesced']:>18} {elapsed * 1000:>11.1f}")
+
+
+def run_server(args, levels):
+    import requests
+
+    session = requests.Session()
+    headers = {"Authorization": f"Bearer {args.token}"}
+    admin_headers = {"Authorization": f"Bearer {args.admin_token}"}
+    url = f"{args.url.rstrip('/')}/{args.path.lstrip('/')}"
+
+    def executed():
+        response = session.get(f"{args.url.rstrip('/')}/metrics/singleflight", headers=admin_headers, timeout=10)
+        response.raise_for_status()
+        return response.json()["executed"]
+
+    print(f"GET {url}")
+    print(f"{'concorrência':>12} {'consultas BD':>13} {'erros':>6} {'p50 (ms)':>9} {'max (ms)':>9}")
+    for n in levels:
+        barrier = threading.Barrier(n)
+
+        def fire(_):
+            barrier.wait()
+            start = time.perf_counter()
+            response = requests.get(url, headers=headers, timeout=60)
+            return response.status_code, time.perf_counter() - start
+
+        before = executed()
+        with ThreadPoolExecutor(n) as pool:
+            results = list(pool.map(fire, range(n)))
+        queries = executed() - before
+
+        timings = sorted(elapsed for _, elapsed in results)
+        errors = sum(1 for code, _ in results if code != 200)
+        print(
+            f"{n:>12} {queries:>13} {errors:>6} "
+            f"{timings[len(timings) // 2] * 1000:>9.1f} {timings[-1] * 1000:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL base do backend (modo servidor)")
+    parser.add_argument("--token", help="Token do utilizador que faz os pedidos")
+    parser.add_argument("--admin-token", help="Token de admin para ler /metrics/singleflight")
+    parser.add_argument("--path", default="maintenances/company/1")
+    parser.add_argument("--levels", default=",".join(map(str, LEVELS)))
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    if args.url:
+        if not (args.token and args.admin_token):
+            parser.error("--url requer --token e --admin-token")
+        run_server(args, levels)
+    else:
+        run_local(levels)
+
+
+if __name__ == "__main__":
+    main()
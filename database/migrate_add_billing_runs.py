@@ -0,0 +1,92 @@
+# database/migrate_add_billing_runs.py
+import psycopg2
+import os
+from dotenv import load_dotenv
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Obter URL de conexão do ambiente
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Planos de faturação recorrente e execuções de faturação em lote; as faturas
+# geradas guardam a execução (billing_run_id), uma por empresa e execução
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS billing_plans (
+        id SERIAL PRIMARY KEY,
+        company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+        service_id INTEGER NOT NULL REFERENCES services(id),
+        machine_id INTEGER REFERENCES machines(id) ON DELETE CASCADE,
+        quantity DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+        unit_price DOUBLE PRECISION,
+        tax_rate DOUBLE PRECISION,
+        description VARCHAR,
+        interval_months INTEGER NOT NULL DEFAULT 1,
+        start_date DATE NOT NULL,
+        end_date DATE,
+        is_active BOOLEAN DEFAULT TRUE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_billing_plans_company_id ON billing_plans (company_id)",
+    "CREATE INDEX IF NOT EXISTS ix_billing_plans_machine_id ON billing_plans (machine_id)",
+    """
+    CREATE TABLE IF NOT EXISTS billing_runs (
+        id SERIAL PRIMARY KEY,
+        period DATE NOT NULL UNIQUE,
+        issue_date DATE NOT NULL,
+        due_date DATE NOT NULL,
+        invoice_status VARCHAR(8) NOT NULL,
+        status VARCHAR(9) NOT NULL,
+        last_company_id INTEGER NOT NULL DEFAULT 0,
+        invoices_created INTEGER NOT NULL DEFAULT 0,
+        error VARCHAR,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP
+    )
+    """,
+    "ALTER TABLE invoices ADD COLUMN IF NOT EXISTS billing_run_id INTEGER REFERENCES billing_runs(id)",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_invoices_billing_run_company
+        ON invoices (billing_run_id, company_id)
+    """,
+]
+
+def add_billing_runs():
+    """
+    Cria as tabelas billing_plans e billing_runs e a coluna billing_run_id em invoices
+    """
+    logger.info("Iniciando migração para adicionar a faturação recorrente...")
+    conn = None
+    cursor = None
+
+    try:
+        # Conectar à base de dados
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        for statement in STATEMENTS:
+            cursor.execute(statement)
+
+        conn.commit()
+        logger.info("Faturação recorrente adicionada com sucesso!")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    add_billing_runs()
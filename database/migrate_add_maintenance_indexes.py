@@ -0,0 +1,56 @@
+# database/migrate_add_maintenance_indexes.py
+import psycopg2
+import os
+from dotenv import load_dotenv
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Obter URL de conexão do ambiente
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Índices usados pelos filtros status/from/to dos endpoints de manutenções
+INDEXES = {
+    "ix_maintenances_completed_scheduled_date": "maintenances (completed, scheduled_date)",
+    "ix_maintenances_scheduled_date": "maintenances (scheduled_date)",
+    "ix_maintenances_machine_id": "maintenances (machine_id)",
+}
+
+def add_maintenance_indexes():
+    """
+    Cria os índices da tabela maintenances usados na classificação por estado
+    """
+    logger.info("Iniciando migração para adicionar índices à tabela maintenances...")
+    conn = None
+    cursor = None
+
+    try:
+        # Conectar à base de dados
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        for index_name, definition in INDEXES.items():
+            logger.info(f"Criando índice '{index_name}' (se não existir)...")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+
+        conn.commit()
+        logger.info("Índices da tabela 'maintenances' criados com sucesso!")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    add_maintenance_indexes()
@@ -0,0 +1,76 @@
+# database/migrate_add_maintenance_rules.py
+import psycopg2
+import os
+from dotenv import load_dotenv
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Obter URL de conexão do ambiente
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Regras de manutenção recorrente; as ocorrências só são gravadas em
+# maintenances quando concluídas ou editadas (rule_id + occurrence_date)
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS maintenance_rules (
+        id SERIAL PRIMARY KEY,
+        machine_id INTEGER NOT NULL REFERENCES machines(id) ON DELETE CASCADE,
+        type VARCHAR NOT NULL,
+        interval_days INTEGER,
+        interval_months INTEGER,
+        anchor_date DATE NOT NULL,
+        end_date DATE,
+        notes VARCHAR,
+        created_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_maintenance_rules_machine_id ON maintenance_rules (machine_id)",
+    """
+    ALTER TABLE maintenances
+        ADD COLUMN IF NOT EXISTS rule_id INTEGER REFERENCES maintenance_rules(id) ON DELETE SET NULL,
+        ADD COLUMN IF NOT EXISTS occurrence_date DATE
+    """,
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_maintenances_rule_occurrence
+        ON maintenances (rule_id, occurrence_date)
+    """,
+]
+
+def add_maintenance_rules():
+    """
+    Cria a tabela maintenance_rules e as colunas de ocorrência em maintenances
+    """
+    logger.info("Iniciando migração para adicionar regras de manutenção recorrente...")
+    conn = None
+    cursor = None
+
+    try:
+        # Conectar à base de dados
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        for statement in STATEMENTS:
+            cursor.execute(statement)
+
+        conn.commit()
+        logger.info("Regras de manutenção recorrente adicionadas com sucesso!")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    add_maintenance_rules()
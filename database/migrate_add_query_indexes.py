@@ -0,0 +1,64 @@
+# database/migrate_add_query_indexes.py
+import psycopg2
+import os
+from dotenv import load_dotenv
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Obter URL de conexão do ambiente
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Índices das colunas filtráveis/ordenáveis nos endpoints de listagem
+INDEXES = {
+    "ix_machines_name": "machines (name)",
+    "ix_machines_type": "machines (type)",
+    "ix_machines_company_id": "machines (company_id)",
+    "ix_machines_purchase_date": "machines (purchase_date)",
+    "ix_invoices_company_id": "invoices (company_id)",
+    "ix_invoices_issue_date": "invoices (issue_date)",
+    "ix_invoices_due_date": "invoices (due_date)",
+    "ix_invoices_status": "invoices (status)",
+    "ix_invoices_status_due_date": "invoices (status, due_date)",
+    "ix_users_role": "users (role)",
+    "ix_users_company_id": "users (company_id)",
+}
+
+def add_query_indexes():
+    """
+    Cria os índices usados pela gramática de filtros/ordenação das listagens
+    """
+    logger.info("Iniciando migração para adicionar índices de filtragem...")
+    conn = None
+    cursor = None
+
+    try:
+        # Conectar à base de dados
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        for index_name, definition in INDEXES.items():
+            logger.info(f"Criando índice '{index_name}' (se não existir)...")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+
+        conn.commit()
+        logger.info("Índices de filtragem criados com sucesso!")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    add_query_indexes()
@@ -0,0 +1,61 @@
+# database/migrate_add_search_indexes.py
+import psycopg2
+import os
+from dotenv import load_dotenv
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+# Obter URL de conexão do ambiente
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Índices GIN de trigramas usados pelo endpoint /search (extensão pg_trgm)
+INDEXES = {
+    "ix_machines_name_trgm": "machines USING gin (name gin_trgm_ops)",
+    "ix_machines_license_plate_trgm": "machines USING gin (license_plate gin_trgm_ops)",
+    "ix_machines_vin_trgm": "machines USING gin (vehicle_identification_number gin_trgm_ops)",
+    "ix_machines_serial_number_trgm": "machines USING gin (serial_number gin_trgm_ops)",
+    "ix_companies_name_trgm": "companies USING gin (name gin_trgm_ops)",
+}
+
+def add_search_indexes():
+    """
+    Ativa a extensão pg_trgm e cria os índices de pesquisa aproximada
+    """
+    logger.info("Iniciando migração para adicionar índices de pesquisa (pg_trgm)...")
+    conn = None
+    cursor = None
+
+    try:
+        # Conectar à base de dados
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        logger.info("Ativando a extensão 'pg_trgm' (se não existir)...")
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+        for index_name, definition in INDEXES.items():
+            logger.info(f"Criando índice '{index_name}' (se não existir)...")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+
+        conn.commit()
+        logger.info("Índices de pesquisa criados com sucesso!")
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Erro durante a migração: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+if __name__ == "__main__":
+    add_search_indexes()
@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 import requests
 
 # Import custom modules
-from utils.auth import login_user, is_admin
+from utils.auth import login_user, logout_user, is_admin
 from utils.image import get_image_base64
 from utils.api import get_api_data
 from pages import (
@@ -691,7 +691,7 @@ def sidebar_user_info() -> None:
         key="logout_btn",
         icon=f":material/{ICONS['logout']}:",
     ):
-        st.session_state.clear()
+        logout_user()
         st.rerun()
 
 
@@ -1,22 +1,14 @@
 import streamlit as st
 import pandas as pd
-import io
-import base64
 from datetime import datetime, timedelta
 import plotly.express as px
 import requests
-from frontend.utils.api import get_api_data, post_api_data, put_api_data, delete_api_data
+from frontend.utils.api import get_api_data, get_api_data_many, get_api_file, post_api_data, put_api_data, delete_api_data, public_api_url
 from frontend.utils.auth import is_admin
 from utils.ui import show_delete_button
 import os
 from dotenv import load_dotenv
 import json
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import cm
-from reportlab.pdfgen import canvas
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -39,128 +31,6 @@ INVOICE_STATUS_COLORS = {
     "canceled": "orange"
 }
 
-def generate_invoice_pdf(invoice_data):
-    """Gera um PDF da fatura"""
-    buffer = io.BytesIO()
-    
-    # Criar o documento PDF
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=72,
-        leftMargin=72,
-        topMargin=72,
-        bottomMargin=72
-    )
-    
-    # Estilos para o PDF
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name='Center', alignment=1))
-    styles.add(ParagraphStyle(name='Right', alignment=2))
-    
-    # Lista para armazenar o conteúdo do PDF
-    elements = []
-    
-    # Título da fatura
-    elements.append(Paragraph(f"FATURA Nº {invoice_data['invoice_number']}", styles['Heading1']))
-    elements.append(Spacer(1, 12))
-    
-    # Data de emissão e vencimento
-    date_info = [
-        ["Data de emissão:", invoice_data['issue_date']],
-        ["Data de vencimento:", invoice_data['due_date']]
-    ]
-    date_table = Table(date_info, colWidths=[120, 120])
-    date_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-    ]))
-    elements.append(date_table)
-    elements.append(Spacer(1, 20))
-    
-    # Informações da empresa
-    company = invoice_data.get('company', {})
-    company_data = [
-        ["Empresa:", company.get('name', '')],
-        ["NIF:", company.get('tax_id', '')],
-        ["Morada:", company.get('address', '')],
-        ["Código Postal:", company.get('postal_code', '')],
-        ["Cidade:", company.get('city', '')],
-        ["País:", company.get('country', '')],
-    ]
-    
-    company_table = Table(company_data, colWidths=[120, 300])
-    company_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-    ]))
-    elements.append(company_table)
-    elements.append(Spacer(1, 20))
-    
-    # Itens da fatura
-    items = invoice_data.get('items', [])
-    item_data = [['Descrição', 'Qtd', 'Preço Unit.', 'IVA %', 'Total']]
-    
-    for item in items:
-        item_row = [
-            item.get('description', ''),
-            f"{item.get('quantity', 0):.2f}",
-            f"{item.get('unit_price', 0):.2f} €",
-            f"{item.get('tax_rate', 0):.0f}%",
-            f"{item.get('total', 0):.2f} €"
-        ]
-        item_data.append(item_row)
-    
-    # Adicionar totais
-    item_data.append(['', '', '', 'Subtotal:', f"{invoice_data.get('subtotal', 0):.2f} €"])
-    item_data.append(['', '', '', 'IVA Total:', f"{invoice_data.get('tax_total', 0):.2f} €"])
-    item_data.append(['', '', '', 'TOTAL:', f"{invoice_data.get('total', 0):.2f} €"])
-    
-    item_table = Table(item_data, colWidths=[200, 50, 80, 80, 80])
-    item_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('INNERGRID', (0, 0), (-1, -4), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -4), 0.25, colors.black),
-        ('LINEABOVE', (3, -3), (-1, -3), 1, colors.black),
-        ('LINEABOVE', (3, -1), (-1, -1), 2, colors.black),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTNAME', (3, -3), (3, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (-1, -1), (-1, -1), 'Helvetica-Bold'),
-    ]))
-    elements.append(item_table)
-    elements.append(Spacer(1, 20))
-    
-    # Informações de pagamento
-    if invoice_data.get('payment_method'):
-        elements.append(Paragraph(f"Método de Pagamento: {invoice_data['payment_method']}", styles['Normal']))
-    
-    if invoice_data.get('notes'):
-        elements.append(Spacer(1, 10))
-        elements.append(Paragraph("Notas:", styles['Normal']))
-        elements.append(Paragraph(invoice_data['notes'], styles['Normal']))
-    
-    # Construir o PDF
-    doc.build(elements)
-    
-    # Obter o conteúdo do buffer
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_bytes
-
-def get_download_link(pdf_bytes, filename):
-    """Cria um link para download do PDF"""
-    b64 = base64.b64encode(pdf_bytes).decode()
-    href = f'<a href="data:application/pdf;base64,{b64}" download="{filename}">Baixar PDF</a>'
-    return href
-
 def show_billing():
     st.title("Gestão de Faturação")
     
@@ -176,13 +46,23 @@ def show_billing():
         st.session_state.new_item_machine_id = None
         st.session_state.new_item_description = ""
     
+    # Dados das três tabs que não dependem de filtros, em paralelo
+    page_data, _ = get_api_data_many({
+        "companies": "companies?fields=id,name",
+        "active_services": "billing/services?active_only=true",
+        "services": "billing/services",
+        # Faturas para relatório (sem itens; nome da empresa embebido)
+        "report_invoices": "billing/invoices?fields=id,invoice_number,company_id,issue_date,due_date,status,total,payment_date"
+                           "&embed=company",
+    })
+    
     # Criar tabs para organizar o módulo
     tab1, tab2, tab3 = st.tabs(["Faturas", "Serviços", "Relatórios"])
     
     # TAB 1: FATURAS
     with tab1:
-        # Buscar empresas para o dropdown
-        companies = get_api_data("companies") or []
+        # Empresas para o dropdown
+        companies = page_data["companies"] or []
         
         # Seção para criar nova fatura
         with st.expander("Criar Nova Fatura", expanded=False):
@@ -206,7 +86,7 @@ def show_billing():
                 selected_company_id = company_options[selected_company_idx]
                 
                 # Buscar máquinas da empresa selecionada
-                machines = get_api_data(f"machines/company/{selected_company_id}") or []
+                machines = get_api_data(f"machines/company/{selected_company_id}?fields=id,name") or []
                 
                 # Datas da fatura
                 col1, col2 = st.columns(2)
@@ -305,7 +185,7 @@ def show_billing():
                             st.rerun()
             
             # Formulário para adicionar item (separado do formulário principal)
-            services = get_api_data("billing/services?active_only=true") or []
+            services = page_data["active_services"] or []
             if services:
                 st.subheader("Adicionar Item à Fatura")
                 with st.form("add_item_form"):
@@ -423,62 +303,50 @@ def show_billing():
             with col2:
                 end_date = st.date_input("Data Final", value=datetime.now().date())
         
-        # Buscar as faturas
-        invoices = get_api_data("billing/invoices") or []
+        # Buscar as faturas já filtradas e ordenadas pelo servidor
+        status_map = {
+            "Rascunho": "draft",
+            "Enviada": "sent",
+            "Paga": "paid",
+            "Vencida": "overdue",
+            "Cancelada": "canceled"
+        }
+        invoice_params = ["sort=-issue_date"]
+        if status_filter != "Todos":
+            invoice_params.append(f"status={status_map[status_filter]}")
+        
+        # Filtro de data
+        today = datetime.now().date()
+        if date_range == "Este mês":
+            month_start = datetime(today.year, today.month, 1).date()
+            invoice_params.append(f"issue_date__gte={month_start.isoformat()}")
+        elif date_range == "Último mês":
+            last_month = today.month - 1 if today.month > 1 else 12
+            last_month_year = today.year if today.month > 1 else today.year - 1
+            month_start = datetime(last_month_year, last_month, 1).date()
+            if last_month == 12:
+                month_end = datetime(last_month_year + 1, 1, 1).date() - timedelta(days=1)
+            else:
+                month_end = datetime(last_month_year, last_month + 1, 1).date() - timedelta(days=1)
+            invoice_params.append(f"issue_date__gte={month_start.isoformat()}")
+            invoice_params.append(f"issue_date__lte={month_end.isoformat()}")
+        elif date_range == "Este ano":
+            year_start = datetime(today.year, 1, 1).date()
+            invoice_params.append(f"issue_date__gte={year_start.isoformat()}")
+        elif date_range == "Personalizado":
+            invoice_params.append(f"issue_date__gte={start_date.isoformat()}")
+            invoice_params.append(f"issue_date__lte={end_date.isoformat()}")
+        
+        # Filtro de empresa (admin)
+        if is_admin() and company_filter != "Todas":
+            company_id = next((c["id"] for c in companies if c["name"] == company_filter), None)
+            if company_id:
+                invoice_params.append(f"company_id={company_id}")
+        
+        invoices = get_api_data(f"billing/invoices?{'&'.join(invoice_params)}") or []
         
-        # Aplicar filtros
         if invoices:
-            filtered_invoices = invoices.copy()
-            
-            # Filtro de status
-            if status_filter != "Todos":
-                status_map = {
-                    "Rascunho": "draft",
-                    "Enviada": "sent",
-                    "Paga": "paid",
-                    "Vencida": "overdue",
-                    "Cancelada": "canceled"
-                }
-                filtered_invoices = [inv for inv in filtered_invoices if inv["status"] == status_map.get(status_filter, "")]
-            
-            # Filtro de data
-            today = datetime.now().date()
-            if date_range == "Este mês":
-                month_start = datetime(today.year, today.month, 1).date()
-                filtered_invoices = [
-                    inv for inv in filtered_invoices 
-                    if datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() >= month_start
-                ]
-            elif date_range == "Último mês":
-                last_month = today.month - 1 if today.month > 1 else 12
-                last_month_year = today.year if today.month > 1 else today.year - 1
-                month_start = datetime(last_month_year, last_month, 1).date()
-                if last_month == 12:
-                    month_end = datetime(last_month_year + 1, 1, 1).date() - timedelta(days=1)
-                else:
-                    month_end = datetime(last_month_year, last_month + 1, 1).date() - timedelta(days=1)
-                
-                filtered_invoices = [
-                    inv for inv in filtered_invoices 
-                    if month_start <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= month_end
-                ]
-            elif date_range == "Este ano":
-                year_start = datetime(today.year, 1, 1).date()
-                filtered_invoices = [
-                    inv for inv in filtered_invoices 
-                    if datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() >= year_start
-                ]
-            elif date_range == "Personalizado":
-                filtered_invoices = [
-                    inv for inv in filtered_invoices 
-                    if start_date <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= end_date
-                ]
-            
-            # Filtro de empresa (admin)
-            if is_admin() and company_filter != "Todas":
-                company_id = next((c["id"] for c in companies if c["name"] == company_filter), None)
-                if company_id:
-                    filtered_invoices = [inv for inv in filtered_invoices if inv["company_id"] == company_id]
+            filtered_invoices = invoices
             
             # Exibir faturas filtradas
             if filtered_invoices:
@@ -487,13 +355,6 @@ def show_billing():
                     company = next((c for c in companies if c["id"] == inv["company_id"]), None)
                     inv["company_name"] = company["name"] if company else "Desconhecida"
                 
-                # Ordenar por data (mais recentes primeiro)
-                filtered_invoices = sorted(
-                    filtered_invoices,
-                    key=lambda x: datetime.strptime(x["issue_date"], "%Y-%m-%d"),
-                    reverse=True
-                )
-                
                 # Inicialização de estado para PDF e ações
                 if "current_pdf_invoice" not in st.session_state:
                     st.session_state.current_pdf_invoice = None
@@ -540,25 +401,23 @@ def show_billing():
                             # Usamos um formulário separado para cada ação de fatura
                             # Botão para gerar PDF
                             if st.button("Gerar PDF", key=f"pdf_btn_{invoice['id']}"):
-                                # Buscar detalhes da empresa para o PDF
-                                company = get_api_data(f"companies/{invoice['company_id']}")
-                                if company:
-                                    invoice['company'] = company
-                                
-                                pdf_bytes = generate_invoice_pdf(invoice)
-                                filename = f"fatura_{invoice['invoice_number']}.pdf"
-                                
-                                # Salvar o PDF na sessão
-                                st.session_state.invoice_actions[invoice_id]['pdf_bytes'] = pdf_bytes
-                                st.session_state.invoice_actions[invoice_id]['pdf_filename'] = filename
-                                st.session_state.invoice_actions[invoice_id]['show_pdf'] = True
-                                st.rerun()
+                                # Gerado (e guardado em cache) no backend
+                                pdf_bytes = get_api_file(f"billing/invoices/{invoice['id']}/pdf")
+                                if pdf_bytes:
+                                    st.session_state.invoice_actions[invoice_id]['pdf_bytes'] = pdf_bytes
+                                    st.session_state.invoice_actions[invoice_id]['pdf_filename'] = f"fatura_{invoice['invoice_number']}.pdf"
+                                    st.session_state.invoice_actions[invoice_id]['show_pdf'] = True
+                                    st.rerun()
                             
-                            # Mostrar link para download se o PDF foi gerado
+                            # Mostrar botão de download se o PDF foi obtido
                             if st.session_state.invoice_actions[invoice_id].get('show_pdf'):
-                                pdf_bytes = st.session_state.invoice_actions[invoice_id].get('pdf_bytes')
-                                filename = st.session_state.invoice_actions[invoice_id].get('pdf_filename')
-                                st.markdown(get_download_link(pdf_bytes, filename), unsafe_allow_html=True)
+                                st.download_button(
+                                    "Baixar PDF",
+                                    data=st.session_state.invoice_actions[invoice_id]['pdf_bytes'],
+                                    file_name=st.session_state.invoice_actions[invoice_id]['pdf_filename'],
+                                    mime="application/pdf",
+                                    key=f"pdf_download_{invoice['id']}"
+                                )
                             
                             # Ações conforme o status - Cada ação em seu próprio formulário
                             if invoice["status"] == "draft":
@@ -661,7 +520,7 @@ def show_billing():
                     st.rerun()
         
         # Lista de serviços existentes
-        services = get_api_data("billing/services") or []
+        services = page_data["services"] or []
         
         if services:
             st.subheader("Serviços Cadastrados")
@@ -777,7 +636,7 @@ def show_billing():
             )
         with col2:
             if is_admin():
-                companies = get_api_data("companies") or []
+                companies = page_data["companies"] or []
                 report_company_options = ["Todas"] + [c["name"] for c in companies]
                 report_company = st.selectbox(
                     "Empresa",
@@ -793,59 +652,41 @@ def show_billing():
             with col2:
                 report_end_date = st.date_input("Data Final", value=datetime.now().date())
         
-        # Buscar faturas para relatório
-        invoices = get_api_data("billing/invoices") or []
+        invoices = page_data["report_invoices"] or []
         
         if invoices:
-            # Filtrar por período
+            # Período do relatório (também usado na exportação)
             today = datetime.now().date()
             if report_period == "Este ano":
-                year_start = datetime(today.year, 1, 1).date()
-                filtered_invoices = [
-                    inv for inv in invoices 
-                    if datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() >= year_start
-                ]
+                report_from, report_to = datetime(today.year, 1, 1).date(), datetime(today.year, 12, 31).date()
             elif report_period == "Último ano":
-                last_year_start = datetime(today.year - 1, 1, 1).date()
-                last_year_end = datetime(today.year - 1, 12, 31).date()
-                filtered_invoices = [
-                    inv for inv in invoices 
-                    if last_year_start <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= last_year_end
-                ]
+                report_from, report_to = datetime(today.year - 1, 1, 1).date(), datetime(today.year - 1, 12, 31).date()
             elif report_period == "Este mês":
-                month_start = datetime(today.year, today.month, 1).date()
-                filtered_invoices = [
-                    inv for inv in invoices 
-                    if datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() >= month_start
-                ]
+                report_from = today.replace(day=1)
+                report_to = (report_from + timedelta(days=32)).replace(day=1) - timedelta(days=1)
             elif report_period == "Último mês":
-                last_month = today.month - 1 if today.month > 1 else 12
-                last_month_year = today.year if today.month > 1 else today.year - 1
-                month_start = datetime(last_month_year, last_month, 1).date()
-                if last_month == 12:
-                    month_end = datetime(last_month_year + 1, 1, 1).date() - timedelta(days=1)
-                else:
-                    month_end = datetime(last_month_year, last_month + 1, 1).date() - timedelta(days=1)
-                
-                filtered_invoices = [
-                    inv for inv in invoices 
-                    if month_start <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= month_end
-                ]
+                report_to = today.replace(day=1) - timedelta(days=1)
+                report_from = report_to.replace(day=1)
             elif report_period == "Personalizado":
-                filtered_invoices = [
-                    inv for inv in invoices 
-                    if report_start_date <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= report_end_date
-                ]
+                report_from, report_to = report_start_date, report_end_date
+            
+            # Filtrar por período
+            filtered_invoices = [
+                inv for inv in invoices 
+                if report_from <= datetime.strptime(inv["issue_date"], "%Y-%m-%d").date() <= report_to
+            ]
             
             # Filtrar por empresa se necessário
+            report_company_id = None
             if is_admin() and report_company != "Todas":
                 company_id = next((c["id"] for c in companies if c["name"] == report_company), None)
+                report_company_id = company_id
                 if company_id:
                     filtered_invoices = [inv for inv in filtered_invoices if inv["company_id"] == company_id]
             
             # Adicionar nomes de empresas
             for inv in filtered_invoices:
-                company = next((c for c in companies if c["id"] == inv["company_id"]), None)
+                company = inv.pop("company", None)
                 inv["company_name"] = company["name"] if company else "Desconhecida"
             
             # Métricas gerais
@@ -1004,139 +845,23 @@ def show_billing():
                 # Exibir tabela
                 st.dataframe(invoices_df[display_cols].rename(columns=dict(zip(display_cols, display_names))))
                 
-                # Exportação
+                # Exportação: gerada e enviada pelo backend, o browser descarrega diretamente
                 st.subheader("Exportar Dados")
                 
                 # Opções de exportação
                 export_format = st.radio("Formato de exportação:", ["CSV", "Excel", "PDF"])
+                export_ext = {"CSV": "csv", "Excel": "xlsx", "PDF": "pdf"}[export_format]
                 
                 if st.button("Exportar Relatório"):
-                    if export_format == "CSV":
-                        # Gerar CSV
-                        csv_data = invoices_df[display_cols].to_csv(index=False)
-                        
-                        # Link para download
-                        b64 = base64.b64encode(csv_data.encode()).decode()
-                        href = f'<a href="data:file/csv;base64,{b64}" download="relatorio_faturacao.csv">Baixar arquivo CSV</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                    
-                    elif export_format == "Excel":
-                        # Gerar Excel
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            invoices_df[display_cols].to_excel(writer, index=False, sheet_name='Faturas')
-                        
-                        # Link para download
-                        b64 = base64.b64encode(output.getvalue()).decode()
-                        href = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="relatorio_faturacao.xlsx">Baixar arquivo Excel</a>'
-                        st.markdown(href, unsafe_allow_html=True)
-                    
-                    elif export_format == "PDF":
-                        # PDF mais elaborado com relatório completo
-                        buffer = io.BytesIO()
-                        
-                        # Criar o documento PDF
-                        doc = SimpleDocTemplate(
-                            buffer,
-                            pagesize=A4,
-                            rightMargin=72,
-                            leftMargin=72,
-                            topMargin=72,
-                            bottomMargin=72
-                        )
-                        
-                        # Estilos para o PDF
-                        styles = getSampleStyleSheet()
-                        styles.add(ParagraphStyle(name='Center', alignment=1))
-                        
-                        # Lista para armazenar o conteúdo do PDF
-                        elements = []
-                        
-                        # Título do relatório
-                        title_text = "Relatório de Faturação"
-                        period_text = ""
-                        
-                        if report_period == "Este ano":
-                            period_text = f"Ano: {today.year}"
-                        elif report_period == "Último ano":
-                            period_text = f"Ano: {today.year - 1}"
-                        elif report_period == "Este mês":
-                            period_text = f"Mês: {today.strftime('%B/%Y')}"
-                        elif report_period == "Último mês":
-                            last_month_date = today.replace(day=1) - timedelta(days=1)
-                            period_text = f"Mês: {last_month_date.strftime('%B/%Y')}"
-                        elif report_period == "Personalizado":
-                            period_text = f"Período: {report_start_date.strftime('%d/%m/%Y')} a {report_end_date.strftime('%d/%m/%Y')}"
-                        
-                        elements.append(Paragraph(title_text, styles['Heading1']))
-                        elements.append(Paragraph(period_text, styles['Heading2']))
-                        elements.append(Spacer(1, 20))
-                        
-                        # Resumo financeiro
-                        elements.append(Paragraph("Resumo Financeiro", styles['Heading2']))
-                        
-                        financial_data = [
-                            ["Métrica", "Valor"],
-                            ["Total Faturado", f"{total_invoiced:.2f} €"],
-                            ["Total Pago", f"{total_paid:.2f} €"],
-                            ["Pendente", f"{total_pending:.2f} €"],
-                            ["Vencido", f"{total_overdue:.2f} €"],
-                            ["Nº Faturas", str(count_total)],
-                            ["Faturas Pagas", str(count_paid)],
-                            ["Faturas Pendentes", str(count_pending)],
-                            ["Faturas Vencidas", str(count_overdue)]
-                        ]
-                        
-                        financial_table = Table(financial_data, colWidths=[200, 100])
-                        financial_table.setStyle(TableStyle([
-                            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
-                            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-                            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ]))
-                        elements.append(financial_table)
-                        elements.append(Spacer(1, 20))
-                        
-                        # Lista detalhada de faturas
-                        elements.append(Paragraph("Detalhamento de Faturas", styles['Heading2']))
-                        
-                        # Dados da tabela de faturas
-                        invoice_data = [display_names]  # Cabeçalho
-                        
-                        # Adicionar linhas de faturas (limitado para não sobrecarregar o PDF)
-                        for _, row in invoices_df[display_cols].head(100).iterrows():
-                            invoice_data.append([str(val) for val in row.values])
-                        
-                        # Criar tabela de faturas
-                        invoice_table = Table(invoice_data, colWidths=[60, 80, 60, 60, 60, 60, 60])
-                        invoice_table.setStyle(TableStyle([
-                            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                            ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-                            ('ALIGN', (1, 1), (1, -1), 'LEFT'),
-                            ('ALIGN', (2, 1), (-1, -1), 'RIGHT'),
-                            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                            ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
-                            ('BOX', (0, 0), (-1, -1), 0.25, colors.black),
-                            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                        ]))
-                        elements.append(invoice_table)
-                        
-                        # Data do relatório
-                        elements.append(Spacer(1, 20))
-                        elements.append(Paragraph(f"Relatório gerado em: {datetime.now().strftime('%d/%m/%Y %H:%M')}", styles['Normal']))
-                        
-                        # Construir o PDF
-                        doc.build(elements)
-                        
-                        # Link para download
-                        pdf_bytes = buffer.getvalue()
-                        b64 = base64.b64encode(pdf_bytes).decode()
-                        href = f'<a href="data:application/pdf;base64,{b64}" download="relatorio_faturacao.pdf">Baixar Relatório PDF</a>'
+                    link_params = f"format={export_ext}&from={report_from}&to={report_to}"
+                    if report_company_id:
+                        link_params += f"&company_id={report_company_id}"
+                    # Sem cache: cada link traz um token novo, de curta duração
+                    link = get_api_data(f"billing/reports/export-link?{link_params}", ttl=0)
+                    if link:
+                        href = f'<a href="{public_api_url(link["url"])}" download="{link["filename"]}">Baixar {link["filename"]}</a>'
                         st.markdown(href, unsafe_allow_html=True)
+                        st.caption(f"O link expira em {link['expires_in'] // 60} minutos.")
             else:
                 st.info("Nenhuma fatura encontrada para o período selecionado.")
         else:
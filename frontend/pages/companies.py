@@ -2,14 +2,14 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
-import requests
 import re
+from urllib.parse import quote
 from frontend.utils.api import get_api_data
 from frontend.utils.auth import is_admin
 from utils.ui import display_menu, show_delete_button
-from utils.auth import login_user, logout_user, is_admin
+from utils.auth import login_user, logout_user, is_admin, ensure_fresh_token
 from utils.image import get_image_base64, save_company_logo
-from utils.api import get_api_data, post_api_data, put_api_data, delete_api_data
+from utils.api import get_api_data, post_api_data, put_api_data, delete_api_data, get_http_session, invalidate_after_write, API_TIMEOUT
 import os
 from dotenv import load_dotenv
 
@@ -37,6 +37,7 @@ def update_company_direct(company_id, update_data):
         st.write(f"- {key}: `{value}`")
     
     # Preparar a requisição com autenticação
+    ensure_fresh_token()
     headers = {
         "Authorization": f"Bearer {st.session_state['token']}",
         "Content-Type": "application/json"
@@ -48,7 +49,8 @@ def update_company_direct(company_id, update_data):
     
     try:
         # Fazer a requisição PUT para a API
-        response = requests.put(url, headers=headers, json=update_data)
+        response = get_http_session().put(url, headers=headers, json=update_data, timeout=API_TIMEOUT)
+        invalidate_after_write(f"companies/{company_id}")
         
         # Exibir informações da resposta
         st.write("### Resposta da API")
@@ -252,12 +254,15 @@ def render_edit_form(comp):
             # Modo de atualização normal
             try:
                 # Usar a API diretamente em vez da função put_api_data
+                ensure_fresh_token()
                 headers = {"Authorization": f"Bearer {st.session_state['token']}"}
-                response = requests.put(
+                response = get_http_session().put(
                     f"{API_URL}/companies/{comp['id']}",
                     headers=headers,
-                    json=update_data
+                    json=update_data,
+                    timeout=API_TIMEOUT
                 )
+                invalidate_after_write(f"companies/{comp['id']}")
                 
                 if response.status_code in [200, 201, 204]:
                     st.success("Empresa atualizada com sucesso!")
@@ -346,13 +351,19 @@ def show_companies():
             col1, col2 = st.columns([2, 1])
             with col1:
                 st.write(f"**Total de empresas:** {len(companies)}")
+            with col2:
+                st.text_input("🔍 Pesquisar empresa", key="company_filter")
             
             
-            # Aplicar filtro
+            # Aplicar filtro (pesquisa aproximada feita no servidor)
             filtered_companies = companies
-            if st.session_state.company_filter:
-                search_term = st.session_state.company_filter.lower()
-                filtered_companies = [c for c in companies if search_term in c['name'].lower()]
+            if len(st.session_state.company_filter) >= 2:
+                hits = get_api_data(f"search?kind=company&q={quote(st.session_state.company_filter)}") or []
+                hit_ids = [hit["id"] for hit in hits]
+                filtered_companies = sorted(
+                    (c for c in companies if c["id"] in hit_ids),
+                    key=lambda c: hit_ids.index(c["id"])
+                )
             
             if not filtered_companies:
                 st.info("Nenhuma empresa encontrada com o filtro aplicado.")
@@ -4,7 +4,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import calendar
-from frontend.utils.api import get_api_data
+from frontend.utils.api import get_api_data, get_api_data_many
 from frontend.utils.auth import is_admin
 import locale
 
@@ -14,6 +14,17 @@ except locale.Error:
     # Fall back silently if the locale is unavailable on the host system
     pass
 
+# Number of events listed per day in the calendar details
+CALENDAR_EVENTS_PER_DAY = 5
+
+# Display label and color for each backend maintenance status
+TIMELINE_STATUS = {
+    "completed": ("Concluída", "#4CAF50"),
+    "overdue": ("Atrasada", "#F44336"),
+    "upcoming": ("Próxima", "#FFC107"),
+    "scheduled": ("Agendada", "#2196F3"),
+}
+
 def show_dashboard():
     """Display the main fleet dashboard with metrics and advanced charts.
 
@@ -28,17 +39,27 @@ def show_dashboard():
     # ----------------------------------------------------------------------
     # Data fetching
     # ----------------------------------------------------------------------
+    # The independent calls run concurrently: the page waits for the slowest one
     if is_admin():
-        machines = get_api_data("machines") or []
-        maintenances = get_api_data("maintenances") or []
-        companies = get_api_data("companies") or []
+        data, _ = get_api_data_many({
+            "machines": "machines",
+            "maintenances": "maintenances",
+            "companies": "companies",
+        })
+        machines = data["machines"] or []
+        maintenances = data["maintenances"] or []
+        companies = data["companies"] or []
     else:
         company_id = st.session_state.get("company_id")
         if company_id:
-            machines = get_api_data(f"machines/company/{company_id}") or []
-            maintenances = get_api_data(f"maintenances/company/{company_id}") or []
-            company_data = get_api_data(f"companies/{company_id}")
-            companies = [company_data] if company_data else []
+            data, _ = get_api_data_many({
+                "machines": f"machines/company/{company_id}",
+                "maintenances": f"maintenances/company/{company_id}",
+                "company": f"companies/{company_id}",
+            })
+            machines = data["machines"] or []
+            maintenances = data["maintenances"] or []
+            companies = [data["company"]] if data["company"] else []
         else:
             machines, maintenances, companies = [], [], []
     
@@ -46,22 +67,20 @@ def show_dashboard():
     # Helpers and filters
     # ----------------------------------------------------------------------
     today = datetime.now().date()
-    next_week = today + timedelta(days=7)
-    next_month = today + timedelta(days=30)
 
     upcoming_maintenances: list[dict] = []
     completed_maintenances: list[dict] = []
     overdue_maintenances: list[dict] = []
 
+    # Status and days_delta are computed by the backend (see crud.filter_maintenances)
     for m in maintenances:
-        scheduled_date = datetime.strptime(m["scheduled_date"], "%Y-%m-%d").date()
-        if m.get("completed", False):
+        if m.get("status") == "completed":
             completed_maintenances.append(m)
-        elif scheduled_date < today:
-            m["days_overdue"] = (today - scheduled_date).days
+        elif m.get("status") == "overdue":
+            m["days_overdue"] = -m["days_delta"]
             overdue_maintenances.append(m)
-        elif today <= scheduled_date <= next_week:
-            m["days_remaining"] = (scheduled_date - today).days
+        elif m.get("status") == "upcoming":
+            m["days_remaining"] = m["days_delta"]
             upcoming_maintenances.append(m)
     
     # ----------------------------------------------------------------------
@@ -220,25 +239,18 @@ def show_dashboard():
 
         # MAINTENANCE CALENDAR ---------------------------------------------
         st.markdown("### Calendário de Manutenções (Próximos 30 Dias)")
-        calendar_events: list[dict] = []
-        for m in maintenances:
-            sched_date = datetime.strptime(m["scheduled_date"], "%Y-%m-%d").date()
-            if today <= sched_date <= next_month and not m.get("completed", False):
-                machine = next((mac for mac in machines if mac["id"] == m["machine_id"]), None)
-                if machine:
-                    m["machine_name"] = machine["name"]
-                    if is_admin():
-                        company = next((c for c in companies if c["id"] == machine["company_id"]), None)
-                        if company:
-                            m["company_name"] = company["name"]
-                calendar_events.append(m)
+        # One aggregated request: per-day pending counts plus the first events of each day
+        calendar_buckets = get_api_data(
+            f"maintenances/calendar?from={today.isoformat()}&to={(today + timedelta(days=29)).isoformat()}"
+            f"&granularity=day&status=pending&top={CALENDAR_EVENTS_PER_DAY}"
+        ) or []
 
-        if calendar_events:
+        if calendar_buckets:
             days = [(today + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(30)]
             weekdays = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
             events_per_day = {day: 0 for day in days}
-            for m in calendar_events:
-                events_per_day[m["scheduled_date"]] += 1
+            for bucket in calendar_buckets:
+                events_per_day[bucket["bucket"]] = bucket["count"]
 
             week_data: list[list[int]] = [0] * 7
             calendar_data: list[list[int]] = []
@@ -263,18 +275,17 @@ def show_dashboard():
             st.plotly_chart(fig, use_container_width=True)
 
             with st.expander("Ver Detalhes das Próximas Manutenções", expanded=True):
-                events_by_date: dict[str, list[dict]] = {}
-                for ev in calendar_events:
-                    events_by_date.setdefault(ev["scheduled_date"], []).append(ev)
-
-                for date_str in sorted(events_by_date.keys())[:10]:
-                    date_obj = datetime.strptime(date_str, "%Y-%m-%d").date()
+                for bucket in calendar_buckets[:10]:
+                    date_obj = datetime.strptime(bucket["bucket"], "%Y-%m-%d").date()
                     formatted_date = date_obj.strftime("%A, %d %B %Y")
                     st.markdown(f"**{formatted_date}**")
-                    for ev in events_by_date[date_str]:
-                        machine_nm = ev.get("machine_name", "")
-                        comp_info = f" - {ev.get('company_name', '')}" if is_admin() and ev.get("company_name") else ""
+                    for ev in bucket["events"]:
+                        machine_nm = ev.get("machine_name") or ""
+                        comp_info = f" - {ev['company_name']}" if is_admin() and ev.get("company_name") else ""
                         st.markdown(f"* {ev['type']} para **{machine_nm}**{comp_info}")
+                    remaining = bucket["count"] - len(bucket["events"])
+                    if remaining > 0:
+                        st.markdown(f"* ... e mais {remaining} manutenção(ões)")
                     st.markdown("---")
         else:
             st.info("Não existem eventos de manutenção agendados para os próximos 30 dias.")
@@ -352,19 +363,8 @@ def show_dashboard():
                 
                 scheduled_date = datetime.strptime(m["scheduled_date"], "%Y-%m-%d").date()
                 
-                # Determine status and color
-                if m.get("completed", False):
-                    status = "Concluída"
-                    color = "#4CAF50"
-                elif scheduled_date < today:
-                    status = "Atrasada"
-                    color = "#F44336"
-                elif today <= scheduled_date <= next_week:
-                    status = "Próxima"
-                    color = "#FFC107"
-                else:
-                    status = "Agendada"
-                    color = "#2196F3"
+                # Determine status and color from the server-computed status
+                status, color = TIMELINE_STATUS.get(m.get("status"), TIMELINE_STATUS["scheduled"])
                 
                 # Create entry for the timeline
                 entry = {
@@ -580,11 +580,10 @@ def show_dashboard():
                         maintenance_count += 1
                         
                         # Check if maintenance is overdue
-                        sched_date = datetime.strptime(m["scheduled_date"], "%Y-%m-%d").date()
-                        if sched_date < today and not m.get("completed", False):
+                        if m.get("status") == "overdue":
                             overdue_count += 1
                             # Deduct points for overdue maintenances
-                            days_overdue = (today - sched_date).days
+                            days_overdue = -m["days_delta"]
                             health_score -= min(40, days_overdue * 2)  # Cap at -40 points
                     
                     # Adjust score based on maintenance history
@@ -685,9 +684,9 @@ def show_dashboard():
                         if machine_id in machine_maint_history:
                             for m in machine_maint_history[machine_id]:
                                 total_maint += 1
-                                if m.get("completed", False):
+                                if m.get("status") == "completed":
                                     completed_maint += 1
-                                elif datetime.strptime(m["scheduled_date"], "%Y-%m-%d").date() < today:
+                                elif m.get("status") == "overdue":
                                     overdue_maint += 1
                         
                         # Create detail row
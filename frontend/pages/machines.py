@@ -13,6 +13,7 @@ import os
 from dotenv import load_dotenv
 import json
 import re
+from urllib.parse import quote
 
 def get_vehicle_info_by_plate(license_plate):
     """
@@ -59,7 +60,7 @@ def show_machines():
     
     # Fetch companies for the dropdown - admin sees all, fleet manager sees only their own
     if is_admin():
-        companies = get_api_data("companies") or []
+        companies = get_api_data("companies?fields=id,name") or []
     else:
         company_id = st.session_state.get("company_id")
         if company_id:
@@ -187,28 +188,40 @@ def show_machines():
     st.subheader("Máquinas Atuais:")
     
     # Fetch machines - admins see all, fleet managers see only their company's
+    # embed=company: o nome da empresa vem já na resposta
     if is_admin():
-        machines = get_api_data("machines") or []
+        machines = get_api_data("machines?embed=company") or []
     else:
         company_id = st.session_state.get("company_id")
         if company_id:
-            machines = get_api_data(f"machines/company/{company_id}") or []
+            machines = get_api_data(f"machines/company/{company_id}?embed=company") or []
         else:
             machines = []
     
-    if machines:
+    # Pesquisa por nome, matrícula, VIN ou número de série (feita no servidor)
+    machine_search = st.text_input(
+        "🔍 Pesquisar máquina",
+        placeholder="Nome, matrícula, VIN ou nº de série",
+        key="machine_search"
+    )
+    listed_machines = machines
+    if len(machine_search.strip()) >= 2:
+        hits = get_api_data(f"search?kind=machine&q={quote(machine_search.strip())}") or []
+        hit_ids = [hit["id"] for hit in hits]
+        listed_machines = sorted(
+            (m for m in machines if m["id"] in hit_ids),
+            key=lambda m: hit_ids.index(m["id"])
+        )
+    
+    if listed_machines:
         # Convert to a DataFrame
-        df_machines = pd.DataFrame(machines)
+        df_machines = pd.DataFrame(listed_machines)
         
         # Add the company name for readability
-        def get_company_name(cid):
-            for c in companies:
-                if c["id"] == cid:
-                    return c["name"]
-            return "Desconhecida"
-        
-        if "company_id" in df_machines.columns:
-            df_machines["company_name"] = df_machines["company_id"].apply(get_company_name)
+        if "company" in df_machines.columns:
+            df_machines["company_name"] = df_machines["company"].apply(
+                lambda c: c["name"] if isinstance(c, dict) else "Desconhecida"
+            )
         
         # Display machines in expandable sections
         for idx, machine in df_machines.iterrows():
@@ -260,7 +273,7 @@ def show_machines():
                         if maintenances:
                             st.write("**Manutenções Agendadas:**")
                             df_maint = pd.DataFrame(maintenances)
-                            st.dataframe(df_maint[["scheduled_date", "type", "completed"]])
+                            st.dataframe(df_maint[["scheduled_date", "type", "status", "days_delta"]])
                         else:
                             st.info(f"Não existem manutenções agendadas para {machine['name']}")
                 
@@ -441,17 +454,25 @@ def show_machines():
             else:
                 filter_company = "Todas"
         
-        # Aplicar filtros
-        filtered_machines = machines.copy()
+        # Aplicar filtros no servidor (ex.: machines?type=truck&company_id=3)
+        filter_params = []
         if filter_type == "Camiões":
-            filtered_machines = [m for m in filtered_machines if m["type"] == "truck"]
+            filter_params.append("type=truck")
         elif filter_type == "Máquinas Fixas":
-            filtered_machines = [m for m in filtered_machines if m["type"] == "fixed"]
+            filter_params.append("type=fixed")
         
         if filter_company != "Todas" and is_admin():
             company_id = next((c["id"] for c in companies if c["name"] == filter_company), None)
             if company_id:
-                filtered_machines = [m for m in filtered_machines if m["company_id"] == company_id]
+                filter_params.append(f"company_id={company_id}")
+        
+        if not filter_params:
+            filtered_machines = machines
+        elif is_admin():
+            filtered_machines = get_api_data(f"machines?{'&'.join(filter_params)}") or []
+        else:
+            company_id = st.session_state.get("company_id")
+            filtered_machines = get_api_data(f"machines/company/{company_id}?{'&'.join(filter_params)}") or []
         
         # Visualização
         if filtered_machines:
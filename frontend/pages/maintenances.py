@@ -8,29 +8,41 @@ from frontend.utils.auth import is_admin
 from utils.ui import display_menu, show_delete_button
 from utils.auth import login_user, logout_user, is_admin
 from utils.image import get_image_base64, save_company_logo
-from utils.api import get_api_data, post_api_data, put_api_data, delete_api_data
+from utils.api import get_api_data, get_api_data_many, post_api_data, put_api_data, delete_api_data
 import os
 from dotenv import load_dotenv
 
 def show_maintenances():
     st.title("Agendamento de Manutenções")
     
-    # Buscar dados com base no papel do usuário
+    # Buscar dados com base no papel do usuário, em paralelo
+    # Empresas e máquinas: apenas os campos usados nos dropdowns
+    # Manutenções: embed=machine,company, nomes da máquina e empresa vêm do servidor
     if is_admin():
-        companies = get_api_data("companies") or []
+        data, _ = get_api_data_many({
+            "companies": "companies?fields=id,name",
+            "machines": "machines?fields=id,name,type,company_id",
+            "maintenances": "maintenances?embed=machine,company",
+        })
+        companies = data["companies"] or []
         # Buscar todas as máquinas inicialmente
-        all_machines = get_api_data("machines") or []
+        all_machines = data["machines"] or []
+        maintenances = data["maintenances"] or []
     else:
         company_id = st.session_state.get("company_id")
         if company_id:
-            companies = [get_api_data(f"companies/{company_id}")] if get_api_data(f"companies/{company_id}") else []
-            all_machines = get_api_data(f"machines/company/{company_id}") or []
+            data, _ = get_api_data_many({
+                "company": f"companies/{company_id}",
+                "machines": f"machines/company/{company_id}?fields=id,name,type,company_id",
+                "maintenances": f"maintenances/company/{company_id}?embed=machine,company",
+            })
+            companies = [data["company"]] if data["company"] else []
+            all_machines = data["machines"] or []
+            maintenances = data["maintenances"] or []
         else:
             companies = []
             all_machines = []
-    
-    # Criar um dicionário para busca rápida de nomes de empresas
-    company_dict = {c["id"]: c["name"] for c in companies}
+            maintenances = []
     
     # Criar um formulário para agendar nova manutenção
     with st.form("new_maintenance"):
@@ -110,28 +122,16 @@ def show_maintenances():
     
     st.subheader("Manutenções Agendadas")
     
-    # Buscar manutenções com base no papel do usuário
-    if is_admin():
-        maintenances = get_api_data("maintenances") or []
-    else:
-        company_id = st.session_state.get("company_id")
-        if company_id:
-            maintenances = get_api_data(f"maintenances/company/{company_id}") or []
-        else:
-            maintenances = []
-    
     if maintenances:
-        # Adicionar nome da máquina para melhor exibição
+        # Achatar as relações embebidas para o DataFrame
         for m in maintenances:
-            machine = next((mac for mac in all_machines if mac["id"] == m["machine_id"]), None)
+            machine = m.pop("machine", None)
+            company = m.pop("company", None)
             if machine:
                 m["machine_name"] = machine["name"]
                 m["machine_type"] = machine["type"]
-                
-                # Adicionar nome da empresa
-                company_id = machine.get("company_id")
-                if company_id in company_dict:
-                    m["company_name"] = company_dict[company_id]
+            if company:
+                m["company_name"] = company["name"]
         
         # Converter para DataFrame para exibição
         df_maint = pd.DataFrame(maintenances)
@@ -156,9 +156,9 @@ def show_maintenances():
             
             if not pending.empty:
                 for idx, maint in pending.iterrows():
-                    # Determinar urgência para codificação de cores
+                    # Determinar urgência para codificação de cores (days_delta vem do backend)
                     date_val = maint["scheduled_date"].date() if "scheduled_date" in maint else today
-                    days_remaining = (date_val - today).days
+                    days_remaining = int(maint["days_delta"])
                     
                     if days_remaining <= 0:
                         status = "⚠️ Atrasada"
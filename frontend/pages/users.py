@@ -8,7 +8,7 @@ from frontend.utils.auth import is_admin
 from utils.ui import display_menu, show_delete_button
 from utils.auth import login_user, logout_user, is_admin
 from utils.image import get_image_base64, save_company_logo, get_company_logo_path
-from utils.api import get_api_data, post_api_data, put_api_data, delete_api_data
+from utils.api import get_api_data, get_api_data_many, post_api_data, put_api_data, delete_api_data
 import os
 from dotenv import load_dotenv
 import base64
@@ -58,8 +58,9 @@ def show_users():
         </style>
     """, unsafe_allow_html=True)
 
-    # Buscar todas as empresas para dropdown
-    companies = get_api_data("companies") or []
+    # Buscar empresas (para o dropdown) e utilizadores em paralelo
+    data, _ = get_api_data_many({"companies": "companies", "users": "auth/users"})
+    companies = data["companies"] or []
     
     # Criar um dicionário para armazenar os caminhos dos logos das empresas
     company_logos = {}
@@ -80,8 +81,7 @@ def show_users():
             if os.path.exists(full_path):
                 company_logos[company_id] = full_path
     
-    # Buscar todos os utilizadores
-    users = get_api_data("auth/users") or []
+    users = data["users"] or []
     
     # Adicionar nome da empresa para exibição
     if users:
@@ -1,40 +1,287 @@
 import streamlit as st
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
 import json
+import time
 load_dotenv()
 
 API_URL = os.getenv("API_URL")
+# URL da API vista pelo browser (links de download); por omissão a mesma
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", API_URL)
 
-def get_api_data(endpoint: str):
-    """Generic function to fetch data from the API using the stored auth token."""
+# (connect, read) em segundos: um backend lento dá erro em vez de bloquear a página
+API_TIMEOUT = (
+    float(os.getenv("API_CONNECT_TIMEOUT", "3.05")),
+    float(os.getenv("API_READ_TIMEOUT", "30")),
+)
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+API_RETRIES = int(os.getenv("API_RETRIES", "2"))
+# Pedidos simultâneos de get_api_data_many (todas as sessões); cabe no pool de ligações
+API_FETCH_WORKERS = int(os.getenv("API_FETCH_WORKERS", "8"))
+
+
+def public_api_url(endpoint: str) -> str:
+    """Absolute URL of an API endpoint for the browser (e.g. a signed download link)."""
+    return f"{PUBLIC_API_URL}/{endpoint}"
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """
+    HTTP session shared by all Streamlit sessions: keep-alive connections to
+    the API are reused instead of opening one per call.
+
+    Connection failures are retried for any method (nothing was sent); read
+    errors and 502/503/504 only for idempotent methods, honouring
+    Retry-After. Responses are requested gzip-compressed.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=API_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    # A sessão é de todos os utilizadores: nunca guardar cookies (a autenticação é por token)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+@st.cache_resource
+def _fetch_pool() -> ThreadPoolExecutor:
+    """Threads for the concurrent requests of `get_api_data_many`."""
+    return ThreadPoolExecutor(max_workers=API_FETCH_WORKERS, thread_name_prefix="api-fetch")
+
+
+def _send(method: str, endpoint: str, headers: dict = None, **kwargs) -> requests.Response:
+    """Sends an authenticated request; on a 401 renews the access token once and retries."""
+    # Import tardio: utils.auth importa este módulo
+    from .auth import ensure_fresh_token, refresh_access_token
+
+    ensure_fresh_token()
+    headers = dict(headers or {})
+    headers["Authorization"] = f"Bearer {st.session_state.get('token')}"
+    kwargs.setdefault("timeout", API_TIMEOUT)
+    session = get_http_session()
+    response = session.request(method, f"{API_URL}/{endpoint}", headers=headers, **kwargs)
+    if response.status_code == 401 and refresh_access_token():
+        headers["Authorization"] = f"Bearer {st.session_state['token']}"
+        response = session.request(method, f"{API_URL}/{endpoint}", headers=headers, **kwargs)
+    return response
+
+# Cache de leitura por sessão: dentro do TTL as páginas não fazem pedidos; depois
+# revalida-se com If-None-Match (304 sem corpo quando nada mudou)
+API_CACHE_TTL = float(os.getenv("API_CACHE_TTL", "30"))
+API_CACHE_MAX_ENTRIES = 200
+
+# Escritas num recurso também invalidam as leituras que embebem os seus dados
+# (nomes de empresas/máquinas, próximas manutenções, pesquisa)
+RELATED_PREFIXES = {
+    "companies": ("machines", "maintenances", "billing/invoices", "billing/plans", "search"),
+    "machines": ("companies", "maintenances", "billing/plans", "search"),
+    "maintenances": ("machines",),
+    "billing/services": ("billing/invoices", "billing/plans"),
+    "billing/runs": ("billing/invoices",),
+}
+
+
+def _identity() -> tuple:
+    """Who the current token stands for; cached reads are never shared between users."""
+    return (
+        st.session_state.get("user_id"),
+        st.session_state.get("role"),
+        st.session_state.get("company_id"),
+    )
+
+
+def _resource(endpoint: str) -> str:
+    """Resource an endpoint belongs to, e.g. 'billing/invoices/5/status' -> 'billing/invoices'."""
+    parts = endpoint.split("?", 1)[0].strip("/").split("/")
+    return "/".join(parts[:2]) if parts[0] in ("billing", "auth") else parts[0]
+
+
+def invalidate_api_cache(*prefixes: str) -> None:
+    """Drops the cached reads of endpoints under *prefixes* (all of them if none is given)."""
+    api_cache = st.session_state.get("api_cache")
+    if not api_cache:
+        return
+    for endpoint in list(api_cache):
+        path = endpoint.split("?", 1)[0].strip("/")
+        if not prefixes or any(path == prefix or path.startswith(prefix + "/") for prefix in prefixes):
+            del api_cache[endpoint]
+
+
+def invalidate_after_write(endpoint: str) -> None:
+    """Invalidates what a write to *endpoint* may have changed (for writes not made via this module)."""
+    resource = _resource(endpoint)
+    invalidate_api_cache(resource, *RELATED_PREFIXES.get(resource, ()))
+
+
+def _cache_lookup(endpoint: str, ttl: float):
+    """``(entry, fresh)``: this user's cached entry for *endpoint* and whether it is within *ttl*."""
+    cached = st.session_state.setdefault("api_cache", {}).get(endpoint)
+    if cached and cached["identity"] != _identity():
+        return None, False
+    return cached, bool(cached) and time.monotonic() - cached["fetched_at"] < ttl
+
+
+def _conditional_headers(cached) -> dict:
+    return {"If-None-Match": cached["etag"]} if cached and cached["etag"] else {}
+
+
+def _handle_response(endpoint: str, cached, response: requests.Response, ttl: float, what: str):
+    """``(body, error)`` of a GET response, updating the session cache."""
+    api_cache = st.session_state.setdefault("api_cache", {})
+    now = time.monotonic()
+    if response.status_code == 304 and cached:
+        cached["fetched_at"] = now
+        return cached["body"], None
+    if response.status_code == 200:
+        if ttl > 0 or response.headers.get("ETag"):
+            if endpoint not in api_cache and len(api_cache) >= API_CACHE_MAX_ENTRIES:
+                # Descartar a entrada mais antiga (ex.: muitas pesquisas diferentes)
+                del api_cache[min(api_cache, key=lambda key: api_cache[key]["fetched_at"])]
+            api_cache[endpoint] = {
+                "identity": _identity(),
+                "etag": response.headers.get("ETag"),
+                "body": response.content,
+                "fetched_at": now,
+            }
+        return response.content, None
+    if response.status_code == 401:
+        return None, "Session expired. Please log in again."
+    if response.status_code == 403:
+        return None, "You don't have permission to access this resource"
+    return None, f"Failed to fetch {what} from '{endpoint}'. Status code: {response.status_code}"
+
+
+def _cached_get(endpoint: str, ttl: float, what: str):
+    """Body (bytes) of a GET, from the session cache while fresh; None on errors."""
     if "token" not in st.session_state:
         return None
-    
-    headers = {"Authorization": f"Bearer {st.session_state['token']}"}
+
+    cached, fresh = _cache_lookup(endpoint, ttl)
+    if fresh:
+        return cached["body"]
     try:
-        response = requests.get(f"{API_URL}/{endpoint}", headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 403:
-            st.error("You don't have permission to access this resource")
-            return None
-        else:
-            st.error(f"Failed to fetch data from '{endpoint}'. Status code: {response.status_code}")
-            return None
+        response = _send("GET", endpoint, headers=_conditional_headers(cached))
     except Exception as e:
         st.error(f"Communication error with the API: {str(e)}")
         return None
+    body, error = _handle_response(endpoint, cached, response, ttl, what)
+    if error:
+        st.error(error)
+    return body
+
+def get_api_data(endpoint: str, ttl: float = API_CACHE_TTL):
+    """Generic function to fetch data from the API using the stored auth token.
+
+    Responses are kept per session and per user: for *ttl* seconds they are
+    served without a request (``ttl=0`` always asks the API), then
+    revalidated with If-None-Match when they carry an ETag, so unchanged
+    data comes back as an empty 304. Writes through this module invalidate
+    the related entries.
+    """
+    body = _cached_get(endpoint, ttl, "data")
+    # Guardamos o corpo e não o objeto: as páginas alteram os dados recebidos
+    return json.loads(body) if body is not None else None
+
+def get_api_file(endpoint: str, ttl: float = API_CACHE_TTL):
+    """Fetches a binary file (e.g. an invoice PDF) from the API; returns its bytes.
+
+    Cached and revalidated like `get_api_data`, so a file that did not
+    change is not downloaded again.
+    """
+    return _cached_get(endpoint, ttl, "file")
+
+def get_api_data_many(endpoints: dict, ttl: float = API_CACHE_TTL, show_errors: bool = True):
+    """Fetches several independent endpoints concurrently, e.g. the data of a page.
+
+    *endpoints* maps a name to an endpoint; returns ``(data, errors)``, both
+    keyed by those names: ``data`` holds the parsed JSON (None on error) and
+    ``errors`` the message of each failed call, also shown with st.error
+    unless *show_errors* is False. Cached entries are used as in
+    `get_api_data`; only the HTTP requests run in the pool threads, since
+    st.session_state is only available to the script thread.
+    """
+    data = {name: None for name in endpoints}
+    errors = {}
+    if "token" not in st.session_state:
+        return data, {name: "Not authenticated" for name in endpoints}
+
+    # Import tardio: utils.auth importa este módulo
+    from .auth import ensure_fresh_token, refresh_access_token
+
+    ensure_fresh_token()
+    auth = {"Authorization": f"Bearer {st.session_state.get('token')}"}
+    session = get_http_session()
+    pending = {}
+    for name, endpoint in endpoints.items():
+        cached, fresh = _cache_lookup(endpoint, ttl)
+        if fresh:
+            data[name] = json.loads(cached["body"])
+            continue
+        future = _fetch_pool().submit(
+            session.get, f"{API_URL}/{endpoint}",
+            headers={**auth, **_conditional_headers(cached)}, timeout=API_TIMEOUT
+        )
+        pending[name] = (endpoint, cached, future)
+
+    expired = []
+    for name, (endpoint, cached, future) in pending.items():
+        try:
+            response = future.result()
+        except Exception as e:
+            errors[name] = f"Communication error with the API: {str(e)}"
+            continue
+        if response.status_code == 401:
+            expired.append(name)
+            continue
+        body, errors[name] = _handle_response(endpoint, cached, response, ttl, "data")
+        if body is not None:
+            data[name] = json.loads(body)
+
+    # Token expirado: renovar uma vez (no thread do script) e repetir só esses pedidos
+    if expired and refresh_access_token():
+        for name in expired:
+            endpoint, cached = pending[name][:2]
+            try:
+                response = _send("GET", endpoint, headers=_conditional_headers(cached))
+            except Exception as e:
+                errors[name] = f"Communication error with the API: {str(e)}"
+                continue
+            body, errors[name] = _handle_response(endpoint, cached, response, ttl, "data")
+            if body is not None:
+                data[name] = json.loads(body)
+    else:
+        for name in expired:
+            errors[name] = "Session expired. Please log in again."
+
+    errors = {name: error for name, error in errors.items() if error}
+    if show_errors:
+        for error in dict.fromkeys(errors.values()):
+            st.error(error)
+    return data, errors
 
 def post_api_data(endpoint: str, data: dict):
     """Generic function to post JSON data to the API using the stored auth token."""
     if "token" not in st.session_state:
         return False
     
-    headers = {"Authorization": f"Bearer {st.session_state['token']}"}
     try:
-        response = requests.post(f"{API_URL}/{endpoint}", headers=headers, json=data)
+        response = _send("POST", endpoint, json=data)
+        invalidate_after_write(endpoint)
         if response.status_code in [200, 201]:
             # Se o endpoint for companies, retorne os dados da resposta
             if endpoint == "companies":
@@ -55,12 +302,9 @@ def put_api_data(endpoint: str, data: dict) -> bool:
         st.error("Não autenticado. Faça login novamente.")
         return False
     
-    headers = {"Authorization": f"Bearer {st.session_state['token']}"}
     try:
-        # Remove os prints de debug
-        full_url = f"{API_URL}/{endpoint}"
-        
-        response = requests.put(full_url, headers=headers, json=data)
+        response = _send("PUT", endpoint, json=data)
+        invalidate_after_write(endpoint)
         
         if response.status_code in [200, 201, 204]:
             return True
@@ -78,9 +322,9 @@ def delete_api_data(endpoint: str) -> bool:
     if "token" not in st.session_state:
         return False
     
-    headers = {"Authorization": f"Bearer {st.session_state['token']}"}
     try:
-        response = requests.delete(f"{API_URL}/{endpoint}", headers=headers)
+        response = _send("DELETE", endpoint)
+        invalidate_after_write(endpoint)
         if response.status_code in [200, 204]:
             return True
         else:
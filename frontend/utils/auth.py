@@ -1,20 +1,34 @@
 # -*- coding: utf-8 -*-
+import time
+
 import streamlit as st
 import requests
-from .api import get_api_data, API_URL
+from .api import get_api_data, get_http_session, API_URL, API_TIMEOUT
+
+# Renovar o access token um pouco antes de expirar
+REFRESH_MARGIN_SECONDS = 60
+
+
+def _store_tokens(data: dict) -> None:
+    """Keeps the access/refresh token pair returned by /auth/login or /auth/refresh."""
+    st.session_state["token"] = data["access_token"]
+    st.session_state["refresh_token"] = data.get("refresh_token")
+    expires_in = data.get("expires_in")
+    st.session_state["token_expires_at"] = time.time() + expires_in if expires_in else None
 
 
 def login_user(username: str, password: str) -> bool:
     """Attempts to log in the user with given credentials; returns True if successful."""
     try:
-        resp = requests.post(
+        resp = get_http_session().post(
             f"{API_URL}/auth/login", 
-            data={"username": username, "password": password}
+            data={"username": username, "password": password},
+            timeout=API_TIMEOUT
         )
         if resp.status_code == 200:
             data = resp.json()
             # Store user data in session state
-            st.session_state["token"] = data["access_token"]
+            _store_tokens(data)
             st.session_state["logged_in"] = True
             st.session_state["user_id"] = data["user_id"]
             st.session_state["username"] = data["username"]
@@ -33,6 +47,8 @@ def login_user(username: str, password: str) -> bool:
             st.error("Invalid credentials or connection error.")
     except requests.exceptions.ConnectionError:
         st.error("API connection error. Please check if the backend is running.")
+    except requests.exceptions.Timeout:
+        st.error("The API did not respond in time. Please try again.")
     except Exception as e:
         st.error(f"Login error: {str(e)}")
     return False
@@ -41,7 +57,49 @@ def is_admin():
     """Check if current user is an admin"""
     return st.session_state.get("role") == "admin"
 
+def refresh_access_token() -> bool:
+    """
+    Renews the access token with the stored refresh token (no password, no bcrypt
+    on the server). Returns False, and ends the session, if it was rejected
+    (401); other failures are temporary and keep the session.
+    """
+    refresh_token = st.session_state.get("refresh_token")
+    if not refresh_token:
+        return False
+    try:
+        resp = get_http_session().post(
+            f"{API_URL}/auth/refresh", json={"refresh_token": refresh_token}, timeout=API_TIMEOUT
+        )
+    except requests.exceptions.RequestException:
+        # Falha temporária: manter a sessão e tentar de novo no próximo pedido
+        return False
+    if resp.status_code == 401:
+        # Refresh token expirado ou revogado: é preciso voltar a fazer login
+        for key in ("token", "refresh_token", "token_expires_at"):
+            st.session_state.pop(key, None)
+        st.session_state["logged_in"] = False
+        return False
+    if resp.status_code != 200:
+        # Erro do servidor (5xx, 429...): manter a sessão e tentar de novo no próximo pedido
+        return False
+    _store_tokens(resp.json())
+    return True
+
+
+def ensure_fresh_token() -> None:
+    """Refreshes the access token ahead of time when it is about to expire."""
+    expires_at = st.session_state.get("token_expires_at")
+    if expires_at and time.time() > expires_at - REFRESH_MARGIN_SECONDS:
+        refresh_access_token()
+
+
 def logout_user():
-    """Logs out the user by clearing session state"""
+    """Logs out the user: revokes the refresh token and clears session state"""
+    refresh_token = st.session_state.get("refresh_token")
+    if refresh_token:
+        try:
+            get_http_session().post(f"{API_URL}/auth/logout", json={"refresh_token": refresh_token}, timeout=5)
+        except requests.exceptions.RequestException:
+            pass
     for key in list(st.session_state.keys()):
-        del st.session_state[key]
\ No newline at end of file
+        del st.session_state[key]